@@ -1,9 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.orm import Session
 from typing import List, Optional
+from datetime import datetime
+import time
 from app.core.database import get_db
-from app.models.risk_control import TickerHistory
-from app.schemas.risk_control import TickerHistoryInDB
+from app.models.risk_control import TickerHistory, TickerBar
+from app.schemas.risk_control import TickerHistoryInDB, LatestPrice, TickerBarInDB, TickStats
+from app.services.price_cache import price_cache
+from app.services.tick_store import historical_var, realized_volatility
+from app.services.exchange.rate_limit import rate_limit_snapshot
+from app.services.ticker_rollup import RESOLUTIONS
 
 router = APIRouter(prefix="/market", tags=["market"])
 
@@ -29,3 +35,103 @@ async def get_ticker_history(
         query = query.filter(TickerHistory.position_id == position_id)
 
     return query.order_by(TickerHistory.timestamp.desc()).limit(limit).all()
+
+
+@router.get('/ohlc', response_model=List[TickerBarInDB])
+async def get_ohlc(
+    symbol: str,
+    resolution: str = Query("1m", description="1m / 5m / 1h / 1d"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = Query(500, gt=0, le=5000),
+    db: Session = Depends(get_db),
+):
+    """Return OHLC bars for a symbol from the ticker_bars rollups, oldest first.
+
+    Without start/end the most recent `limit` bars are returned.
+    """
+    if resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"resolution must be one of {', '.join(RESOLUTIONS)}")
+
+    query = db.query(TickerBar).filter(
+        TickerBar.symbol == symbol.replace('/', '').upper(),
+        TickerBar.resolution == resolution,
+    )
+    if start:
+        query = query.filter(TickerBar.bucket_start >= start)
+    if end:
+        query = query.filter(TickerBar.bucket_start < end)
+
+    if start:
+        return query.order_by(TickerBar.bucket_start.asc()).limit(limit).all()
+    bars = query.order_by(TickerBar.bucket_start.desc()).limit(limit).all()
+    return list(reversed(bars))
+
+
+@router.get('/prices', response_model=List[LatestPrice])
+async def get_latest_prices(
+    symbols: Optional[str] = Query(None, description="Comma separated symbols, e.g. BTCUSDT,ETHUSDT"),
+    include_stale: bool = False,
+):
+    """Return the latest in-memory prices maintained by the market-data service.
+
+    Served entirely from the process-wide price cache (no DB access).
+    """
+    wanted = [s.strip() for s in symbols.split(',') if s.strip()] if symbols else None
+    now = time.time()
+    return [
+        LatestPrice(
+            symbol=e.symbol,
+            price=e.price,
+            source=e.source,
+            exchange_ts=e.exchange_ts,
+            received_at=datetime.utcfromtimestamp(e.received_ts),
+            age_seconds=round(e.age(now), 3),
+            is_stale=e.age(now) > price_cache.ttl,
+        )
+        for e in price_cache.snapshot(wanted, include_stale=include_stale)
+    ]
+
+
+@router.get('/retention-report')
+async def get_retention_report(request: Request):
+    """Return the last retention run report (rows/partitions/bytes reclaimed per table)."""
+    retention = getattr(request.app.state, "retention", None)
+    if retention is None:
+        raise HTTPException(status_code=404, detail="Retention service not running")
+    return {
+        "retention_days": retention.retention_days,
+        "last_report": retention.last_report,
+    }
+
+
+@router.get('/rate-limits')
+async def get_rate_limits():
+    """Current request-weight usage per exchange host (shared by account sync and the poller)."""
+    return rate_limit_snapshot()
+
+
+@router.get('/tick-stats', response_model=TickStats)
+async def get_tick_stats(
+    request: Request,
+    symbol: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+):
+    """Volatility and historical VaR for a symbol, computed on the local tick store arrays."""
+    store = getattr(request.app.state, "tick_store", None)
+    if store is None:
+        raise HTTPException(status_code=404, detail="Tick store not enabled (set TICK_STORE_DIR)")
+    ts, px = store.read(symbol, start, end)
+    if ts.size == 0:
+        return TickStats(symbol=symbol.replace('/', '').upper(), ticks=0)
+    return TickStats(
+        symbol=symbol.replace('/', '').upper(),
+        ticks=int(ts.size),
+        first_at=datetime.utcfromtimestamp(ts[0] / 1000),
+        last_at=datetime.utcfromtimestamp(ts[-1] / 1000),
+        last_price=float(px[-1]),
+        volatility=realized_volatility(ts, px),
+        var_95=historical_var(px, 0.95),
+        var_99=historical_var(px, 0.99),
+    )
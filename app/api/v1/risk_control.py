@@ -1,24 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from datetime import datetime
 from sqlalchemy.orm import Session
 from typing import List, Optional
+import os
 from app.core.database import get_db
 from app.core.deps import get_current_user
 from app.schemas import risk_control as schemas
 from app.services.risk_control_service import RiskControlService
-from app.services.position_sync import get_position_sync_from_env
+from app.services.risk_config_cache import risk_config_cache
 from app.core.database import SessionLocal
 
 router = APIRouter(prefix="/risk-control", tags=["风险控制"])
 
 @router.post("/accounts/", response_model=schemas.AccountInDB)
-async def create_account(account: schemas.AccountCreate, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+async def create_account(account: schemas.AccountCreate, request: Request, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
     """创建交易账户"""
     from app.models.risk_control import Account
     db_account = Account(**account.dict())
     db.add(db_account)
     db.commit()
     db.refresh(db_account)
+    # pull the account's past history in the background (HISTORY_BACKFILL_DAYS=0 disables)
+    backfill = getattr(request.app.state, "history_backfill", None)
+    days = float(os.getenv("HISTORY_BACKFILL_DAYS", "90"))
+    if backfill is not None and days > 0 and db_account.api_key and db_account.api_secret:
+        backfill.submit(db_account.id, days)
     return db_account
 
 @router.post("/accounts/{account_id}/risk-config", response_model=schemas.RiskConfigInDB)
@@ -37,8 +43,14 @@ async def create_risk_config(
     db.add(db_config)
     db.commit()
     db.refresh(db_config)
+    risk_config_cache.invalidate(account_id)
     return db_config
 
+@router.get("/risk-config-cache")
+async def get_risk_config_cache_stats(current_user=Depends(get_current_user)):
+    """风控配置缓存统计（命中/未命中/失效次数）"""
+    return risk_config_cache.snapshot()
+
 @router.get("/accounts/{account_id}/risk-config", response_model=schemas.RiskConfigInDB)
 async def get_risk_config(
     account_id: int,
@@ -84,6 +96,7 @@ async def update_risk_config(
             
     db.commit()
     db.refresh(db_config)
+    risk_config_cache.invalidate(account_id)
     return db_config
 
 @router.post("/check-position-risk")
@@ -161,14 +174,21 @@ async def list_positions(
     return query.order_by(Position.updated_at.desc()).all()
 
 
+def _position_sync(request: Request):
+    syncer = getattr(request.app.state, "position_sync", None)
+    if syncer is None:
+        raise HTTPException(status_code=404, detail="Position sync service not running")
+    return syncer
+
+
 @router.post('/positions/sync', status_code=202)
-async def trigger_positions_sync(current_user=Depends(get_current_user)):
+async def trigger_positions_sync(request: Request, current_user=Depends(get_current_user)):
     """Trigger a background one-shot positions sync.
 
     This endpoint will run a single sync across active accounts and return 202 Accepted.
     It is intended for manual testing when you added account API keys.
     """
-    syncer = get_position_sync_from_env()
+    syncer = _position_sync(request)
     # fire-and-forget the one-shot sync
     import asyncio
     asyncio.create_task(syncer.sync_once())
@@ -200,6 +220,9 @@ async def update_account(
     
     db.commit()
     db.refresh(db_account)
+    # credentials/proxy may have changed: rebuild the pooled adapter on next use
+    from app.services.exchange.binance_adapter import invalidate_adapter
+    invalidate_adapter(account_id)
     return db_account
 
 @router.delete('/accounts/{account_id}', status_code=204)
@@ -216,20 +239,21 @@ async def delete_account(
     
     db.delete(db_account)
     db.commit()
+    from app.services.exchange.binance_adapter import invalidate_adapter
+    invalidate_adapter(account_id)
+    risk_config_cache.invalidate(account_id)
     return None
 
 @router.post('/accounts/{account_id}/positions/sync', status_code=202)
-async def trigger_account_sync(account_id: int, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+async def trigger_account_sync(account_id: int, request: Request, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
     """Trigger a sync for a single account (manual/test only)."""
     from app.models.risk_control import Account
     acct = db.query(Account).filter(Account.id == account_id).first()
     if not acct:
         raise HTTPException(status_code=404, detail="Account not found")
 
-    # run one-shot sync for this account
-    from app.services.position_sync import PositionSyncService
-
-    syncer = PositionSyncService()
+    # run one-shot sync for this account on the running service (shares its history cadence and locks)
+    syncer = _position_sync(request)
     # call internal method _sync_account with account ORM object
     import asyncio
     asyncio.create_task(syncer._sync_account(acct))
@@ -263,11 +287,11 @@ async def test_account_positions(account_id: int, current_user=Depends(get_curre
             rows = None
 
         if rows is not None:
-            return {"rows": rows}
+            return {"rows": rows, "clock": adapter.clock.snapshot()}
 
         # try raw debug to surface server status/body
         raw = await adapter.fetch_positions_raw()
-        return {"rows": None, "debug": raw}
+        return {"rows": None, "debug": raw, "clock": adapter.clock.snapshot()}
     finally:
         db.close()
 
@@ -440,11 +464,12 @@ async def get_transaction_history(
 @router.post("/accounts/{account_id}/sync-history")
 async def sync_account_history(
     account_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user)
 ):
     """同步账户历史数据（交易和资金费）"""
-    from app.models.risk_control import Account, TransactionHistory
+    from app.models.risk_control import Account
     from app.services.exchange.binance_adapter import create_adapter_for_account
     
     account = db.query(Account).filter(Account.id == account_id).first()
@@ -455,116 +480,54 @@ async def sync_account_history(
     if not adapter:
         raise HTTPException(status_code=400, detail="Failed to create adapter")
         
-    # Clean up old trade-level records (T_ prefix) to avoid duplicates with new ORDER_ records
-    try:
-        db.query(TransactionHistory).filter(
-            TransactionHistory.account_id == account_id,
-            TransactionHistory.transaction_id.like('T_%')
-        ).delete(synchronize_session=False)
-        db.commit()
-    except Exception as e:
-        logging.warning("Failed to clean up old trade records: %s", e)
-        db.rollback()
-
     # Fetch Income History (includes FUNDING_FEE, REALIZED_PNL, COMMISSION, TRANSFER)
-    # Note: This is a simplified sync. In production, we should track last synced time.
+    # and trades incrementally from the account's sync cursors, serialized with the background sync
+    syncer = _position_sync(request)
     try:
-        income_history = await adapter.fetch_income_history(limit=100)
-        user_trades = await adapter.fetch_user_trades(limit=100)
-        
-        count = 0
-        # Process Income
-        if income_history:
-            for item in income_history:
-                tran_id = item.get('tranId')
-                if not tran_id:
-                    continue
-                exists = db.query(TransactionHistory).filter(
-                    TransactionHistory.transaction_id == str(tran_id)
-                ).first()
-                if not exists:
-                    db_item = TransactionHistory(
-                        account_id=account_id,
-                        symbol=item.get('symbol'),
-                        type=item.get('incomeType'),
-                        side=None,
-                        price=None,
-                        qty=None,
-                        quote_qty=None,
-                        commission=None,
-                        commission_asset=item.get('asset'),
-                        realized_pnl=float(item.get('income')),
-                        time=datetime.utcfromtimestamp(item.get('time') / 1000),
-                        transaction_id=str(tran_id)
-                    )
-                    db.add(db_item)
-                    count += 1
-
-        # Process Trades (Aggregated by orderId)
-        if user_trades:
-            aggregated_trades = {}
-            for trade in user_trades:
-                oid = str(trade.get('orderId'))
-                if not oid: continue
-                
-                if oid not in aggregated_trades:
-                    aggregated_trades[oid] = {
-                        'symbol': trade.get('symbol'),
-                        'side': trade.get('side'),
-                        'price_sum': float(trade.get('price', 0)) * float(trade.get('qty', 0)),
-                        'qty': float(trade.get('qty', 0)),
-                        'quote_qty': float(trade.get('quoteQty', 0)),
-                        'commission': float(trade.get('commission', 0)),
-                        'commission_asset': trade.get('commissionAsset'),
-                        'realized_pnl': float(trade.get('realizedPnl', 0)),
-                        'time': trade.get('time')
-                    }
-                else:
-                    item = aggregated_trades[oid]
-                    item['price_sum'] += float(trade.get('price', 0)) * float(trade.get('qty', 0))
-                    item['qty'] += float(trade.get('qty', 0))
-                    item['quote_qty'] += float(trade.get('quoteQty', 0))
-                    item['commission'] += float(trade.get('commission', 0))
-                    item['realized_pnl'] += float(trade.get('realizedPnl', 0))
-                    item['time'] = max(item['time'], trade.get('time'))
-
-            for oid, data in aggregated_trades.items():
-                global_id = f"ORDER_{oid}"
-                exists = db.query(TransactionHistory).filter(
-                    TransactionHistory.transaction_id == global_id
-                ).first()
-                
-                avg_price = data['price_sum'] / data['qty'] if data['qty'] > 0 else 0
-                
-                if not exists:
-                    db_item = TransactionHistory(
-                        account_id=account_id,
-                        symbol=data['symbol'],
-                        type="TRADE",
-                        side=data['side'],
-                        price=avg_price,
-                        qty=data['qty'],
-                        quote_qty=data['quote_qty'],
-                        commission=data['commission'],
-                        commission_asset=data['commission_asset'],
-                        realized_pnl=data['realized_pnl'],
-                        time=datetime.utcfromtimestamp(data['time'] / 1000),
-                        order_id=oid,
-                        transaction_id=global_id
-                    )
-                    db.add(db_item)
-                    count += 1
-                else:
-                    # Update existing aggregated record
-                    exists.price = avg_price
-                    exists.qty = data['qty']
-                    exists.quote_qty = data['quote_qty']
-                    exists.commission = data['commission']
-                    exists.realized_pnl = data['realized_pnl']
-                    exists.time = datetime.fromtimestamp(data['time'] / 1000)
-                    db.add(exists)
-
-        db.commit()
+        count = await syncer.sync_history(account, adapter)
         return {"message": f"Synced {count} history items"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/accounts/{account_id}/history/backfill", response_model=schemas.BackfillJobInDB, status_code=202)
+async def start_history_backfill(
+    account_id: int,
+    request: Request,
+    days: float = Query(90, gt=0, le=730),
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """Backfill the account's income and trades for the last `days` days (resumes an unfinished job)."""
+    from app.models.risk_control import Account
+    backfill = getattr(request.app.state, "history_backfill", None)
+    if backfill is None:
+        raise HTTPException(status_code=404, detail="History backfill service not running")
+    if not db.query(Account).filter(Account.id == account_id).first():
+        raise HTTPException(status_code=404, detail="Account not found")
+    return backfill.submit(account_id, days)
+
+
+@router.get("/accounts/{account_id}/history/backfill", response_model=List[schemas.BackfillJobInDB])
+async def list_history_backfills(
+    account_id: int,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """Backfill jobs of an account with their progress, newest first."""
+    from app.models.risk_control import BackfillJob
+    return db.query(BackfillJob).filter(BackfillJob.account_id == account_id).order_by(BackfillJob.id.desc()).all()
+
+
+@router.get("/history/backfill/{job_id}", response_model=schemas.BackfillJobInDB)
+async def get_history_backfill(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """Progress of one backfill job."""
+    from app.models.risk_control import BackfillJob
+    job = db.query(BackfillJob).filter(BackfillJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Backfill job not found")
+    return job
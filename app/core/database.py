@@ -59,7 +59,11 @@ def init_db():
         Position,
         RiskAlert,
         OrderLog,
-        TickerHistory
+        TickerHistory,
+        SymbolRoute,
+        TickerBar,
+        SyncCursor,
+        BackfillJob
     )
     
     Base.metadata.create_all(bind=engine)
@@ -87,3 +91,44 @@ def init_db():
         # best-effort only; do not fail startup if alter fails
         import logging
         logging.exception("init_db: failed to add position_side column (ignored)")
+
+    # Ensure sync_cursors has started_from (added after the table was introduced)
+    try:
+        from sqlalchemy import text
+        with engine.connect() as conn:
+            res = conn.execute(text("SHOW COLUMNS FROM sync_cursors LIKE 'started_from'"))
+            if res.first() is None:
+                import logging
+                logging.info("init_db: adding sync_cursors.started_from column")
+                conn.execute(text("ALTER TABLE sync_cursors ADD COLUMN started_from BIGINT DEFAULT NULL"))
+    except Exception:
+        # best-effort only; do not fail startup if the alter fails
+        import logging
+        logging.exception("init_db: failed to add sync_cursors.started_from column (ignored)")
+
+    # Legacy trade-level history records (T_ prefix) are superseded by ORDER_ aggregates
+    try:
+        from sqlalchemy import text
+        with engine.begin() as conn:
+            res = conn.execute(text("DELETE FROM transaction_history WHERE transaction_id LIKE 'T_%'"))
+            if res.rowcount:
+                import logging
+                logging.info("init_db: removed %s legacy trade-level history records", res.rowcount)
+    except Exception:
+        # best-effort only; do not fail startup if the cleanup fails
+        import logging
+        logging.exception("init_db: failed to remove legacy trade-level history records (ignored)")
+
+    # Ensure ticker_history has a timestamp index (used by range queries and retention)
+    try:
+        from sqlalchemy import text
+        with engine.connect() as conn:
+            res = conn.execute(text("SHOW INDEX FROM ticker_history WHERE Key_name = 'ix_ticker_history_timestamp'"))
+            if res.first() is None:
+                import logging
+                logging.info("init_db: adding ix_ticker_history_timestamp index")
+                conn.execute(text("CREATE INDEX ix_ticker_history_timestamp ON ticker_history (timestamp)"))
+    except Exception:
+        # best-effort only; do not fail startup if the index cannot be created
+        import logging
+        logging.exception("init_db: failed to add ticker_history timestamp index (ignored)")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Float, Boolean, JSON, ForeignKey, Enum, Integer, DateTime
+from sqlalchemy import Column, String, Float, Boolean, JSON, ForeignKey, Enum, Integer, BigInteger, DateTime, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -105,11 +105,27 @@ class TickerHistory(Base, BaseMixin):
 
     symbol = Column(String(20), nullable=False, index=True)
     price = Column(Float, nullable=False)
-    timestamp = Column(DateTime, nullable=False)
+    timestamp = Column(DateTime, nullable=False, index=True)
     source = Column(String(50), nullable=True)
     position_id = Column(Integer, ForeignKey("positions.id"), nullable=True)
     account_id = Column(Integer, ForeignKey("accounts.id"), nullable=True)
 
+class TickerBar(Base, BaseMixin):
+    """OHLC rollup of ticker prices per symbol (deduplicated across positions)."""
+    __tablename__ = "ticker_bars"
+    __table_args__ = (
+        UniqueConstraint("symbol", "resolution", "bucket_start", name="uq_ticker_bars_symbol_res_bucket"),
+    )
+
+    symbol = Column(String(20), nullable=False)
+    resolution = Column(String(4), nullable=False)  # 1m / 5m / 1h / 1d
+    bucket_start = Column(DateTime, nullable=False)
+    open = Column(Float, nullable=False)
+    high = Column(Float, nullable=False)
+    low = Column(Float, nullable=False)
+    close = Column(Float, nullable=False)
+    tick_count = Column(Integer, nullable=False, default=0)
+
 class TransactionHistory(Base, BaseMixin):
     __tablename__ = "transaction_history"
 
@@ -129,6 +145,20 @@ class TransactionHistory(Base, BaseMixin):
 
     account = relationship("Account")
 
+class SyncCursor(Base, BaseMixin):
+    """Where incremental history sync left off, per account and stream."""
+    __tablename__ = "sync_cursors"
+    __table_args__ = (
+        UniqueConstraint("account_id", "stream", name="uq_sync_cursors_account_stream"),
+    )
+
+    account_id = Column(Integer, ForeignKey("accounts.id"), nullable=False)
+    stream = Column(String(50), nullable=False)  # "income" or "trades:<SYMBOL>"
+    last_time = Column(BigInteger)  # exchange time (ms) of the last stored record
+    last_id = Column(BigInteger)  # tranId / trade id of the last stored record
+    # exchange time (ms) from which incremental sync owns the stream; backfill covers what lies before
+    started_from = Column(BigInteger)
+
 class AccountSnapshot(Base, BaseMixin):
     __tablename__ = "account_snapshots"
 
@@ -138,3 +168,32 @@ class AccountSnapshot(Base, BaseMixin):
     timestamp = Column(DateTime, default=datetime.utcnow, index=True)
 
     account = relationship("Account")
+
+
+class SymbolRoute(Base, BaseMixin):
+    __tablename__ = "symbol_routes"
+
+    symbol = Column(String(20), nullable=False, unique=True)
+    market = Column(String(10), nullable=False)  # futures / spot / invalid
+    checked_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+class BackfillJob(Base, BaseMixin):
+    """A resumable historical backfill of one account's income and trades."""
+    __tablename__ = "backfill_jobs"
+
+    account_id = Column(Integer, ForeignKey("accounts.id"), nullable=False, index=True)
+    status = Column(String(20), nullable=False, default="pending")  # pending, running, completed, failed
+    phase = Column(String(20))  # income, trades
+    start_time = Column(BigInteger, nullable=False)  # ms, inclusive
+    end_time = Column(BigInteger, nullable=False)  # ms, exclusive
+    window_ms = Column(BigInteger, nullable=False)
+    windows_total = Column(Integer, default=0)
+    windows_done = Column(Integer, default=0)
+    records = Column(Integer, default=0)
+    completed_windows = Column(JSON)  # keys of windows already stored, e.g. "income:<start>"
+    error = Column(String(500))
+    finished_at = Column(DateTime)
+
+    @property
+    def progress(self) -> float:
+        return round(self.windows_done / self.windows_total, 4) if self.windows_total else 0.0
@@ -144,6 +144,38 @@ class TickerHistoryInDB(BaseModel):
     class Config:
         orm_mode = True
 
+class TickerBarInDB(BaseModel):
+    symbol: str
+    resolution: str
+    bucket_start: datetime
+    open: float
+    high: float
+    low: float
+    close: float
+    tick_count: int
+
+    class Config:
+        orm_mode = True
+
+class LatestPrice(BaseModel):
+    symbol: str
+    price: float
+    source: str
+    exchange_ts: Optional[int] = Field(None, description="交易所事件时间 (ms)")
+    received_at: datetime
+    age_seconds: float
+    is_stale: bool
+
+class TickStats(BaseModel):
+    symbol: str
+    ticks: int
+    first_at: Optional[datetime] = None
+    last_at: Optional[datetime] = None
+    last_price: Optional[float] = None
+    volatility: Optional[float] = Field(None, description="年化已实现波动率")
+    var_95: Optional[float] = Field(None, description="单笔历史VaR (95%)")
+    var_99: Optional[float] = Field(None, description="单笔历史VaR (99%)")
+
 class RiskAlertBase(BaseModel):
     alert_type: str = Field(..., description="预警类型")
     risk_level: RiskLevel = Field(..., description="风险等级")
@@ -193,3 +225,22 @@ class TransactionHistoryInDB(TransactionHistoryBase):
 
     class Config:
         orm_mode = True
+
+class BackfillJobInDB(BaseModel):
+    id: int
+    account_id: int
+    status: str
+    phase: Optional[str]
+    start_time: int
+    end_time: int
+    windows_total: int
+    windows_done: int
+    records: int
+    progress: float
+    error: Optional[str]
+    created_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime]
+
+    class Config:
+        orm_mode = True
@@ -5,66 +5,129 @@ the account to have API key and secret stored in the Account row.
 
 It is intentionally small and dependency-free (uses httpx and HMAC) so it fits into
 the existing service stack.
+
+Adapters are cached per account (see `create_adapter_for_account`) and each one
+keeps a single keep-alive connection pool, so periodic syncs reuse TLS
+connections instead of opening two fresh clients per call.
 """
 from __future__ import annotations
 
 import hmac
 import hashlib
+import asyncio
 import time
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 import logging
 
 import httpx
 
+from app.services.exchange.clock import ExchangeClock, get_clock
+from app.services.exchange.rate_limit import governed_get, governed_request
+
 
 class BinanceAdapter:
     BASE = "https://fapi.binance.com"
+    # include a recvWindow to account for small clock skew if any
+    RECV_WINDOW = 15000
 
     def __init__(self, api_key: str, api_secret: str, proxy: Optional[str] = None):
         self.api_key = api_key
         self.api_secret = api_secret
         self.proxy = proxy
-
-    def _get_client(self, timeout: float = 10.0) -> httpx.AsyncClient:
-        """Create an httpx client with optional proxy support."""
-        if self.proxy:
-            return httpx.AsyncClient(timeout=timeout, proxies=self.proxy)
-        return httpx.AsyncClient(timeout=timeout)
+        # long-lived keep-alive pool, created on first use and closed in aclose()
+        self._client: Optional[httpx.AsyncClient] = None
+        # shared server-clock offset; replaces a /fapi/v1/time call per request
+        self.clock: ExchangeClock = get_clock(f"{self.BASE}/fapi/v1/time")
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Return the adapter's pooled httpx client (with optional proxy support)."""
+        if self._client is None or self._client.is_closed:
+            limits = httpx.Limits(max_connections=10, max_keepalive_connections=5, keepalive_expiry=120.0)
+            if self.proxy:
+                self._client = httpx.AsyncClient(timeout=20.0, limits=limits, proxies=self.proxy)
+            else:
+                self._client = httpx.AsyncClient(timeout=20.0, limits=limits)
+        return self._client
+
+    async def aclose(self):
+        client, self._client = self._client, None
+        if client is not None:
+            await client.aclose()
 
     def _sign(self, params: str) -> str:
         return hmac.new(self.api_secret.encode('utf-8'), params.encode('utf-8'), hashlib.sha256).hexdigest()
 
-    async def fetch_positions(self) -> Optional[List[Dict]]:
-        """Fetch the user's futures positions via /fapi/v2/positionRisk.
-
-        Returns list of position dicts from Binance, or None on error.
-        """
-        # Use server time to avoid local clock skew issues
+    async def _server_time(self) -> int:
+        # server time estimated from the cached clock offset, to avoid local clock skew issues
         try:
-            async with self._get_client(timeout=10.0) as client:
-                t_res = await client.get(f"{self.BASE}/fapi/v1/time")
-                if t_res.status_code == 200:
-                    server_ts = t_res.json().get("serverTime")
-                else:
-                    server_ts = int(time.time() * 1000)
+            return await self.clock.now_ms(self._get_client())
         except Exception:
-            server_ts = int(time.time() * 1000)
+            return int(time.time() * 1000)
 
-        ts = int(server_ts)
-        # include a recvWindow to account for small clock skew if any
-        recv_window = 15000
-        qs = f"timestamp={ts}&recvWindow={recv_window}"
-        sig = self._sign(qs)
-        url = f"{self.BASE}/fapi/v2/positionRisk?{qs}&signature={sig}"
+    @staticmethod
+    def _is_timestamp_error(r: httpx.Response) -> bool:
+        # -1021: "Timestamp for this request is outside of the recvWindow"
+        if r.status_code != 400:
+            return False
+        try:
+            return r.json().get("code") == -1021
+        except Exception:
+            return False
 
+    async def _signed_get(self, path: str, params: str = "") -> httpx.Response:
         headers = {"X-MBX-APIKEY": self.api_key}
+        for attempt in range(2):
+            ts = await self._server_time()
+            qs = f"timestamp={ts}&recvWindow={self.RECV_WINDOW}"
+            if params:
+                qs += f"&{params}"
+            sig = self._sign(qs)
+            r = await governed_get(self._get_client(), f"{self.BASE}{path}?{qs}&signature={sig}", headers=headers)
+            if attempt == 0 and self._is_timestamp_error(r):
+                logging.warning("binance: timestamp rejected for %s, resyncing clock (%s)", path, self.clock.snapshot())
+                self.clock.invalidate()
+                continue
+            return r
+        return r
+
+    async def create_listen_key(self, url: Optional[str] = None) -> Optional[str]:
+        """Open (or return the active) user-data-stream listenKey via POST /fapi/v1/listenKey.
+
+        Needs only the API key header; `url` overrides the endpoint (local fake servers).
+        Returns the key, or None on error.
+        """
+        try:
+            r = await governed_request(self._get_client(), "POST", url or f"{self.BASE}/fapi/v1/listenKey",
+                                       headers={"X-MBX-APIKEY": self.api_key})
+            if r.status_code == 200:
+                return r.json().get("listenKey")
+            logging.error("binance: create_listen_key non-200 status %s body=%s", r.status_code, r.text)
+        except Exception as e:
+            logging.exception("binance: create_listen_key failed: %s", e)
+        return None
+
+    async def keepalive_listen_key(self, url: Optional[str] = None) -> bool:
+        """Extend the listenKey's validity by 60 minutes (PUT /fapi/v1/listenKey)."""
+        try:
+            r = await governed_request(self._get_client(), "PUT", url or f"{self.BASE}/fapi/v1/listenKey",
+                                       headers={"X-MBX-APIKEY": self.api_key})
+            if r.status_code == 200:
+                return True
+            logging.warning("binance: keepalive_listen_key non-200 status %s body=%s", r.status_code, r.text)
+        except Exception as e:
+            logging.exception("binance: keepalive_listen_key failed: %s", e)
+        return False
+
+    async def fetch_positions(self) -> Optional[List[Dict]]:
+        """Fetch the user's futures positions via /fapi/v2/positionRisk.
 
+        Returns list of position dicts from Binance, or None on error.
+        """
         try:
-            async with self._get_client(timeout=20.0) as client:
-                r = await client.get(url, headers=headers)
-                if r.status_code == 200:
-                    return r.json()
-                logging.error("binance: non-200 status %s body=%s", r.status_code, r.text)
+            r = await self._signed_get("/fapi/v2/positionRisk")
+            if r.status_code == 200:
+                return r.json()
+            logging.error("binance: non-200 status %s body=%s", r.status_code, r.text)
         except Exception as e:
             logging.exception("binance: fetch_positions failed: %s", e)
 
@@ -76,29 +139,10 @@ class BinanceAdapter:
         Returns dict with account info, or None on error.
         """
         try:
-            async with self._get_client(timeout=10.0) as client:
-                t_res = await client.get(f"{self.BASE}/fapi/v1/time")
-                if t_res.status_code == 200:
-                    server_ts = t_res.json().get("serverTime")
-                else:
-                    server_ts = int(time.time() * 1000)
-        except Exception:
-            server_ts = int(time.time() * 1000)
-
-        ts = int(server_ts)
-        recv_window = 15000
-        qs = f"timestamp={ts}&recvWindow={recv_window}"
-        sig = self._sign(qs)
-        url = f"{self.BASE}/fapi/v2/account?{qs}&signature={sig}"
-
-        headers = {"X-MBX-APIKEY": self.api_key}
-
-        try:
-            async with self._get_client(timeout=20.0) as client:
-                r = await client.get(url, headers=headers)
-                if r.status_code == 200:
-                    return r.json()
-                logging.error("binance: fetch_account_info non-200 status %s body=%s", r.status_code, r.text)
+            r = await self._signed_get("/fapi/v2/account")
+            if r.status_code == 200:
+                return r.json()
+            logging.error("binance: fetch_account_info non-200 status %s body=%s", r.status_code, r.text)
         except Exception as e:
             logging.exception("binance: fetch_account_info failed: %s", e)
 
@@ -109,113 +153,168 @@ class BinanceAdapter:
 
         Returns a dict: {status: int, text: str}
         """
-        # fetch server time to avoid timestamp errors
-        try:
-            async with self._get_client(timeout=10.0) as client:
-                t_res = await client.get(f"{self.BASE}/fapi/v1/time")
-                if t_res.status_code == 200:
-                    server_ts = t_res.json().get("serverTime")
-                else:
-                    server_ts = int(time.time() * 1000)
-        except Exception:
-            server_ts = int(time.time() * 1000)
-
-        ts = int(server_ts)
-        recv_window = 15000
-        qs = f"timestamp={ts}&recvWindow={recv_window}"
-        sig = self._sign(qs)
-        url = f"{self.BASE}/fapi/v2/positionRisk?{qs}&signature={sig}"
-
-        headers = {"X-MBX-APIKEY": self.api_key}
         try:
-            async with self._get_client(timeout=20.0) as client:
-                r = await client.get(url, headers=headers)
-                return {"status": r.status_code, "text": r.text}
+            r = await self._signed_get("/fapi/v2/positionRisk")
+            return {"status": r.status_code, "text": r.text}
         except Exception as e:
             logging.exception("binance: fetch_positions_raw failed: %s", e)
             return {"status": 0, "text": str(e)}
 
-    async def fetch_income_history(self, limit: int = 100) -> Optional[List[Dict]]:
+    async def fetch_income_history(self, limit: int = 100, start_time: Optional[int] = None,
+                                   end_time: Optional[int] = None) -> Optional[List[Dict]]:
         """Fetch income history (funding fees, realized pnl, etc) via /fapi/v1/income.
         
+        With start_time (ms) records are returned oldest first from that time,
+        up to end_time (ms, inclusive) if given.
         Returns list of income dicts, or None on error.
         """
+        params = f"limit={limit}"
+        if start_time is not None:
+            params += f"&startTime={start_time}"
+        if end_time is not None:
+            params += f"&endTime={end_time}"
         try:
-            async with self._get_client(timeout=10.0) as client:
-                t_res = await client.get(f"{self.BASE}/fapi/v1/time")
-                if t_res.status_code == 200:
-                    server_ts = t_res.json().get("serverTime")
-                else:
-                    server_ts = int(time.time() * 1000)
-        except Exception:
-            server_ts = int(time.time() * 1000)
-
-        ts = int(server_ts)
-        recv_window = 15000
-        qs = f"timestamp={ts}&recvWindow={recv_window}&limit={limit}"
-        sig = self._sign(qs)
-        url = f"{self.BASE}/fapi/v1/income?{qs}&signature={sig}"
-
-        headers = {"X-MBX-APIKEY": self.api_key}
-
-        try:
-            async with self._get_client(timeout=20.0) as client:
-                r = await client.get(url, headers=headers)
-                if r.status_code == 200:
-                    return r.json()
-                logging.error("binance: fetch_income_history non-200 status %s body=%s", r.status_code, r.text)
+            r = await self._signed_get("/fapi/v1/income", params)
+            if r.status_code == 200:
+                return r.json()
+            logging.error("binance: fetch_income_history non-200 status %s body=%s", r.status_code, r.text)
         except Exception as e:
             logging.exception("binance: fetch_income_history failed: %s", e)
 
         return None
 
-    async def fetch_user_trades(self, symbol: Optional[str] = None, limit: int = 100) -> Optional[List[Dict]]:
+    async def fetch_user_trades(self, symbol: Optional[str] = None, limit: int = 100,
+                                from_id: Optional[int] = None, start_time: Optional[int] = None,
+                                end_time: Optional[int] = None) -> Optional[List[Dict]]:
         """Fetch user's trade history via /fapi/v1/userTrades.
         
+        from_id (trade id, inclusive) or start_time (ms) page forward from that point;
+        Binance rejects fromId combined with a time range, so from_id wins.
         Returns list of trade dicts, or None on error.
         """
-        try:
-            async with self._get_client(timeout=10.0) as client:
-                t_res = await client.get(f"{self.BASE}/fapi/v1/time")
-                if t_res.status_code == 200:
-                    server_ts = t_res.json().get("serverTime")
-                else:
-                    server_ts = int(time.time() * 1000)
-        except Exception:
-            server_ts = int(time.time() * 1000)
-
-        ts = int(server_ts)
-        recv_window = 15000
-        qs = f"timestamp={ts}&recvWindow={recv_window}&limit={limit}"
+        params = f"limit={limit}"
         if symbol:
-            qs += f"&symbol={symbol.upper()}"
-        sig = self._sign(qs)
-        url = f"{self.BASE}/fapi/v1/userTrades?{qs}&signature={sig}"
-
-        headers = {"X-MBX-APIKEY": self.api_key}
-
+            params += f"&symbol={symbol.upper()}"
+        if from_id is not None:
+            params += f"&fromId={from_id}"
+        else:
+            if start_time is not None:
+                params += f"&startTime={start_time}"
+            if end_time is not None:
+                params += f"&endTime={end_time}"
         try:
-            async with self._get_client(timeout=20.0) as client:
-                r = await client.get(url, headers=headers)
-                if r.status_code == 200:
-                    return r.json()
-                logging.error("binance: fetch_user_trades non-200 status %s body=%s", r.status_code, r.text)
+            r = await self._signed_get("/fapi/v1/userTrades", params)
+            if r.status_code == 200:
+                return r.json()
+            logging.error("binance: fetch_user_trades non-200 status %s body=%s", r.status_code, r.text)
         except Exception as e:
             logging.exception("binance: fetch_user_trades failed: %s", e)
 
         return None
 
 
-def create_adapter_for_account(account) -> Optional[BinanceAdapter]:
+    async def fetch_income_since(self, start_time: int, page_size: int = 1000,
+                                 max_pages: int = 50, end_time: Optional[int] = None) -> Optional[List[Dict]]:
+        """Walk /fapi/v1/income forward from start_time (inclusive) until caught up
+        (or past end_time, inclusive).
+
+        Pages overlap on the boundary millisecond; duplicates are dropped by tranId.
+        Returns None if the first page fails, otherwise everything fetched so far.
+        """
+        items, seen = [], set()
+        cursor = start_time
+        for _ in range(max_pages):
+            page = await self.fetch_income_history(limit=page_size, start_time=cursor, end_time=end_time)
+            if page is None:
+                return items if items else None
+            for item in page:
+                if item.get("tranId") not in seen:
+                    seen.add(item.get("tranId"))
+                    items.append(item)
+            if len(page) < page_size:
+                break
+            last = max(int(item["time"]) for item in page)
+            # a full page within a single millisecond cannot be paged further by time
+            cursor = last if last > cursor else last + 1
+        return items
+
+    async def fetch_user_trades_since(self, symbol: str, from_id: Optional[int] = None,
+                                      start_time: Optional[int] = None, page_size: int = 1000,
+                                      max_pages: int = 50, end_time: Optional[int] = None) -> Optional[List[Dict]]:
+        """Walk /fapi/v1/userTrades for one symbol forward from from_id (or start_time),
+        stopping after end_time (ms, inclusive) if given.
+
+        Returns None if the first page fails, otherwise everything fetched so far.
+        """
+        trades: List[Dict] = []
+        for _ in range(max_pages):
+            page = await self.fetch_user_trades(symbol=symbol, limit=page_size, from_id=from_id,
+                                                start_time=start_time, end_time=end_time)
+            if page is None:
+                return trades if trades else None
+            if end_time is not None:
+                # later pages are fetched by fromId, which ignores the time range
+                trades.extend(t for t in page if int(t["time"]) <= end_time)
+                if any(int(t["time"]) > end_time for t in page):
+                    break
+            else:
+                trades.extend(page)
+            if len(page) < page_size:
+                break
+            from_id = max(int(t["id"]) for t in page) + 1
+        return trades
+
+# account id -> (credentials/proxy key, adapter)
+_adapters: Dict[int, Tuple[tuple, BinanceAdapter]] = {}
+
+
+def _close_later(adapter: BinanceAdapter):
+    # callers may be sync (request handlers, invalidation); close on the running loop if any
+    try:
+        asyncio.get_running_loop().create_task(adapter.aclose())
+    except RuntimeError:
+        logging.debug("binance: no running loop, leaving adapter client to be garbage collected")
+
+
+def is_binance_account(account) -> bool:
+    """Whether the account has credentials for an exchange this adapter serves."""
     if not account.api_key or not account.api_secret:
-        return None
+        return False
     # ensure account.exchange is binance (allow uppercase/lowercase)
-    if getattr(account, 'exchange', '').lower() not in ('binance', 'binance-futures', 'fapi', 'futures'):
+    return (getattr(account, 'exchange', '') or '').lower() in ('binance', 'binance-futures', 'fapi', 'futures')
+
+
+def create_adapter_for_account(account) -> Optional[BinanceAdapter]:
+    if not is_binance_account(account):
         return None
     
     # Check for proxy in settings
     proxy = None
     if hasattr(account, 'settings') and account.settings:
         proxy = account.settings.get('proxy')
-    
-    return BinanceAdapter(account.api_key, account.api_secret, proxy=proxy)
+
+    # reuse the account's adapter (and its connection pool) while credentials and proxy are unchanged
+    key = (account.api_key, account.api_secret, proxy)
+    cached = _adapters.get(account.id)
+    if cached is not None:
+        if cached[0] == key:
+            return cached[1]
+        _close_later(cached[1])
+
+    adapter = BinanceAdapter(account.api_key, account.api_secret, proxy=proxy)
+    _adapters[account.id] = (key, adapter)
+    return adapter
+
+
+def invalidate_adapter(account_id: int):
+    """Drop the cached adapter for an account (e.g. after its credentials changed)."""
+    cached = _adapters.pop(account_id, None)
+    if cached is not None:
+        _close_later(cached[1])
+
+
+async def close_all_adapters():
+    adapters = [adapter for _, adapter in _adapters.values()]
+    _adapters.clear()
+    for adapter in adapters:
+        await adapter.aclose()
@@ -0,0 +1,109 @@
+"""Exchange clock-offset estimator shared by all adapters for one exchange.
+
+Signed Binance requests need a timestamp close to the exchange clock. Rather
+than calling /fapi/v1/time before every request, the offset between the
+server and the local clock is sampled every `resync_interval` seconds
+NTP-style: each probe records local send/receive times, the offset is
+server_time - midpoint and the uncertainty is half the round trip. The
+probe with the smallest round trip wins.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+import httpx
+
+from app.services.exchange.rate_limit import get_governor, weight_for
+
+
+class ExchangeClock:
+    def __init__(self, time_url: str, resync_interval: float = 300.0, samples: int = 3):
+        self.time_url = time_url
+        self.resync_interval = resync_interval
+        self.samples = samples
+        self.offset_ms: float = 0.0
+        self.uncertainty_ms: Optional[float] = None
+        self.synced_at: Optional[float] = None  # monotonic time of last successful sync
+        self._lock = asyncio.Lock()
+        self.stats: Dict[str, int] = {"syncs": 0, "sync_failures": 0, "forced_resyncs": 0}
+
+    @property
+    def is_stale(self) -> bool:
+        return self.synced_at is None or time.monotonic() - self.synced_at >= self.resync_interval
+
+    async def _probe(self, client: httpx.AsyncClient):
+        # wait for weight budget before starting the round-trip measurement
+        governor = get_governor(self.time_url)
+        if governor is not None:
+            await governor.acquire(weight_for(self.time_url))
+        t0 = time.time() * 1000
+        r = await client.get(self.time_url, timeout=10.0)
+        t1 = time.time() * 1000
+        if governor is not None:
+            governor.record(r)
+        if r.status_code != 200:
+            return None
+        server = float(r.json()["serverTime"])
+        return server - (t0 + t1) / 2, (t1 - t0) / 2
+
+    async def sync(self, client: httpx.AsyncClient) -> bool:
+        async with self._lock:
+            # another caller may have synced while we waited for the lock
+            if not self.is_stale:
+                return True
+            best = None
+            for _ in range(self.samples):
+                try:
+                    sample = await self._probe(client)
+                except Exception:
+                    continue
+                if sample is not None and (best is None or sample[1] < best[1]):
+                    best = sample
+            if best is None:
+                self.stats["sync_failures"] += 1
+                logging.warning("exchange-clock: failed to sample %s", self.time_url)
+                return False
+            self.offset_ms, self.uncertainty_ms = best
+            self.synced_at = time.monotonic()
+            self.stats["syncs"] += 1
+            logging.debug("exchange-clock: offset=%.1fms uncertainty=%.1fms", self.offset_ms, self.uncertainty_ms)
+            return True
+
+    async def now_ms(self, client: httpx.AsyncClient) -> int:
+        """Exchange-clock timestamp in ms, resyncing first when the estimate is stale.
+
+        Falls back to the last known offset (0 if never synced) when sampling fails.
+        """
+        if self.is_stale:
+            await self.sync(client)
+        return int(time.time() * 1000 + self.offset_ms)
+
+    def invalidate(self):
+        """Force a resync on next use (e.g. after a -1021 timestamp error)."""
+        self.stats["forced_resyncs"] += 1
+        self.synced_at = None
+
+    def snapshot(self) -> Dict:
+        return {
+            "offset_ms": round(self.offset_ms, 1),
+            "uncertainty_ms": None if self.uncertainty_ms is None else round(self.uncertainty_ms, 1),
+            "synced_seconds_ago": None if self.synced_at is None else round(time.monotonic() - self.synced_at, 1),
+            **self.stats,
+        }
+
+
+# one clock per time endpoint, shared by every adapter talking to that exchange
+_clocks: Dict[str, ExchangeClock] = {}
+
+
+def get_clock(time_url: str) -> ExchangeClock:
+    clock = _clocks.get(time_url)
+    if clock is None:
+        clock = _clocks[time_url] = ExchangeClock(
+            time_url,
+            resync_interval=float(os.getenv("EXCHANGE_CLOCK_RESYNC_INTERVAL", "300")),
+            samples=int(os.getenv("EXCHANGE_CLOCK_SAMPLES", "3")),
+        )
+    return clock
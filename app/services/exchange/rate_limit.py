@@ -0,0 +1,150 @@
+"""Per-IP request-weight governor for Binance REST endpoints.
+
+Binance limits request weight per IP per minute (futures and spot are
+counted separately) and answers 429, then 418 (IP ban), when the limit is
+exceeded. Every outbound request from the adapters, the exchange clock and
+the market poller goes through `governed_get`, which
+
+- charges the endpoint's weight against the current one-minute window and
+  waits for the next window once `fraction` of the limit is used,
+- reconciles the local count with the X-MBX-USED-WEIGHT-1M response header
+  (which also covers other processes sharing the IP), and
+- pauses all callers for Retry-After seconds after a 429/418.
+
+Waiters are served in arrival order, so accounts and the poller share the
+budget fairly.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+
+# path -> weight, or (weight with symbol=, weight for all symbols)
+ENDPOINT_WEIGHTS: Dict[str, object] = {
+    "/fapi/v1/time": 1,
+    "/fapi/v2/positionRisk": 5,
+    "/fapi/v2/account": 5,
+    "/fapi/v1/income": 30,
+    "/fapi/v1/userTrades": 5,
+    "/fapi/v1/listenKey": 1,
+    "/fapi/v1/ticker/price": (1, 2),
+    "/api/v3/ticker/price": (2, 4),
+}
+
+
+def weight_for(url: str) -> int:
+    parts = urlsplit(url)
+    weight = ENDPOINT_WEIGHTS.get(parts.path, 1)
+    if isinstance(weight, tuple):
+        return weight[0] if "symbol=" in parts.query else weight[1]
+    return weight
+
+
+class WeightGovernor:
+    def __init__(self, name: str, limit: int, fraction: float = 0.8, window: int = 60):
+        self.name = name
+        self.limit = limit
+        self.budget = max(1, int(limit * fraction))
+        self.window = window
+        self._window_start = 0
+        self._used = 0
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+        self.stats: Dict[str, int] = {"requests": 0, "weight": 0, "waits": 0, "throttled": 0}
+        self.wait_seconds = 0.0
+
+    def _roll(self, now: float):
+        # Binance weight windows are aligned to the minute
+        start = int(now) - int(now) % self.window
+        if start != self._window_start:
+            self._window_start = start
+            self._used = 0
+
+    async def acquire(self, weight: int):
+        async with self._lock:
+            while True:
+                now = time.time()
+                if now < self._blocked_until:
+                    delay = self._blocked_until - now
+                else:
+                    self._roll(now)
+                    # a single request heavier than the budget still goes through on an empty window
+                    if self._used + weight <= self.budget or self._used == 0:
+                        self._used += weight
+                        self.stats["requests"] += 1
+                        self.stats["weight"] += weight
+                        return
+                    delay = self._window_start + self.window - now + 0.05
+                self.stats["waits"] += 1
+                self.wait_seconds += delay
+                logging.debug("rate-limit: %s waiting %.2fs (used=%s budget=%s)", self.name, delay, self._used, self.budget)
+                await asyncio.sleep(delay)
+
+    def record(self, response: httpx.Response):
+        now = time.time()
+        used = response.headers.get("x-mbx-used-weight-1m")
+        if used and used.isdigit():
+            self._roll(now)
+            # the header also counts other clients on this IP; never lower our own estimate
+            self._used = max(self._used, int(used))
+        if response.status_code in (418, 429):
+            self.stats["throttled"] += 1
+            retry_after = response.headers.get("retry-after")
+            pause = float(retry_after) if retry_after and retry_after.isdigit() else float(self.window)
+            self._blocked_until = max(self._blocked_until, now + pause)
+            logging.warning("rate-limit: %s returned %s, pausing %s requests for %.0fs",
+                            response.request.url.path, response.status_code, self.name, pause)
+
+    def snapshot(self) -> Dict:
+        self._roll(time.time())
+        return {
+            "limit": self.limit,
+            "budget": self.budget,
+            "used": self._used,
+            "blocked_for": round(max(0.0, self._blocked_until - time.time()), 1),
+            "wait_seconds": round(self.wait_seconds, 2),
+            **self.stats,
+        }
+
+
+# host -> governor; hosts without a governor (local fakes, proxies' own APIs) are not limited
+_governors: Dict[str, WeightGovernor] = {}
+
+
+def get_governor(url: str) -> Optional[WeightGovernor]:
+    host = urlsplit(url).hostname or ""
+    governor = _governors.get(host)
+    if governor is None:
+        fraction = float(os.getenv("BINANCE_WEIGHT_FRACTION", "0.8"))
+        if host == "fapi.binance.com":
+            limit = int(os.getenv("BINANCE_FAPI_WEIGHT_LIMIT", "2400"))
+        elif host == "api.binance.com":
+            limit = int(os.getenv("BINANCE_SPOT_WEIGHT_LIMIT", "6000"))
+        else:
+            return None
+        governor = _governors[host] = WeightGovernor(host, limit, fraction)
+    return governor
+
+
+async def governed_request(client: httpx.AsyncClient, method: str, url: str, **kwargs) -> httpx.Response:
+    """client.request() that waits for weight budget first and learns from the response headers."""
+    governor = get_governor(url)
+    if governor is not None:
+        await governor.acquire(weight_for(url))
+    r = await client.request(method, url, **kwargs)
+    if governor is not None:
+        governor.record(r)
+    return r
+
+
+async def governed_get(client: httpx.AsyncClient, url: str, **kwargs) -> httpx.Response:
+    return await governed_request(client, "GET", url, **kwargs)
+
+
+def rate_limit_snapshot() -> Dict[str, Dict]:
+    return {host: g.snapshot() for host, g in _governors.items()}
@@ -0,0 +1,258 @@
+"""Parallel, resumable backfill of an account's income and trade history.
+
+A BackfillJob covers [start_time, end_time) cut into `window_ms` slices
+(userTrades accepts at most 7 days per time range). Income windows run
+first; the COMMISSION / REALIZED_PNL income they store tells which symbols
+traded, and one trades window per symbol and slice follows. Up to
+`concurrency` windows are fetched at once; every request still goes through
+the shared weight governor, so a backfill slows down rather than starving
+the live sync.
+
+Each window is written with `store_history` and recorded in the job's
+`completed_windows` in the same transaction, so a job interrupted by a crash
+or restart resumes where it stopped without storing a window twice.
+
+Trades are only backfilled up to where incremental sync took over for the
+symbol: the `started_from` its trades cursor records. A symbol without a
+cursor gets one starting at the job's end, so incremental sync picks up
+exactly where the backfill stops and no fill is folded into an order
+aggregate twice.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.core.database import SessionLocal
+from app.models.risk_control import Account, BackfillJob, SyncCursor, TransactionHistory
+from app.services.exchange.binance_adapter import create_adapter_for_account
+from app.services.history_sync import (
+    LOOKBACK_MS, MAX_PAGES, PAGE_SIZE, TRADE_INCOME_TYPES, TRADES_STREAM_PREFIX, account_lock, store_history,
+)
+
+
+DAY_MS = 86_400_000
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _windows(start: int, end: int, size: int) -> List[Tuple[int, int]]:
+    """[start, end) as consecutive (window start, window end inclusive) pairs."""
+    return [(ws, min(ws + size, end) - 1) for ws in range(start, end, size)]
+
+
+class HistoryBackfillService:
+    def __init__(self, concurrency: int = 4, window_days: float = 7.0):
+        self.concurrency = concurrency
+        self.window_ms = int(window_days * DAY_MS)
+        # job id -> running task
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    def submit(self, account_id: int, days: float) -> BackfillJob:
+        """Start a backfill of the last `days` days, or resume the account's unfinished job."""
+        db = SessionLocal()
+        try:
+            job = db.query(BackfillJob).filter(
+                BackfillJob.account_id == account_id,
+                BackfillJob.status.in_(("pending", "running", "failed"))
+            ).order_by(BackfillJob.id.desc()).first()
+            if job is None:
+                end = int(time.time() * 1000)
+                job = BackfillJob(
+                    account_id=account_id,
+                    status="pending",
+                    phase="income",
+                    start_time=end - int(days * DAY_MS),
+                    end_time=end,
+                    window_ms=self.window_ms,
+                    completed_windows=[],
+                )
+                db.add(job)
+            else:
+                job.status = "pending"
+                job.error = None
+            db.commit()
+            db.refresh(job)
+            self._launch(job.id)
+            return job
+        finally:
+            db.close()
+
+    def resume(self):
+        """Restart jobs left pending/running by a previous process."""
+        db = SessionLocal()
+        try:
+            ids = [row[0] for row in db.query(BackfillJob.id).filter(BackfillJob.status.in_(("pending", "running")))]
+        finally:
+            db.close()
+        for job_id in ids:
+            logging.info("history-backfill: resuming job %s", job_id)
+            self._launch(job_id)
+
+    def _launch(self, job_id: int):
+        task = self._tasks.get(job_id)
+        if task is not None and not task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = asyncio.get_event_loop()
+        self._tasks[job_id] = loop.create_task(self._run(job_id))
+
+    def stop(self):
+        # jobs stay "running" in the database and are resumed on next start
+        for task in self._tasks.values():
+            if not task.done():
+                task.cancel()
+        self._tasks.clear()
+
+    # -- job execution -----------------------------------------------------------
+
+    def _update_job(self, job_id: int, **fields):
+        db = SessionLocal()
+        try:
+            db.query(BackfillJob).filter(BackfillJob.id == job_id).update(fields, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _load_job(self, job_id: int):
+        db = SessionLocal()
+        try:
+            job = db.query(BackfillJob).filter(BackfillJob.id == job_id).first()
+            account = db.query(Account).filter(Account.id == job.account_id).first() if job else None
+            if job is not None:
+                db.expunge(job)
+            if account is not None:
+                db.expunge(account)
+            return job, account
+        finally:
+            db.close()
+
+    def _store_window(self, job_id: int, account_id: int, key: str,
+                      income: Optional[List[Dict]] = None, trades: Optional[List[Dict]] = None):
+        db = SessionLocal()
+        try:
+            job = db.query(BackfillJob).filter(BackfillJob.id == job_id).first()
+            count = store_history(db, account_id, income, trades)
+            # reassign so the JSON column is flagged as changed
+            job.completed_windows = list(job.completed_windows or []) + [key]
+            job.windows_done = (job.windows_done or 0) + 1
+            job.records = (job.records or 0) + count
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _trade_plan(self, job: BackfillJob) -> Dict[str, int]:
+        """symbol -> exclusive end of its trade backfill (where incremental sync took over).
+
+        Places a cursor starting at the job's end for symbols that have none;
+        run with the account's `account_lock` held.
+        """
+        db = SessionLocal()
+        try:
+            symbols = {
+                row[0] for row in db.query(TransactionHistory.symbol).filter(
+                    TransactionHistory.account_id == job.account_id,
+                    TransactionHistory.type.in_(TRADE_INCOME_TYPES),
+                    TransactionHistory.symbol.isnot(None),
+                    TransactionHistory.time >= datetime.utcfromtimestamp(job.start_time / 1000),
+                    TransactionHistory.time < datetime.utcfromtimestamp(job.end_time / 1000),
+                ).distinct()
+            }
+            taken_over = {}
+            for c in db.query(SyncCursor).filter(
+                SyncCursor.account_id == job.account_id,
+                SyncCursor.stream.like(TRADES_STREAM_PREFIX + '%')
+            ):
+                if c.started_from is not None:
+                    taken_over[c.stream[len(TRADES_STREAM_PREFIX):]] = c.started_from
+                else:
+                    # cursors from before started_from was recorded: best estimate of their start
+                    taken_over[c.stream[len(TRADES_STREAM_PREFIX):]] = \
+                        int((c.created_at - _EPOCH).total_seconds() * 1000) - LOOKBACK_MS
+            for symbol in symbols - set(taken_over):
+                db.add(SyncCursor(account_id=job.account_id, stream=TRADES_STREAM_PREFIX + symbol,
+                                  started_from=job.end_time))
+                taken_over[symbol] = job.end_time
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        return {s: min(job.end_time, taken_over[s]) for s in sorted(symbols)}
+
+    async def _run_windows(self, job: BackfillJob, windows: List[Tuple[str, Callable[[], Awaitable], str]]):
+        """Fetch windows concurrently and store each as it arrives; raises after all finish if any failed."""
+        sem = asyncio.Semaphore(self.concurrency)
+        # writes are serialized: windows of one order (and the job row) must not be updated concurrently
+        write_lock = asyncio.Lock()
+
+        async def _one(key: str, fetch: Callable[[], Awaitable], kind: str):
+            async with sem:
+                rows = await fetch()
+            if rows is None:
+                raise RuntimeError(f"fetch failed for window {key}")
+            async with write_lock, account_lock(job.account_id):
+                await asyncio.to_thread(self._store_window, job.id, job.account_id, key, **{kind: rows})
+
+        results = await asyncio.gather(*(_one(*w) for w in windows), return_exceptions=True)
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if errors:
+            raise errors[0]
+
+    async def _run(self, job_id: int):
+        job, account = await asyncio.to_thread(self._load_job, job_id)
+        if job is None:
+            return
+        try:
+            adapter = create_adapter_for_account(account) if account is not None else None
+            if adapter is None:
+                raise RuntimeError("account has no usable exchange credentials")
+            done = set(job.completed_windows or [])
+            slices = _windows(job.start_time, job.end_time, job.window_ms)
+            await asyncio.to_thread(self._update_job, job_id, status="running", phase="income",
+                                    windows_total=max(job.windows_total or 0, len(slices)))
+
+            income_windows = [
+                (f"income:{ws}",
+                 lambda ws=ws, we=we: adapter.fetch_income_since(ws, page_size=PAGE_SIZE, max_pages=MAX_PAGES, end_time=we),
+                 "income")
+                for ws, we in slices if f"income:{ws}" not in done
+            ]
+            await self._run_windows(job, income_windows)
+
+            async with account_lock(job.account_id):
+                plan = await asyncio.to_thread(self._trade_plan, job)
+            trade_slices = [(symbol, ws, we) for symbol, end in plan.items()
+                            for ws, we in _windows(job.start_time, end, job.window_ms)]
+            await asyncio.to_thread(self._update_job, job_id, phase="trades",
+                                    windows_total=len(slices) + len(trade_slices))
+            trade_windows = [
+                (f"trades:{symbol}:{ws}",
+                 lambda symbol=symbol, ws=ws, we=we: adapter.fetch_user_trades_since(
+                     symbol, start_time=ws, end_time=we, page_size=PAGE_SIZE, max_pages=MAX_PAGES),
+                 "trades")
+                for symbol, ws, we in trade_slices if f"trades:{symbol}:{ws}" not in done
+            ]
+            await self._run_windows(job, trade_windows)
+
+            await asyncio.to_thread(self._update_job, job_id, status="completed", finished_at=datetime.utcnow())
+            logging.info("history-backfill: job %s for account %s completed", job_id, job.account_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.exception("history-backfill: job %s failed", job_id)
+            await asyncio.to_thread(self._update_job, job_id, status="failed", error=str(e)[:500])
+
+
+def get_backfill_from_env() -> HistoryBackfillService:
+    return HistoryBackfillService(
+        concurrency=int(os.getenv("HISTORY_BACKFILL_CONCURRENCY", "4")),
+        window_days=float(os.getenv("HISTORY_BACKFILL_WINDOW_DAYS", "7")),
+    )
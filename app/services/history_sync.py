@@ -0,0 +1,324 @@
+"""Incremental, cursor-based fetch of an account's income and trade history.
+
+Each account keeps one SyncCursor per stream: "income" (last time/tranId)
+and "trades:<SYMBOL>" (last time/trade id; /fapi/v1/userTrades is per
+symbol). A sync pages forward from the cursors until caught up, so it only
+ever fetches new records, however busy the account is. Streams without a
+cursor start HISTORY_SYNC_LOOKBACK_DAYS back, and the cursor records that
+start in `started_from` so a backfill can end exactly where sync took over.
+
+Trades are fetched for symbols with an active position plus symbols that
+appear in the new COMMISSION / REALIZED_PNL income (every fill produces
+one), so closed-out symbols are not polled forever.
+
+Cursors are written with `save_cursors` in the same transaction as the
+records they cover. Everything that reads cursors and folds fills into
+ORDER_ aggregates (regular sync, the sync routes, stream fills, backfill
+windows) runs under the account's `account_lock`, so two syncs of one
+account can never fetch the same fills and add them twice.
+
+`store_history` is the one ingestion path for fetched
+records (background sync and the sync route): existence is resolved per
+batch with `transaction_id IN (...)` lookups, new rows are bulk-inserted and
+existing order aggregates bulk-updated, so a batch costs a few statements
+regardless of its size.
+"""
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.database import SessionLocal
+from app.models.risk_control import Position, SyncCursor, TransactionHistory
+
+
+INCOME_STREAM = "income"
+TRADES_STREAM_PREFIX = "trades:"
+TRADE_INCOME_TYPES = ("COMMISSION", "REALIZED_PNL")
+
+# /fapi/v1/userTrades returns at most this span after startTime
+TRADES_RANGE_MS = 7 * 86_400_000
+LOOKBACK_MS = int(float(os.getenv("HISTORY_SYNC_LOOKBACK_DAYS", "7")) * 86_400_000)
+PAGE_SIZE = int(os.getenv("HISTORY_SYNC_PAGE_SIZE", "1000"))
+MAX_PAGES = int(os.getenv("HISTORY_SYNC_MAX_PAGES", "50"))
+# transaction ids per existence lookup (keeps IN lists well under packet limits)
+LOOKUP_CHUNK = 1000
+
+
+# runs named exchange calls (capped and timed per account), returns name -> result
+CallRunner = Callable[[Dict[str, Callable[[], Awaitable]]], Awaitable[Dict[str, object]]]
+
+# account id -> lock serializing history writes for the account in this process
+_account_locks: Dict[int, asyncio.Lock] = {}
+
+
+def account_lock(account_id: int) -> asyncio.Lock:
+    lock = _account_locks.get(account_id)
+    if lock is None:
+        lock = _account_locks[account_id] = asyncio.Lock()
+    return lock
+
+
+class HistoryBatch(NamedTuple):
+    income: Optional[List[Dict]]  # None when the income fetch failed
+    trades: List[Dict]
+    # stream -> (last_time ms, last_id) covered by this batch
+    cursors: Dict[str, Tuple[int, int]]
+    # symbols fetched from the lookback window (no trade cursor yet): their stored
+    # order aggregates predate cursors and are replaced rather than added to
+    fresh_symbols: Set[str]
+    # exchange time (ms) streams without a cursor were fetched from
+    lookback_start: int
+    # stream -> new started_from of backfill-placed cursors whose next range had no trades
+    skipped_starts: Dict[str, int]
+
+
+def _load_state_sync(account_id: int) -> Tuple[Dict[str, Tuple[Optional[int], Optional[int], Optional[int]]], Set[str]]:
+    db = SessionLocal()
+    try:
+        cursors = {
+            c.stream: (c.last_time, c.last_id, c.started_from)
+            for c in db.query(SyncCursor).filter(SyncCursor.account_id == account_id)
+        }
+        symbols = {
+            row[0] for row in db.query(Position.symbol).filter(
+                Position.account_id == account_id, Position.is_active == True
+            ).distinct()
+        }
+        return cursors, symbols
+    finally:
+        db.close()
+
+
+async def fetch_new_history(adapter, account_id: int, run_calls: CallRunner) -> HistoryBatch:
+    """Fetch income and trades recorded since the account's cursors.
+
+    Exchange calls go through `run_calls` ("income_history", then one
+    "user_trades:<SYMBOL>" per symbol). Call with `account_lock` held.
+    """
+    cursors, symbols = await asyncio.to_thread(_load_state_sync, account_id)
+    now_ms = int(time.time() * 1000)
+    default_start = now_ms - LOOKBACK_MS
+    new_cursors: Dict[str, Tuple[int, int]] = {}
+
+    income_cursor = cursors.get(INCOME_STREAM)
+    start = income_cursor[0] if income_cursor and income_cursor[0] else default_start
+    income = (await run_calls({
+        "income_history": lambda: adapter.fetch_income_since(start, page_size=PAGE_SIZE, max_pages=MAX_PAGES)
+    }))["income_history"]
+    if income:
+        last = max(income, key=lambda i: (int(i["time"]), int(i.get("tranId") or 0)))
+        new_cursors[INCOME_STREAM] = (int(last["time"]), int(last.get("tranId") or 0))
+        symbols |= {i["symbol"] for i in income if i.get("symbol") and i.get("incomeType") in TRADE_INCOME_TYPES}
+
+    def _symbol_trades(symbol: str):
+        cursor = cursors.get(TRADES_STREAM_PREFIX + symbol)
+        if cursor and cursor[1] is not None:
+            return lambda: adapter.fetch_user_trades_since(symbol, from_id=cursor[1] + 1,
+                                                           page_size=PAGE_SIZE, max_pages=MAX_PAGES)
+        # a cursor without a trade yet was placed by a backfill, which ends at its start
+        start_time = cursor[2] if cursor and cursor[2] is not None else default_start
+        return lambda: adapter.fetch_user_trades_since(symbol, start_time=start_time,
+                                                       page_size=PAGE_SIZE, max_pages=MAX_PAGES)
+
+    trades: List[Dict] = []
+    fresh: Set[str] = set()
+    skipped: Dict[str, int] = {}
+    fetched = await run_calls({f"user_trades:{s}": _symbol_trades(s) for s in sorted(symbols)}) if symbols else {}
+    for name, rows in fetched.items():
+        symbol = name.split(":", 1)[1]
+        cursor = cursors.get(TRADES_STREAM_PREFIX + symbol)
+        if rows == [] and cursor and cursor[1] is None and cursor[2] is not None \
+                and cursor[2] + TRADES_RANGE_MS < now_ms:
+            # the whole range after started_from is empty; move on or an idle symbol never reaches the present
+            skipped[TRADES_STREAM_PREFIX + symbol] = cursor[2] + TRADES_RANGE_MS
+        if not rows:
+            continue
+        trades.extend(rows)
+        last = max(rows, key=lambda t: int(t["id"]))
+        new_cursors[TRADES_STREAM_PREFIX + symbol] = (int(last["time"]), int(last["id"]))
+        if TRADES_STREAM_PREFIX + symbol not in cursors:
+            fresh.add(symbol)
+    return HistoryBatch(income, trades, new_cursors, fresh, default_start, skipped)
+
+
+def _store_batch_sync(account_id: int, batch: HistoryBatch) -> int:
+    db = SessionLocal()
+    try:
+        count = store_history(db, account_id, batch.income, batch.trades, batch.fresh_symbols)
+        save_cursors(db, account_id, batch.cursors, started_from=batch.lookback_start)
+        for stream, started_from in batch.skipped_starts.items():
+            db.query(SyncCursor).filter(
+                SyncCursor.account_id == account_id, SyncCursor.stream == stream, SyncCursor.last_id.is_(None)
+            ).update({"started_from": started_from}, synchronize_session=False)
+        db.commit()
+        return count
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def sync_account_history(adapter, account_id: int, run_calls: CallRunner) -> int:
+    """Fetch and store the account's new history under its lock; returns new records."""
+    async with account_lock(account_id):
+        batch = await fetch_new_history(adapter, account_id, run_calls)
+        return await asyncio.to_thread(_store_batch_sync, account_id, batch)
+
+
+def save_cursors(db: Session, account_id: int, cursors: Dict[str, Tuple[int, int]],
+                 started_from: Optional[int] = None):
+    """Advance the account's cursors on `db`; the caller commits with the records.
+
+    Cursors created here record `started_from`, the time their stream was
+    first fetched from.
+    """
+    if not cursors:
+        return
+    existing = {
+        c.stream: c for c in db.query(SyncCursor).filter(
+            SyncCursor.account_id == account_id, SyncCursor.stream.in_(list(cursors))
+        )
+    }
+    for stream, (last_time, last_id) in cursors.items():
+        cursor = existing.get(stream)
+        if cursor is None:
+            db.add(SyncCursor(account_id=account_id, stream=stream, last_time=last_time, last_id=last_id,
+                              started_from=started_from))
+        else:
+            cursor.last_time = last_time
+            cursor.last_id = last_id
+
+
+def _aggregate_trades(trades: Iterable[Dict]) -> Dict[str, Dict]:
+    """Fold fills into one aggregate per orderId, keyed by its transaction id."""
+    aggregated: Dict[str, Dict] = {}
+    for trade in trades:
+        oid = str(trade.get('orderId'))
+        if not oid:
+            continue
+        qty = float(trade.get('qty', 0))
+        item = aggregated.get(f"ORDER_{oid}")
+        if item is None:
+            aggregated[f"ORDER_{oid}"] = {
+                'order_id': oid,
+                'symbol': trade.get('symbol'),
+                'side': trade.get('side'),
+                'price_sum': float(trade.get('price', 0)) * qty,
+                'qty': qty,
+                'quote_qty': float(trade.get('quoteQty', 0)),
+                'commission': float(trade.get('commission', 0)),
+                'commission_asset': trade.get('commissionAsset'),
+                'realized_pnl': float(trade.get('realizedPnl', 0)),
+                'time': trade.get('time')
+            }
+        else:
+            item['price_sum'] += float(trade.get('price', 0)) * qty
+            item['qty'] += qty
+            item['quote_qty'] += float(trade.get('quoteQty', 0))
+            item['commission'] += float(trade.get('commission', 0))
+            item['realized_pnl'] += float(trade.get('realizedPnl', 0))
+            item['time'] = max(item['time'], trade.get('time'))
+    return aggregated
+
+
+def _existing(db: Session, transaction_ids: List[str]) -> Dict[str, object]:
+    """transaction_id -> stored row (id and aggregate columns) for the ids that exist."""
+    found = {}
+    for i in range(0, len(transaction_ids), LOOKUP_CHUNK):
+        chunk = transaction_ids[i:i + LOOKUP_CHUNK]
+        for row in db.query(
+            TransactionHistory.id, TransactionHistory.transaction_id, TransactionHistory.price,
+            TransactionHistory.qty, TransactionHistory.quote_qty, TransactionHistory.commission,
+            TransactionHistory.realized_pnl, TransactionHistory.time
+        ).filter(TransactionHistory.transaction_id.in_(chunk)):
+            found[row.transaction_id] = row
+    return found
+
+
+def store_history(db: Session, account_id: int, income: Optional[List[Dict]], trades: Optional[List[Dict]],
+                  fresh_symbols: Iterable[str] = ()) -> int:
+    """Stage fetched income and trades on `db`; returns the number of new records.
+
+    Income records are insert-only (keyed by tranId). Trades are aggregated
+    per order into ORDER_<orderId> records; fills for an order that already
+    exists are added to it, except for `fresh_symbols`, whose stored
+    aggregates are replaced. The caller commits.
+
+    Existence is looked up rather than left to ON DUPLICATE KEY UPDATE: the
+    fold-or-replace choice is per row and needs the stored aggregate, and the
+    new-record count is what callers report. The lookup-then-write is only
+    safe with the account's `account_lock` held.
+    """
+    fresh_symbols = set(fresh_symbols)
+    income_rows: Dict[str, Dict] = {}
+    for item in income or ():
+        tran_id = item.get('tranId')
+        if not tran_id:
+            continue
+        income_rows[str(tran_id)] = {
+            'account_id': account_id,
+            'symbol': item.get('symbol'),
+            'type': item.get('incomeType'),
+            'commission_asset': item.get('asset'),
+            'realized_pnl': float(item.get('income')),
+            'time': datetime.utcfromtimestamp(item.get('time') / 1000),
+            'transaction_id': str(tran_id),
+        }
+    orders = _aggregate_trades(trades or ())
+
+    existing = _existing(db, list(income_rows) + list(orders))
+    now = datetime.utcnow()
+    inserts = [row for tid, row in income_rows.items() if tid not in existing]
+    updates = []
+    for tid, data in orders.items():
+        avg_price = data['price_sum'] / data['qty'] if data['qty'] > 0 else 0
+        time_ = datetime.utcfromtimestamp(data['time'] / 1000)
+        row = existing.get(tid)
+        if row is None:
+            inserts.append({
+                'account_id': account_id,
+                'symbol': data['symbol'],
+                'type': "TRADE",
+                'side': data['side'],
+                'price': avg_price,
+                'qty': data['qty'],
+                'quote_qty': data['quote_qty'],
+                'commission': data['commission'],
+                'commission_asset': data['commission_asset'],
+                'realized_pnl': data['realized_pnl'],
+                'time': time_,
+                'order_id': data['order_id'],
+                'transaction_id': tid,
+            })
+        elif data['symbol'] in fresh_symbols:
+            updates.append({
+                'id': row.id, 'price': avg_price, 'qty': data['qty'], 'quote_qty': data['quote_qty'],
+                'commission': data['commission'], 'realized_pnl': data['realized_pnl'], 'time': time_,
+                'updated_at': now,
+            })
+        else:
+            # fills after the trade cursor: fold them into the stored order
+            qty = (row.qty or 0) + data['qty']
+            updates.append({
+                'id': row.id,
+                'price': ((row.price or 0) * (row.qty or 0) + data['price_sum']) / qty if qty > 0 else 0,
+                'qty': qty,
+                'quote_qty': (row.quote_qty or 0) + data['quote_qty'],
+                'commission': (row.commission or 0) + data['commission'],
+                'realized_pnl': (row.realized_pnl or 0) + data['realized_pnl'],
+                'time': max(row.time, time_),
+                'updated_at': now,
+            })
+
+    if inserts:
+        for row in inserts:
+            row['created_at'] = row['updated_at'] = now
+        db.bulk_insert_mappings(TransactionHistory, inserts)
+    if updates:
+        db.bulk_update_mappings(TransactionHistory, updates)
+    return len(inserts)
@@ -0,0 +1,186 @@
+"""Streaming mark-price engine (Binance futures combined WebSocket streams).
+
+Alternative to the REST poll loop in MarketDataService: subscribes to
+`<symbol>@markPrice@1s` for exactly the symbols held by active positions,
+re-subscribes as positions open/close, reconnects with exponential backoff and
+feeds prices into the same `_apply_prices` path the poller uses.
+
+Symbols without stream data (spot-only symbols or gaps after a reconnect) are
+covered by a REST fetch at the regular poll interval.
+
+Point MARKET_STREAM_URL at scripts/fake_mark_price_server.py to run it
+against a local stand-in server.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, List, Set
+
+import websockets
+
+from app.services.market_data import MarketDataService
+from app.services.stream_reconnect import reconnect_loop
+from app.services.symbol_routing import INVALID, SPOT
+
+
+class MarkPriceStreamService(MarketDataService):
+    STREAM_URL = "wss://fstream.binance.com/stream"
+    # Binance accepts up to 1024 streams per connection; keep each request small
+    SUBSCRIBE_CHUNK = 100
+
+    def __init__(self, stream_url: str | None = None, refresh_interval: float = 5.0,
+                 flush_interval: float = 1.0, stream_speed: str = "1s",
+                 backoff_base: float = 1.0, backoff_max: float = 60.0, **kwargs):
+        super().__init__(**kwargs)
+        self.stream_url = stream_url or self.STREAM_URL
+        self.refresh_interval = refresh_interval
+        self.flush_interval = flush_interval
+        # "1s" -> <symbol>@markPrice@1s, anything else -> <symbol>@markPrice (3s)
+        self.stream_suffix = "@markPrice@1s" if stream_speed == "1s" else "@markPrice"
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._ws = None
+        self._subscribed: Set[str] = set()
+        self._by_symbol: Dict[str, List[int]] = {}
+        # latest un-applied price per symbol, drained by the flush loop
+        self._pending: Dict[str, float] = {}
+        self._last_update: Dict[str, float] = {}
+        self._last_rest_poll = 0.0
+        self._request_id = 0
+        self.stats.update({
+            "stream_connects": 0,
+            "stream_messages": 0,
+            "stream_flushes": 0,
+            "stream_rest_fallbacks": 0,
+        })
+
+    def _stream_name(self, symbol: str) -> str:
+        return f"{symbol.lower()}{self.stream_suffix}"
+
+    async def _send_method(self, method: str, symbols: List[str]):
+        for i in range(0, len(symbols), self.SUBSCRIBE_CHUNK):
+            chunk = symbols[i:i + self.SUBSCRIBE_CHUNK]
+            self._request_id += 1
+            await self._ws.send(json.dumps({
+                "method": method,
+                "params": [self._stream_name(s) for s in chunk],
+                "id": self._request_id,
+            }))
+
+    async def _resubscribe(self):
+        """Sync the subscription set with the symbols of active positions."""
+        self._by_symbol = await self._load_symbol_map()
+        desired = {
+            s for s in self._by_symbol
+            if self.router.lookup(s) not in (SPOT, INVALID)
+        }
+        added = sorted(desired - self._subscribed)
+        removed = sorted(self._subscribed - desired)
+        if added:
+            await self._send_method("SUBSCRIBE", added)
+        if removed:
+            await self._send_method("UNSUBSCRIBE", removed)
+            for s in removed:
+                self._pending.pop(s, None)
+                self._last_update.pop(s, None)
+        if added or removed:
+            logging.info("mark-price-stream: subscribed=%s (+%s -%s)", len(desired), len(added), len(removed))
+        self._subscribed = desired
+
+    async def _rest_fallback(self):
+        """Fetch via REST the held symbols that the stream is not covering."""
+        now = time.monotonic()
+        if now - self._last_rest_poll < self.poll_interval:
+            return
+        self._last_rest_poll = now
+        stale_after = max(self.poll_interval, self.refresh_interval)
+        stale = [
+            s for s in self._by_symbol
+            if now - self._last_update.get(s, 0.0) > stale_after
+        ]
+        if not stale:
+            return
+        self.stats["stream_rest_fallbacks"] += 1
+        prices = await self.fetch_prices(stale)
+        if self.router.persist:
+            await asyncio.to_thread(self.router.flush)
+        for symbol, price in prices.items():
+            self._pending[symbol] = price
+            self._last_update[symbol] = now
+
+    def _handle_message(self, raw):
+        try:
+            msg = json.loads(raw)
+        except ValueError:
+            return
+        # combined streams wrap the payload as {"stream": ..., "data": {...}}
+        data = msg.get("data", msg) if isinstance(msg, dict) else None
+        if not isinstance(data, dict) or data.get("e") != "markPriceUpdate":
+            return
+        try:
+            symbol = data["s"]
+            price = float(data["p"])
+        except (KeyError, TypeError, ValueError):
+            return
+        self.stats["stream_messages"] += 1
+        self._quote_meta[symbol] = (f"{self.source_label}:mark", data.get("E"))
+        self._pending[symbol] = price
+        self._last_update[symbol] = time.monotonic()
+
+    async def _flush_loop(self):
+        while self._running:
+            await asyncio.sleep(self.flush_interval)
+            if not self._pending:
+                continue
+            pending, self._pending = self._pending, {}
+            self.stats["stream_flushes"] += 1
+            try:
+                await self._apply_prices(self._by_symbol, pending)
+            except Exception:
+                logging.exception("mark-price-stream: error applying prices")
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self._resubscribe()
+                await self._rest_fallback()
+            except Exception:
+                logging.exception("mark-price-stream: refresh failed")
+
+    async def _run_stream(self):
+        async with websockets.connect(self.stream_url, ping_interval=20, ping_timeout=20) as ws:
+            self._ws = ws
+            self._subscribed = set()
+            self.stats["stream_connects"] += 1
+            logging.info("mark-price-stream: connected to %s", self.stream_url)
+            await self._resubscribe()
+            refresh = asyncio.create_task(self._refresh_loop())
+            try:
+                async for raw in ws:
+                    self._handle_message(raw)
+            finally:
+                refresh.cancel()
+                self._ws = None
+
+    async def poller(self):
+        self._running = True
+        logging.info("mark-price-stream: started (url=%s)", self.stream_url)
+        await asyncio.to_thread(self.router.load)
+        flush = asyncio.create_task(self._flush_loop())
+
+        async def _fallback():
+            # keep prices flowing over REST while the stream is down
+            try:
+                self._by_symbol = await self._load_symbol_map()
+                await self._rest_fallback()
+            except Exception:
+                logging.exception("mark-price-stream: REST fallback failed")
+
+        try:
+            await reconnect_loop(self._run_stream, lambda: self._running, "mark-price-stream",
+                                 self.backoff_base, self.backoff_max, on_disconnect=_fallback)
+        finally:
+            flush.cancel()
@@ -1,14 +1,26 @@
 import asyncio
+import contextlib
+import json
 import logging
 import os
-from typing import List
+import time
+from typing import Dict, List, Tuple
 
 import httpx
 
 from app.core.database import SessionLocal
-from app.models.risk_control import Position, RiskConfig, TickerHistory
+from app.services.exchange.rate_limit import governed_get
+from app.models.risk_control import Position, RiskLevelEnum, TickerHistory
 from datetime import datetime
+from app.services.poll_scheduler import RISK_ORDER, SymbolScheduler
+from app.services.price_cache import price_cache
+from app.services.price_source import PriceSource, get_price_source_from_env
+from app.services.risk_config_cache import risk_config_cache
 from app.services.risk_control_service import RiskControlService
+from app.services.symbol_routing import FUTURES, INVALID, SPOT, SymbolRouter
+from app.services.tick_store import TickStore
+from app.services.ticker_rollup import TickerRollup
+from app.services.ticker_writer import TickerHistoryWriter
 from app.services.ws_broadcast import manager as ws_manager
 
 
@@ -21,58 +33,287 @@ class MarketDataService:
 
     BINANCE_TICKER = "https://api.binance.com/api/v3/ticker/price?symbol={symbol}"
     BINANCE_FAPI_TICKER = "https://fapi.binance.com/fapi/v1/ticker/price?symbol={symbol}"
+    # all-symbols variants: one request returns every symbol's price
+    BINANCE_TICKER_ALL = "https://api.binance.com/api/v3/ticker/price"
+    BINANCE_FAPI_TICKER_ALL = "https://fapi.binance.com/fapi/v1/ticker/price"
 
-    def __init__(self, poll_interval: int = 10):
+    PRICE_MODES = ("auto", "bulk", "symbol")
+
+    def __init__(self, poll_interval: int = 10, max_connections: int = 20, http2: bool = True,
+                 price_mode: str = "auto", bulk_threshold: int = 5, router: SymbolRouter | None = None,
+                 ticker_writer: TickerHistoryWriter | None = None, rollup: TickerRollup | None = None,
+                 deadband_abs: float = 0.0, deadband_rel: float = 0.0, max_silence: float = 60.0,
+                 deadband_overrides: Dict[str, dict] | None = None,
+                 scheduler: SymbolScheduler | None = None,
+                 cycle_budget: float | None = None, shed_keep_level: RiskLevelEnum = RiskLevelEnum.HIGH,
+                 price_source: PriceSource | None = None, tick_store: TickStore | None = None):
         self.poll_interval = poll_interval
+        # "bulk" always uses the all-symbols endpoints, "symbol" always fetches per symbol,
+        # "auto" switches to bulk once bulk_threshold distinct symbols are held
+        self.price_mode = price_mode if price_mode in self.PRICE_MODES else "auto"
+        self.bulk_threshold = bulk_threshold
+        self.router = router or SymbolRouter()
+        # optional write-behind buffer for ticker_history; None inserts inline
+        self.ticker_writer = ticker_writer
+        # optional OHLC rollup maintained from one tick per symbol per update
+        self.rollup = rollup
+        # deadband: a symbol's update is written/broadcast only when the price moved by at
+        # least the absolute or relative threshold, or max_silence seconds have passed.
+        # With both thresholds at 0 only unchanged prices are suppressed.
+        self.deadband_abs = deadband_abs
+        self.deadband_rel = deadband_rel
+        self.max_silence = max_silence
+        self.deadband_overrides = {
+            self.normalize_symbol(sym): cfg for sym, cfg in (deadband_overrides or {}).items()
+        }
+        # symbol -> (last emitted price, monotonic time, position ids it was applied to)
+        self._last_emitted: Dict[str, Tuple[float, float, frozenset]] = {}
+        # optional per-symbol adaptive cadence; None polls everything every poll_interval
+        self.scheduler = scheduler
+        self.symbol_risk: Dict[str, RiskLevelEnum] = {}
+        self._symbol_map: Dict[str, List[int]] = {}
+        self._symbol_map_loaded_at = float("-inf")
+        # while cycles run longer than cycle_budget, symbols below shed_keep_level are shed
+        self.cycle_budget = cycle_budget if cycle_budget else poll_interval * 0.8
+        self.shed_keep_level = shed_keep_level
+        # whether the previous cycle overran; the next one sheds before fetching
+        self._overrun = False
+        # offline source (synthetic / replay) replacing the Binance REST fetch; None = live
+        self.price_source = price_source
+        # optional local columnar tick store (memory-mapped arrays) for analytics
+        self.tick_store = tick_store
+        self.source_label = price_source.name if price_source else os.getenv("MARKET_DATA_SOURCE", "binance")
+        # symbol -> (source, exchange timestamp ms) of the latest fetched quote
+        self._quote_meta: Dict[str, Tuple[str, int | None]] = {}
+        self.max_connections = max_connections
+        self.http2 = http2
         self._task = None
         self._running = False
+        # long-lived keep-alive pool, created in start() and closed in stop()
+        self._client: httpx.AsyncClient | None = None
+        self.stats: Dict[str, float] = {
+            "http_requests": 0,
+            "http_connections_opened": 0,
+            # unique symbols fetched vs. requests avoided by per-symbol dedup
+            "symbols_fetched": 0,
+            "fetches_saved": 0,
+            "bulk_cycles": 0,
+            "bulk_requests": 0,
+            # symbols skipped because they are negatively cached as invalid
+            "route_invalid_skips": 0,
+            # per-symbol price updates written/broadcast vs. dropped by the deadband
+            "updates_emitted": 0,
+            "updates_suppressed": 0,
+            # loop health: cycle duration, start lag vs. deadline, overruns and shedding
+            "cycles": 0,
+            "cycle_overruns": 0,
+            "deadlines_missed": 0,
+            "symbols_shed": 0,
+            "last_cycle_seconds": 0.0,
+            "max_cycle_seconds": 0.0,
+            "last_lag_seconds": 0.0,
+            "max_lag_seconds": 0.0,
+        }
 
-    async def fetch_price(self, symbol: str) -> float | None:
+    def _create_client(self) -> httpx.AsyncClient:
+        """Build the pooled client used for all ticker requests.
+
+        HTTP/2 is only enabled when the optional `h2` package is installed.
+        """
+        http2 = self.http2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                http2 = False
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_connections,
+            keepalive_expiry=max(30.0, self.poll_interval * 3),
+        )
+        return httpx.AsyncClient(timeout=10.0, limits=limits, http2=http2)
+
+    async def _trace(self, event_name: str, info: dict):
+        # httpcore emits connect_tcp only when a new connection is opened; every
+        # other request on the pool is served by a reused keep-alive connection.
+        if event_name == "connection.connect_tcp.complete":
+            self.stats["http_connections_opened"] += 1
+
+    async def _get(self, client: httpx.AsyncClient, url: str) -> httpx.Response:
+        self.stats["http_requests"] += 1
+        # shares the per-IP weight budget with the account sync (see exchange/rate_limit.py)
+        return await governed_get(client, url, extensions={"trace": self._trace})
+
+    def get_stats(self) -> Dict[str, float]:
+        stats = dict(self.stats)
+        stats["http_connections_reused"] = max(0, stats["http_requests"] - stats["http_connections_opened"])
+        return stats
+
+    @staticmethod
+    def normalize_symbol(symbol: str) -> str:
         # Binance expects uppercase symbol like BTCUSDT; support formats like BTC/USDT
-        if "/" in symbol:
-            sym = symbol.replace("/", "")
-        else:
-            sym = symbol
-        sym = sym.upper()
+        return symbol.replace("/", "").upper()
 
-        # Prefer the futures (fapi) ticker for perpetual/symbols that may be futures-only.
-        # Fall back to the spot endpoint if fapi returns invalid symbol / 400.
-        fapi_url = self.BINANCE_FAPI_TICKER.format(symbol=sym)
-        spot_url = self.BINANCE_TICKER.format(symbol=sym)
+    @staticmethod
+    def _is_invalid_symbol(r: httpx.Response) -> bool:
+        return r.status_code == 400 and bool(r.text) and 'Invalid symbol' in r.text
 
+    async def fetch_price(self, symbol: str) -> float | None:
+        sym = self.normalize_symbol(symbol)
+
+        route = self.router.lookup(sym)
+        if route == INVALID:
+            self.stats["route_invalid_skips"] += 1
+            return None
+
+        # Probe the learned market first; unknown symbols try futures (perpetual /
+        # futures-only symbols) before spot. A market is only ruled out when it
+        # answers "Invalid symbol"; other errors are treated as transient.
+        urls = {FUTURES: self.BINANCE_FAPI_TICKER, SPOT: self.BINANCE_TICKER}
+        order = [route] if route else []
+        order += [m for m in (FUTURES, SPOT) if m != route]
+
+        # reuse the pooled client; fall back to a one-off client when the service
+        # has not been started (e.g. ad-hoc calls from scripts)
+        client = self._client
+        owns_client = client is None
+        if owns_client:
+            client = self._create_client()
+
+        rejected = 0
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                # try fapi first
-                r = await client.get(fapi_url)
-                if r.status_code == 200:
-                    data = r.json()
-                    return float(data.get("price"))
-
-                # if fapi says invalid symbol, try spot as a fallback
-                if r.status_code == 400 and r.text and 'Invalid symbol' in r.text:
-                    logging.debug("market-data: futures API returned Invalid symbol for %s, trying spot endpoint", sym)
-                    try:
-                        r2 = await client.get(spot_url)
-                        if r2.status_code == 200:
-                            data = r2.json()
-                            return float(data.get("price"))
-                    except Exception:
-                        pass
-
-                # if fapi returned something else (not 200), attempt spot too as a safeguard
-                try:
-                    r2 = await client.get(spot_url)
-                    if r2.status_code == 200:
-                        data = r2.json()
+            async with contextlib.AsyncExitStack() as stack:
+                if owns_client:
+                    await stack.enter_async_context(client)
+                for market in order:
+                    r = await self._get(client, urls[market].format(symbol=sym))
+                    if r.status_code == 200:
+                        data = r.json()
+                        self.router.learn(sym, market)
+                        self._quote_meta[sym] = (f"{self.source_label}:{market}", data.get("time"))
                         return float(data.get("price"))
-                except Exception:
-                    pass
+                    if self._is_invalid_symbol(r):
+                        logging.debug("market-data: %s API returned Invalid symbol for %s", market, sym)
+                        rejected += 1
+                        continue
+                    if route:
+                        # known route hit a transient error; don't probe other markets
+                        logging.debug("market-data: %s ticker for %s returned status %s", market, sym, r.status_code)
+                        return None
         except Exception:
             # swallow temporary network errors, return None
             return None
 
+        if rejected == len(order):
+            self.router.learn(sym, INVALID)
         return None
 
+    async def _fetch_bulk_map(self, client: httpx.AsyncClient, url: str) -> Dict[str, Tuple[float, int | None]]:
+        """Fetch an all-symbols ticker endpoint and parse it into a
+        symbol -> (price, exchange time) map."""
+        self.stats["bulk_requests"] += 1
+        r = await self._get(client, url)
+        if r.status_code != 200:
+            logging.warning("market-data: bulk ticker %s returned status %s", url, r.status_code)
+            return {}
+        prices = {}
+        for item in r.json():
+            try:
+                prices[item["symbol"]] = (float(item["price"]), item.get("time"))
+            except (KeyError, TypeError, ValueError):
+                continue
+        return prices
+
+    async def fetch_prices_bulk(self, symbols: List[str]) -> Dict[str, float]:
+        """Resolve prices for `symbols` with at most one futures and one spot request.
+
+        Spot is only queried for symbols routed to spot or not listed on futures;
+        futures is skipped entirely when every symbol is known to be spot-only.
+        """
+        wanted = set()
+        for s in symbols:
+            sym = self.normalize_symbol(s)
+            if self.router.lookup(sym) == INVALID:
+                self.stats["route_invalid_skips"] += 1
+                continue
+            wanted.add(sym)
+        if not wanted:
+            return {}
+
+        client = self._client
+        owns_client = client is None
+        if owns_client:
+            client = self._create_client()
+
+        result: Dict[str, float] = {}
+        try:
+            async with contextlib.AsyncExitStack() as stack:
+                if owns_client:
+                    await stack.enter_async_context(client)
+                spot_only = {s for s in wanted if self.router.lookup(s) == SPOT}
+                futures_ok = True
+                missing = set(spot_only)
+                if wanted - spot_only:
+                    futures = await self._fetch_bulk_map(client, self.BINANCE_FAPI_TICKER_ALL)
+                    futures_ok = bool(futures)
+                    for s in wanted - spot_only:
+                        if s in futures:
+                            result[s], exchange_ts = futures[s]
+                            self._quote_meta[s] = (f"{self.source_label}:{FUTURES}", exchange_ts)
+                            self.router.learn(s, FUTURES)
+                        else:
+                            missing.add(s)
+                if missing:
+                    spot = await self._fetch_bulk_map(client, self.BINANCE_TICKER_ALL)
+                    for s in missing:
+                        if s in spot:
+                            result[s], exchange_ts = spot[s]
+                            self._quote_meta[s] = (f"{self.source_label}:{SPOT}", exchange_ts)
+                            self.router.learn(s, SPOT)
+                        elif spot and futures_ok:
+                            # both full listings came back and neither knows the symbol
+                            self.router.learn(s, INVALID)
+        except Exception:
+            logging.exception("market-data: bulk price fetch failed")
+        return result
+
+    def _use_bulk(self, symbol_count: int) -> bool:
+        if self.price_mode == "bulk":
+            return True
+        if self.price_mode == "symbol":
+            return False
+        return symbol_count >= self.bulk_threshold
+
+    async def fetch_prices(self, symbols: List[str]) -> Dict[str, float]:
+        """Return a normalized symbol -> price map, choosing bulk or per-symbol mode."""
+        symbols = list({self.normalize_symbol(s) for s in symbols})
+        if not symbols:
+            return {}
+
+        if self.price_source is not None:
+            prices = await self.price_source.fetch(symbols)
+            for symbol in prices:
+                self._quote_meta[symbol] = (self.source_label, self.price_source.exchange_ts(symbol))
+            return prices
+
+        if self._use_bulk(len(symbols)):
+            self.stats["bulk_cycles"] += 1
+            return await self.fetch_prices_bulk(symbols)
+
+        async def _fetch_with_symbol(symbol: str):
+            return symbol, await self.fetch_price(symbol)
+
+        results = await asyncio.gather(*(_fetch_with_symbol(s) for s in symbols), return_exceptions=True)
+        prices: Dict[str, float] = {}
+        for res in results:
+            if isinstance(res, Exception):
+                logging.error("market-data: error fetching price: %s", res)
+                continue
+            symbol, price = res
+            if price is not None:
+                prices[symbol] = price
+        return prices
+
     def _get_active_positions(self) -> List[Position]:
         db = SessionLocal()
         try:
@@ -81,100 +322,309 @@ class MarketDataService:
         finally:
             db.close()
 
-    def _update_position_sync(self, position_id: int, price: float) -> dict | None:
+    def _apply_prices_sync(self, updates: Dict[int, float]) -> Tuple[List[dict], List[dict]]:
+        """Apply a whole cycle's (position id -> price) results in one transaction.
+
+        Loads the positions and their account risk configs with one query each,
+        then writes one bulk UPDATE for positions and commits once. Ticker history
+        rows are inserted in the same transaction only when no write-behind
+        writer is configured. Returns (broadcast summaries, ticker rows).
+        """
+        if not updates:
+            return [], []
         db = SessionLocal()
         try:
-            position = db.query(Position).filter(Position.id == position_id).first()
-            if not position:
-                return None
-
-            position.current_price = price
-            position.unrealized_pnl = (price - position.entry_price) * position.size
+            positions = db.query(Position).filter(Position.id.in_(list(updates))).all()
+            if not positions:
+                return [], []
 
-            # recompute risk_level by loading config and using RiskControlService
-            risk_config = db.query(RiskConfig).filter(
-                RiskConfig.account_id == position.account_id,
-                RiskConfig.is_active == True
-            ).first()
+            # served from the in-process config cache; only misses hit the DB
+            risk_configs = risk_config_cache.get_many({p.account_id for p in positions}, db)
 
-            if risk_config:
-                svc = RiskControlService(db)
-                # use the service's calculate_risk_level which expects Position object
-                position.risk_level = svc.calculate_risk_level(position, risk_config)
+            svc = RiskControlService(db)
+            now = datetime.utcnow()
+            source = self.source_label
+            position_rows = []
+            ticker_rows = []
+            summaries = []
+            for position in positions:
+                price = updates[position.id]
+                unrealized_pnl = (price - position.entry_price) * position.size
+                risk_level = position.risk_level
+                risk_config = risk_configs.get(position.account_id)
+                if risk_config:
+                    risk_level = svc.calculate_risk_level_at(price, position.entry_price, position.size, risk_config)
 
-            # persist a ticker history record for auditing / history
-            try:
-                ticker = TickerHistory(
-                    symbol=position.symbol,
-                    price=price,
-                    timestamp=datetime.utcnow(),
-                    source=os.getenv("MARKET_DATA_SOURCE", "binance"),
-                    position_id=position.id,
-                    account_id=position.account_id,
-                )
-                db.add(ticker)
-            except Exception:
-                logging.exception("market-data: failed to create ticker history record")
+                position_rows.append({
+                    "id": position.id,
+                    "current_price": price,
+                    "unrealized_pnl": unrealized_pnl,
+                    "risk_level": risk_level,
+                    "updated_at": now,
+                })
+                # persist a ticker history record for auditing / history
+                ticker_rows.append({
+                    "symbol": position.symbol,
+                    "price": price,
+                    "timestamp": now,
+                    "source": source,
+                    "position_id": position.id,
+                    "account_id": position.account_id,
+                    "created_at": now,
+                    "updated_at": now,
+                })
+                # return a small summary for broadcasting
+                summaries.append({
+                    "id": position.id,
+                    "symbol": position.symbol,
+                    "current_price": price,
+                    "unrealized_pnl": unrealized_pnl,
+                    "risk_level": risk_level.value if hasattr(risk_level, 'value') else str(risk_level),
+                    "updated_at": now.isoformat(),
+                })
 
+            db.bulk_update_mappings(Position, position_rows)
+            if self.ticker_writer is None:
+                db.bulk_insert_mappings(TickerHistory, ticker_rows)
             db.commit()
-            db.refresh(position)
-
-            # return a small summary for broadcasting
-            return {
-                "id": position.id,
-                "symbol": position.symbol,
-                "current_price": position.current_price,
-                "unrealized_pnl": position.unrealized_pnl,
-                "risk_level": position.risk_level.value if hasattr(position.risk_level, 'value') else str(position.risk_level),
-                "updated_at": position.updated_at.isoformat() if getattr(position, 'updated_at', None) else None,
-            }
+            return summaries, ticker_rows
+        except Exception:
+            db.rollback()
+            raise
         finally:
             db.close()
 
-    async def _poll_once(self):
+    async def _load_symbol_map(self) -> Dict[str, List[int]]:
+        """Group active position ids by normalized symbol.
+
+        Also records the highest risk level per symbol in `symbol_risk`.
+        """
         positions = await asyncio.to_thread(self._get_active_positions)
-        if not positions:
+        by_symbol: Dict[str, List[int]] = {}
+        symbol_risk: Dict[str, RiskLevelEnum] = {}
+        for p in positions:
+            sym = self.normalize_symbol(p.symbol)
+            by_symbol.setdefault(sym, []).append(p.id)
+            risk = p.risk_level or RiskLevelEnum.LOW
+            if RISK_ORDER.get(risk, 0) >= RISK_ORDER.get(symbol_risk.get(sym), -1):
+                symbol_risk[sym] = risk
+        self.symbol_risk = symbol_risk
+        return by_symbol
+
+    def _should_emit(self, symbol: str, price: float, now: float) -> bool:
+        last = self._last_emitted.get(symbol)
+        if last is None:
+            return True
+        last_price, last_time, _ = last
+        # a per-symbol override replaces the global thresholds as a whole
+        cfg = self.deadband_overrides.get(symbol)
+        if cfg is None:
+            abs_thr, rel_thr, max_silence = self.deadband_abs, self.deadband_rel, self.max_silence
+        else:
+            abs_thr = float(cfg.get("abs", 0))
+            rel_thr = float(cfg.get("rel", 0))
+            max_silence = float(cfg.get("max_silence", self.max_silence))
+        if now - last_time >= max_silence:
+            return True
+        delta = abs(price - last_price)
+        if abs_thr <= 0 and rel_thr <= 0:
+            return delta > 0
+        if abs_thr > 0 and delta >= abs_thr:
+            return True
+        if rel_thr > 0 and last_price and delta / abs(last_price) >= rel_thr:
+            return True
+        return False
+
+    async def _apply_prices(self, by_symbol: Dict[str, List[int]], prices: Dict[str, float]):
+        """Fan each symbol's price out to every position holding it and broadcast."""
+        for symbol, price in prices.items():
+            source, exchange_ts = self._quote_meta.get(symbol, (self.source_label, None))
+            price_cache.update(symbol, price, source, exchange_ts)
+        if self.rollup is not None:
+            self.rollup.add_prices(prices)
+        if self.tick_store is not None:
+            self.tick_store.append_prices(prices)
+
+        updates: Dict[int, float] = {}
+        # deadband state to record once the write has committed
+        emitted_now: Dict[str, Tuple[float, float, frozenset]] = {}
+        now = time.monotonic()
+        for symbol, pids in by_symbol.items():
+            price = prices.get(symbol)
+            if price is None:
+                logging.debug("market-data: no price for symbol=%s", symbol)
+                continue
+            if self._should_emit(symbol, price, now):
+                self.stats["updates_emitted"] += 1
+                emitted_now[symbol] = (price, now, frozenset(pids))
+                targets = pids
+            else:
+                self.stats["updates_suppressed"] += 1
+                # positions opened since the last emitted update still get a price
+                last_price, last_time, emitted = self._last_emitted[symbol]
+                targets = [pid for pid in pids if pid not in emitted]
+                if targets:
+                    emitted_now[symbol] = (last_price, last_time, emitted | frozenset(targets))
+            # fan the price out to every position holding this symbol
+            for pid in targets:
+                updates[pid] = price
+        if not updates:
+            return
+
+        try:
+            # one DB round-trip for the whole batch, in the threadpool (sync)
+            summaries, ticker_rows = await asyncio.to_thread(self._apply_prices_sync, updates)
+        except Exception:
+            logging.exception("market-data: error applying %s position updates", len(updates))
+            # nothing recorded: the next cycle emits these prices again
+            return
+        self._last_emitted.update(emitted_now)
+        if self.ticker_writer is not None:
+            await self.ticker_writer.submit(ticker_rows)
+        logging.info("market-data: updated %s positions across %s symbols", len(summaries), len(prices))
+
+        for updated in summaries:
+            # broadcast update to connected websocket clients
+            try:
+                await ws_manager.broadcast({"type": "position_update", "data": updated})
+            except Exception:
+                # keep polling even if broadcast fails
+                pass
+
+    def _shed_low_priority(self, by_symbol: Dict[str, List[int]], started: float) -> Dict[str, List[int]]:
+        """While over budget (the previous cycle overran, or this one already has),
+        keep only symbols at or above shed_keep_level."""
+        if not self._overrun and time.monotonic() - started <= self.cycle_budget:
+            return by_symbol
+        keep_rank = RISK_ORDER[self.shed_keep_level]
+        kept = {
+            s: pids for s, pids in by_symbol.items()
+            if RISK_ORDER.get(self.symbol_risk.get(s), 0) >= keep_rank
+        }
+        shed = len(by_symbol) - len(kept)
+        if shed:
+            self.stats["symbols_shed"] += shed
+            logging.warning("market-data: over cycle budget (%.2fs), shedding %s low-priority symbols",
+                            self.cycle_budget, shed)
+        return kept
+
+    async def _poll_once(self, started: float | None = None):
+        started = time.monotonic() if started is None else started
+        # group positions by normalized symbol so each ticker is fetched once per cycle
+        by_symbol = await self._load_symbol_map()
+        if not by_symbol:
             logging.debug("market-data: no active positions found")
             return
 
-        # fetch prices concurrently (attach position id to each fetch result)
-        async def _fetch_with_id(pid: int, symbol: str):
-            price = await self.fetch_price(symbol)
-            return pid, price
+        # the previous cycle overran: don't spend request weight on low-priority symbols
+        by_symbol = self._shed_low_priority(by_symbol, started)
+        position_count = sum(len(pids) for pids in by_symbol.values())
+        self.stats["symbols_fetched"] += len(by_symbol)
+        self.stats["fetches_saved"] += position_count - len(by_symbol)
 
-        tasks = [asyncio.create_task(_fetch_with_id(p.id, p.symbol)) for p in positions]
+        prices = await self.fetch_prices(list(by_symbol))
+        if self.router.persist:
+            await asyncio.to_thread(self.router.flush)
 
-        for task in asyncio.as_completed(tasks):
+        # the fetch itself blew the budget: only write the high-priority symbols
+        by_symbol = self._shed_low_priority(by_symbol, started)
+        await self._apply_prices(by_symbol, prices)
+
+    async def _poll_due(self, started: float | None = None) -> float:
+        """Adaptive mode: fetch only the symbols whose deadline has passed.
+
+        The position map is reloaded at most once per poll_interval; returns the
+        number of seconds until the next symbol is due.
+        """
+        now = time.monotonic()
+        started = now if started is None else started
+        if now - self._symbol_map_loaded_at >= self.poll_interval:
+            self._symbol_map = await self._load_symbol_map()
+            self._symbol_map_loaded_at = now
+            self.scheduler.sync(self.symbol_risk, now)
+
+        due = self.scheduler.pop_due(now)
+        if due:
+            due_map = {s: self._symbol_map[s] for s in due if s in self._symbol_map}
             try:
-                pid, price = await task
-                if price is None:
-                    logging.debug("market-data: no price for pid=%s", pid)
-                    continue
-                # update position in DB in threadpool (sync)
-                updated = await asyncio.to_thread(self._update_position_sync, pid, price)
-                if updated:
-                    # broadcast update to connected websocket clients
-                    try:
-                        await ws_manager.broadcast({"type": "position_update", "data": updated})
-                    except Exception:
-                        # keep polling even if broadcast fails
-                        pass
-                logging.info("market-data: updated position %s price=%s", pid, price)
-            except Exception as e:
-                logging.exception("market-data: error handling task for pid=%s", pid)
-                # ignore per-position errors but log them
-                continue
+                # the previous cycle overran: don't spend request weight on low-priority symbols
+                kept = self._shed_low_priority(due_map, started)
+                self.stats["symbols_fetched"] += len(kept)
+                self.stats["fetches_saved"] += sum(len(p) for p in kept.values()) - len(kept)
+                prices = await self.fetch_prices([s for s in due if s in kept or s not in due_map])
+                if self.router.persist:
+                    await asyncio.to_thread(self.router.flush)
+                fetched_at = time.monotonic()
+                for symbol, price in prices.items():
+                    self.scheduler.record_price(symbol, price, fetched_at)
+                # the fetch itself blew the budget: only write the high-priority symbols
+                kept = self._shed_low_priority(kept, started)
+                await self._apply_prices(kept, prices)
+                # shed symbols are retried after min_interval instead of a full interval later
+                retry_at = fetched_at + self.scheduler.min_interval
+                for symbol in due_map.keys() - kept.keys():
+                    self.scheduler.reschedule(symbol, retry_at - self.scheduler.interval_for(symbol))
+                due = [s for s in due if s in kept or s not in due_map]
+            finally:
+                done = time.monotonic()
+                for symbol in due:
+                    self.scheduler.reschedule(symbol, done)
+
+        next_due = self.scheduler.next_due()
+        if next_due is None:
+            return self.poll_interval
+        return max(0.0, next_due - time.monotonic())
+
+    def _record_cycle(self, duration: float, lag: float):
+        self.stats["cycles"] += 1
+        self.stats["last_cycle_seconds"] = round(duration, 4)
+        self.stats["max_cycle_seconds"] = round(max(self.stats["max_cycle_seconds"], duration), 4)
+        self.stats["last_lag_seconds"] = round(lag, 4)
+        self.stats["max_lag_seconds"] = round(max(self.stats["max_lag_seconds"], lag), 4)
+        self._overrun = duration > self.cycle_budget
+        if self._overrun:
+            self.stats["cycle_overruns"] += 1
+            logging.warning("market-data: cycle took %.2fs (budget %.2fs)", duration, self.cycle_budget)
+
+    async def _run_cycle(self, started: float) -> float | None:
+        """Run one cycle; returns the adaptive delay, if any. Only `poller` runs cycles,
+        one after another, so they never overlap."""
+        if self.scheduler is not None:
+            return await self._poll_due(started)
+        await self._poll_once(started)
+        return None
 
     async def poller(self):
+        """Deadline-driven loop: cycles start on fixed deadlines (not interval after the
+        previous cycle ended), so cycle duration doesn't stretch the period. Deadlines
+        missed by an overrunning cycle are skipped rather than run back-to-back."""
         self._running = True
-        logging.info("market-data: poller started (interval=%s)", self.poll_interval)
+        logging.info("market-data: poller started (interval=%s adaptive=%s)", self.poll_interval, self.scheduler is not None)
+        await asyncio.to_thread(self.router.load)
+        deadline = time.monotonic()
         while self._running:
+            started = time.monotonic()
+            lag = max(0.0, started - deadline)
+            delay = None
             try:
-                await self._poll_once()
+                delay = await self._run_cycle(started)
             except Exception:
                 # keep polling even if errors occur
-                pass
-            await asyncio.sleep(self.poll_interval)
+                logging.exception("market-data: poll cycle failed")
+            finished = time.monotonic()
+            self._record_cycle(finished - started, lag)
+
+            if self.scheduler is not None:
+                # wake for the next symbol deadline, but re-check positions at least every poll_interval
+                wait = self.scheduler.min_interval if delay is None else delay
+                deadline = finished + min(wait, self.poll_interval)
+            else:
+                deadline += self.poll_interval
+                if finished > deadline:
+                    missed = int((finished - deadline) // self.poll_interval) + 1
+                    self.stats["deadlines_missed"] += missed
+                    deadline += missed * self.poll_interval
+            await asyncio.sleep(max(0.0, deadline - time.monotonic()))
 
     def start(self):
         if self._task is None:
@@ -183,21 +633,86 @@ class MarketDataService:
             except RuntimeError:
                 loop = asyncio.get_event_loop()
 
+            if self._client is None:
+                self._client = self._create_client()
+
+            # the loop's first deadline is "now", so no separate immediate poll is needed
             logging.info("market-data: scheduling background poller task (loop=%s)", loop)
             self._task = loop.create_task(self.poller())
-            # schedule an immediate poll once so we don't wait for the first interval
-            try:
-                loop.create_task(self._poll_once())
-                logging.info("market-data: scheduled immediate first poll")
-            except Exception:
-                logging.exception("market-data: failed to schedule immediate poll")
 
     def stop(self):
         self._running = False
         if self._task and not self._task.done():
             self._task.cancel()
+        self._task = None
+        # close the keep-alive pool; stop() is sync so schedule the close on the loop
+        client, self._client = self._client, None
+        if client is not None:
+            try:
+                asyncio.get_running_loop().create_task(client.aclose())
+            except RuntimeError:
+                logging.debug("market-data: no running loop, leaving http client to be garbage collected")
+        logging.info("market-data: stopped (stats=%s)", self.get_stats())
 
 
-def get_poller_from_env() -> MarketDataService:
+def get_poller_from_env(ticker_writer: TickerHistoryWriter | None = None,
+                        rollup: TickerRollup | None = None,
+                        tick_store: TickStore | None = None) -> MarketDataService:
     interval = int(os.getenv("MARKET_POLL_INTERVAL", "10"))
-    return MarketDataService(poll_interval=interval)
+    max_connections = int(os.getenv("MARKET_HTTP_MAX_CONNECTIONS", "20"))
+    http2 = os.getenv("MARKET_HTTP2", "true").lower() in ("1", "true", "yes")
+    price_mode = os.getenv("MARKET_PRICE_MODE", "auto").lower()
+    bulk_threshold = int(os.getenv("MARKET_BULK_THRESHOLD", "5"))
+    router = SymbolRouter(
+        revalidate_after=int(os.getenv("MARKET_ROUTE_REVALIDATE", "3600")),
+        invalid_ttl=int(os.getenv("MARKET_ROUTE_INVALID_TTL", "600")),
+        persist=os.getenv("MARKET_ROUTE_PERSIST", "false").lower() in ("1", "true", "yes"),
+    )
+    kwargs = dict(
+        poll_interval=interval,
+        max_connections=max_connections,
+        http2=http2,
+        price_mode=price_mode,
+        bulk_threshold=bulk_threshold,
+        router=router,
+        ticker_writer=ticker_writer,
+        rollup=rollup,
+        tick_store=tick_store,
+        deadband_abs=float(os.getenv("MARKET_DEADBAND_ABS", "0")),
+        deadband_rel=float(os.getenv("MARKET_DEADBAND_REL", "0")),
+        max_silence=float(os.getenv("MARKET_MAX_SILENCE", "60")),
+        deadband_overrides=json.loads(os.getenv("MARKET_DEADBAND_OVERRIDES") or "{}"),
+    )
+    budget = os.getenv("MARKET_CYCLE_BUDGET")
+    if budget:
+        kwargs["cycle_budget"] = float(budget)
+    keep_level = os.getenv("MARKET_SHED_KEEP_LEVEL", "high").upper()
+    kwargs["shed_keep_level"] = RiskLevelEnum[keep_level] if keep_level in RiskLevelEnum.__members__ else RiskLevelEnum.HIGH
+    kwargs["price_source"] = get_price_source_from_env()
+    if os.getenv("MARKET_SCHEDULER", "fixed").lower() == "adaptive":
+        kwargs["scheduler"] = SymbolScheduler(
+            risk_intervals={
+                RiskLevelEnum.CRITICAL: float(os.getenv("MARKET_INTERVAL_CRITICAL", "1")),
+                RiskLevelEnum.HIGH: float(os.getenv("MARKET_INTERVAL_HIGH", "3")),
+                RiskLevelEnum.MEDIUM: float(os.getenv("MARKET_INTERVAL_MEDIUM", "10")),
+                RiskLevelEnum.LOW: float(os.getenv("MARKET_INTERVAL_LOW", "30")),
+            },
+            volatility_ref=float(os.getenv("MARKET_VOLATILITY_REF", "0.0005")),
+            max_speedup=float(os.getenv("MARKET_VOLATILITY_MAX_SPEEDUP", "4")),
+        )
+    # "stream" swaps the REST poll loop for the mark-price WebSocket engine
+    if os.getenv("MARKET_PRICE_FEED", "poll").lower() == "stream":
+        if kwargs["price_source"] is not None:
+            logging.warning("market-data: MARKET_PRICE_FEED=stream ignored with MARKET_PRICE_SOURCE=%s",
+                            kwargs["price_source"].name)
+            return MarketDataService(**kwargs)
+        from app.services.mark_price_stream import MarkPriceStreamService
+
+        return MarkPriceStreamService(
+            stream_url=os.getenv("MARKET_STREAM_URL") or None,
+            refresh_interval=float(os.getenv("MARKET_STREAM_REFRESH", "5")),
+            flush_interval=float(os.getenv("MARKET_STREAM_FLUSH", "1")),
+            stream_speed=os.getenv("MARKET_STREAM_SPEED", "1s"),
+            **kwargs,
+        )
+    return MarketDataService(**kwargs)
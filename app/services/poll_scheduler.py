@@ -0,0 +1,125 @@
+"""Per-symbol polling cadence for the market poller.
+
+Each held symbol gets its own interval, derived from the highest risk level
+of the positions holding it (e.g. CRITICAL every 1s, LOW every 30s) and
+shortened further when the symbol has been volatile recently. Due times
+live in a heap (deadline priority queue); the poller asks for the symbols
+that are due, fetches them, and reschedules them.
+"""
+import heapq
+import math
+from typing import Dict, List, Optional, Tuple
+
+from app.models.risk_control import RiskLevelEnum
+
+
+RISK_ORDER = {
+    RiskLevelEnum.LOW: 0,
+    RiskLevelEnum.MEDIUM: 1,
+    RiskLevelEnum.HIGH: 2,
+    RiskLevelEnum.CRITICAL: 3,
+}
+
+DEFAULT_RISK_INTERVALS = {
+    RiskLevelEnum.CRITICAL: 1.0,
+    RiskLevelEnum.HIGH: 3.0,
+    RiskLevelEnum.MEDIUM: 10.0,
+    RiskLevelEnum.LOW: 30.0,
+}
+
+
+class SymbolScheduler:
+    def __init__(self, risk_intervals: Optional[Dict[RiskLevelEnum, float]] = None,
+                 volatility_ref: float = 0.0005, max_speedup: float = 4.0, min_interval: float = 0.5,
+                 ewma_alpha: float = 0.3):
+        self.risk_intervals = dict(DEFAULT_RISK_INTERVALS)
+        self.risk_intervals.update(risk_intervals or {})
+        # volatility is an EWMA of |return| / sqrt(seconds); at volatility_ref the interval
+        # is unchanged, above it the interval shrinks proportionally (up to max_speedup)
+        self.volatility_ref = volatility_ref
+        self.max_speedup = max_speedup
+        self.min_interval = min_interval
+        self.ewma_alpha = ewma_alpha
+
+        self._heap: List[Tuple[float, int, str]] = []
+        self._seq = 0
+        # authoritative due time per symbol; heap entries that disagree are stale
+        self._due: Dict[str, float] = {}
+        self._risk: Dict[str, RiskLevelEnum] = {}
+        self._volatility: Dict[str, float] = {}
+        self._last_obs: Dict[str, Tuple[float, float]] = {}
+
+    def __len__(self):
+        return len(self._due)
+
+    def _push(self, symbol: str, due: float):
+        self._due[symbol] = due
+        self._seq += 1
+        heapq.heappush(self._heap, (due, self._seq, symbol))
+
+    def interval_for(self, symbol: str) -> float:
+        risk = self._risk.get(symbol, RiskLevelEnum.LOW)
+        base = self.risk_intervals.get(risk, self.risk_intervals[RiskLevelEnum.LOW])
+        vol = self._volatility.get(symbol, 0.0)
+        if self.volatility_ref > 0 and vol > self.volatility_ref:
+            base /= min(self.max_speedup, vol / self.volatility_ref)
+        return max(self.min_interval, base)
+
+    def sync(self, symbol_risk: Dict[str, RiskLevelEnum], now: float):
+        """Track exactly the given symbols; new ones are due immediately and a
+        symbol whose cadence got faster is pulled forward."""
+        for symbol in list(self._due):
+            if symbol not in symbol_risk:
+                del self._due[symbol]
+                self._risk.pop(symbol, None)
+                self._volatility.pop(symbol, None)
+                self._last_obs.pop(symbol, None)
+        for symbol, risk in symbol_risk.items():
+            self._risk[symbol] = risk
+            if symbol not in self._due:
+                self._push(symbol, now)
+                continue
+            earliest = now + self.interval_for(symbol)
+            if earliest < self._due[symbol]:
+                self._push(symbol, earliest)
+
+    def pop_due(self, now: float) -> List[str]:
+        """Return due symbols, highest risk first (then most overdue)."""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            t, _, symbol = heapq.heappop(self._heap)
+            if self._due.get(symbol) != t:
+                continue  # stale entry (rescheduled or removed)
+            del self._due[symbol]
+            due.append((t, symbol))
+        due.sort(key=lambda item: (-RISK_ORDER.get(self._risk.get(item[1]), 0), item[0]))
+        return [symbol for _, symbol in due]
+
+    def reschedule(self, symbol: str, now: float):
+        if symbol in self._risk:
+            self._push(symbol, now + self.interval_for(symbol))
+
+    def next_due(self) -> Optional[float]:
+        while self._heap and self._due.get(self._heap[0][2]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def record_price(self, symbol: str, price: float, now: float):
+        last = self._last_obs.get(symbol)
+        self._last_obs[symbol] = (price, now)
+        if not last or not last[0] or now <= last[1]:
+            return
+        ret = abs(price - last[0]) / abs(last[0]) / math.sqrt(now - last[1])
+        prev = self._volatility.get(symbol)
+        self._volatility[symbol] = ret if prev is None else self.ewma_alpha * ret + (1 - self.ewma_alpha) * prev
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {
+            symbol: {
+                "risk_level": getattr(self._risk.get(symbol), "value", None),
+                "interval": round(self.interval_for(symbol), 3),
+                "volatility": self._volatility.get(symbol),
+                "due": self._due.get(symbol),
+            }
+            for symbol in self._risk
+        }
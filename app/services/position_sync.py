@@ -1,32 +1,115 @@
 import asyncio
 import logging
 import os
-from typing import List, Dict
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List, Dict, Optional
 
 from app.core.database import SessionLocal
 from app.services.exchange.binance_adapter import create_adapter_for_account
 from app.services.ws_broadcast import manager as ws_manager
+from app.services.history_sync import sync_account_history
+from app.services.risk_config_cache import risk_config_cache
 from app.services.risk_control_service import RiskControlService
-from app.models.risk_control import Account, Position, RiskConfig, RiskLevelEnum, AccountSnapshot
-from sqlalchemy.exc import OperationalError
+from app.models.risk_control import Account, Position, RiskLevelEnum, AccountSnapshot
 
 
 class PositionSyncService:
-    def __init__(self, interval: int = 30):
+    def __init__(self, interval: int = 30, account_concurrency: int = 4):
         self.interval = interval
         self._task = None
         self._running = False
         self._history_sync_counter = 0
         self._history_sync_interval = 10  # Sync history every 10 position sync cycles
-
-    async def _sync_account(self, account: Account):
+        # max exchange calls in flight per account; calls across accounts are paced by the weight governor
+        self.account_concurrency = account_concurrency
+        # account id -> semaphore shared by every _run_calls batch of that account
+        self._semaphores: Dict[int, asyncio.Semaphore] = {}
+        # per exchange call: count, failures, total/max seconds
+        self.call_stats: Dict[str, Dict[str, float]] = {}
+
+    def _record_call(self, name: str, elapsed: float, failed: bool):
+        stats = self.call_stats.setdefault(name, {"calls": 0, "failures": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+        stats["calls"] += 1
+        stats["failures"] += int(failed)
+        stats["total_seconds"] = round(stats["total_seconds"] + elapsed, 4)
+        stats["max_seconds"] = round(max(stats["max_seconds"], elapsed), 4)
+
+    async def _run_calls(self, account_id: int, calls: Dict[str, Callable[[], Awaitable]]) -> Dict[str, object]:
+        """Run independent exchange calls for one account concurrently (capped) and time each.
+
+        A failing call yields None, like the adapter methods do on errors. Calls
+        named "<kind>:<detail>" (e.g. per-symbol trades) are timed under <kind>.
+        """
+        semaphore = self._semaphores.get(account_id)
+        if semaphore is None:
+            semaphore = self._semaphores[account_id] = asyncio.Semaphore(self.account_concurrency)
+
+        async def _timed(name: str, call: Callable[[], Awaitable]):
+            async with semaphore:
+                started = time.monotonic()
+                failed = False
+                try:
+                    return await call()
+                except Exception:
+                    failed = True
+                    logging.exception("position-sync: %s failed for account %s", name, account_id)
+                    return None
+                finally:
+                    self._record_call(name.split(":", 1)[0], time.monotonic() - started, failed)
+
+        started = time.monotonic()
+        results = await asyncio.gather(*(_timed(name, call) for name, call in calls.items()))
+        logging.debug("position-sync: account %s fetched %s in %.2fs", account_id, list(calls), time.monotonic() - started)
+        return dict(zip(calls, results))
+
+    def _apply_account_info(self, db, account_id: int, account_info: Dict):
+        """Store balances from /fapi/v2/account and take an hourly equity snapshot."""
+        db_account = db.query(Account).get(account_id)
+        if not db_account:
+            return
+        try:
+            db_account.total_balance = float(account_info.get('totalWalletBalance', 0))
+            db_account.total_equity = float(account_info.get('totalMarginBalance', 0))
+            
+            # Take a snapshot if the last one was more than 1 hour ago
+            last_snapshot = db.query(AccountSnapshot).filter(
+                AccountSnapshot.account_id == account_id
+            ).order_by(AccountSnapshot.timestamp.desc()).first()
+            
+            if not last_snapshot or (datetime.utcnow() - last_snapshot.timestamp) > timedelta(hours=1):
+                snapshot = AccountSnapshot(
+                    account_id=account_id,
+                    total_equity=db_account.total_equity,
+                    total_balance=db_account.total_balance
+                )
+                db.add(snapshot)
+                logging.info("position-sync: took snapshot for account %s", account_id)
+                
+        except Exception as e:
+            logging.error("position-sync: failed to update account info for %s: %s", account_id, e)
+
+    async def _sync_account(self, account: Account, sync_history: Optional[bool] = None):
         adapter = create_adapter_for_account(account)
         if not adapter:
             logging.debug("position-sync: account %s missing API credentials", account.id)
             return
 
-        rows = await adapter.fetch_positions()
-        account_info = await adapter.fetch_account_info()
+        # positions, balances and (periodically) history only depend on the adapter:
+        # fetch them all at once; the DB work below depends on their results
+        if sync_history is None:
+            sync_history = self._history_sync_counter % self._history_sync_interval == 0
+        calls = {
+            "positions": adapter.fetch_positions,
+            "account_info": adapter.fetch_account_info,
+        }
+        if sync_history:
+            # history fetches share the account's concurrency cap with the calls above
+            fetched, _ = await asyncio.gather(self._run_calls(account.id, calls), self._sync_history(account, adapter))
+        else:
+            fetched = await self._run_calls(account.id, calls)
+        rows = fetched["positions"]
+        account_info = fetched["account_info"]
         
         if rows is None and account_info is None:
             logging.debug("position-sync: no data for account %s", account.id)
@@ -40,32 +123,7 @@ class PositionSyncService:
         try:
             # Update Account Info
             if account_info:
-                db_account = db.query(Account).get(account.id)
-                if db_account:
-                    try:
-                        db_account.total_balance = float(account_info.get('totalWalletBalance', 0))
-                        db_account.total_equity = float(account_info.get('totalMarginBalance', 0))
-                        
-                        # Take a snapshot if the last one was more than 1 hour ago
-                        last_snapshot = db.query(AccountSnapshot).filter(
-                            AccountSnapshot.account_id == account.id
-                        ).order_by(AccountSnapshot.timestamp.desc()).first()
-                        
-                        if not last_snapshot or (datetime.utcnow() - last_snapshot.timestamp) > timedelta(hours=1):
-                            snapshot = AccountSnapshot(
-                                account_id=account.id,
-                                total_equity=db_account.total_equity,
-                                total_balance=db_account.total_balance
-                            )
-                            db.add(snapshot)
-                            logging.info("position-sync: took snapshot for account %s", account.id)
-                            
-                    except Exception as e:
-                        logging.error("position-sync: failed to update account info for %s: %s", account.id, e)
-
-            # Periodic History Sync
-            if self._history_sync_counter % self._history_sync_interval == 0:
-                await self._sync_history(account, adapter, db)
+                self._apply_account_info(db, account.id, account_info)
 
             by_symbol = {}
             if rows:
@@ -106,151 +164,140 @@ class PositionSyncService:
                     except Exception:
                         logging.exception("position-sync: error processing row for account %s row=%s", account.id, r)
 
-            # now upsert per-symbol consolidated info
-            updated_keys = set()
-            for (symbol, pside), info in by_symbol.items():
-                try:
-                    net_amt = info['net_amt']
-                    size = abs(net_amt)
-                    is_active = abs(net_amt) > 1e-12
-                    entry_price = info['entry_price'] or 0.0
-                    mark_price = info['mark_price']
-                    unrealized = info['unrealized']
-                    leverage = info.get('leverage', 1.0)
-
-                    updated_keys.add((symbol, pside))
-
-                    # the position_side column may not exist yet in older schemas; if that
-                    # is the case, catch the OperationalError and fall back to the
-                    # older net-per-symbol lookup (avoid crashing the poller).
-                    try:
-                        db_pos = db.query(Position).filter(
-                            Position.account_id == account.id,
-                            Position.symbol == symbol,
-                            Position.position_side == pside
-                        ).first()
-                    except OperationalError:
-                        logging.warning("position-sync: DB missing 'position_side' column — falling back to symbol-only lookup")
-                        db.rollback()
-                        db_pos = db.query(Position).filter(
-                            Position.account_id == account.id,
-                            Position.symbol == symbol
-                        ).first()
-
-                    if db_pos:
-                        db_pos.size = size
-                        if entry_price and entry_price > 0:
-                            db_pos.entry_price = entry_price
-                        if mark_price is not None:
-                            db_pos.current_price = mark_price
-                        db_pos.unrealized_pnl = unrealized
-                        db_pos.leverage = leverage
-                        db_pos.is_active = is_active
-
-                        risk_cfg = db.query(RiskConfig).filter(
-                            RiskConfig.account_id == account.id,
-                            RiskConfig.is_active == True
-                        ).first()
-                        if risk_cfg:
-                            svc = RiskControlService(db)
-                            db_pos.risk_level = svc.calculate_risk_level(db_pos, risk_cfg)
-
-                        db.add(db_pos)
-                        db.commit()
-                        db.refresh(db_pos)
-                        await ws_manager.broadcast({
-                            "type": "position_update",
-                            "data": {
-                                "id": db_pos.id,
-                                "account_id": db_pos.account_id,
-                                "symbol": db_pos.symbol,
-                                "position_side": db_pos.position_side,
-                                "size": db_pos.size,
-                                "entry_price": db_pos.entry_price,
-                                "current_price": db_pos.current_price,
-                                "unrealized_pnl": db_pos.unrealized_pnl,
-                                "risk_level": getattr(db_pos.risk_level, 'value', str(db_pos.risk_level)),
-                                "is_active": db_pos.is_active,
-                                "updated_at": db_pos.updated_at.isoformat() if db_pos.updated_at else None,
-                            }
-                        })
-                        logging.info("position-sync: updated position %s/%s[%s] size=%s price=%s", account.id, symbol, pside, size, db_pos.current_price)
-                    else:
-                        if not is_active:
-                            # no active net position -> nothing to create
-                            continue
-                        # create a new position - ensure position_side gets stored
-                        new_pos = Position(
-                            account_id=account.id,
-                            symbol=symbol,
-                            size=size,
-                            entry_price=entry_price,
-                            current_price=mark_price,
-                            unrealized_pnl=unrealized,
-                            leverage=leverage,
-                            risk_level=RiskLevelEnum.LOW,
-                            is_active=is_active,
-                            position_side=pside,
-                        )
-                        db.add(new_pos)
-                        db.commit()
-                        db.refresh(new_pos)
-                        await ws_manager.broadcast({
-                            "type": "position_update",
-                            "data": {
-                                "id": new_pos.id,
-                                "account_id": new_pos.account_id,
-                                "symbol": new_pos.symbol,
-                                "position_side": new_pos.position_side,
-                                "size": new_pos.size,
-                                "entry_price": new_pos.entry_price,
-                                "current_price": new_pos.current_price,
-                                "unrealized_pnl": new_pos.unrealized_pnl,
-                                "risk_level": getattr(new_pos.risk_level, 'value', str(new_pos.risk_level)),
-                                "is_active": new_pos.is_active,
-                                "updated_at": new_pos.updated_at.isoformat() if new_pos.updated_at else None,
-                            }
-                        })
-                        logging.info("position-sync: created position %s/%s[%s] size=%s price=%s", account.id, symbol, pside, size, new_pos.current_price)
-
-                except Exception:
-                    logging.exception("position-sync: error upserting consolidated position %s for account %s", symbol, account.id)
-
-            # Deactivate positions that are no longer in Binance response
+            if rows is None:
+                # positions call failed: keep what we have rather than deactivating everything
+                db.commit()
+                return
             try:
-                active_in_db = db.query(Position).filter(
-                    Position.account_id == account.id,
-                    Position.is_active == True
-                ).all()
-                for pos in active_in_db:
-                    key = (pos.symbol, (pos.position_side or "NET").upper())
-                    if key not in updated_keys:
-                        pos.is_active = False
-                        pos.size = 0.0
-                        pos.unrealized_pnl = 0.0
-                        db.add(pos)
-                        
-                        # Broadcast deactivation
-                        await ws_manager.broadcast({
-                            "type": "position_update",
-                            "data": {
-                                "id": pos.id,
-                                "account_id": pos.account_id,
-                                "symbol": pos.symbol,
-                                "position_side": pos.position_side,
-                                "size": 0.0,
-                                "is_active": False,
-                                "updated_at": datetime.utcnow().isoformat()
-                            }
-                        })
-                        logging.info("position-sync: deactivating position %s/%s[%s] (not in Binance response)", account.id, pos.symbol, pos.position_side)
+                broadcasts = self._reconcile_positions(db, account.id, by_symbol)
                 db.commit()
             except Exception:
-                logging.exception("position-sync: error deactivating stale positions for account %s", account.id)
+                logging.exception("position-sync: error reconciling positions for account %s", account.id)
+                db.rollback()
+                return
+            for data in broadcasts:
+                await ws_manager.broadcast({"type": "position_update", "data": data})
 
         finally:
             db.close()
 
+    def _reconcile_positions(self, db, account_id: int, by_symbol: Dict, partial: bool = False) -> List[Dict]:
+        """Diff consolidated exchange positions against the account's stored rows.
+
+        Loads the account's positions and risk config once, computes updates,
+        inserts and deactivations in memory and applies them with bulk statements
+        on `db` (the caller commits). Returns the position_update payloads to
+        broadcast after the commit.
+
+        With `partial` (stream events carry only the changed positions) stored
+        positions missing from `by_symbol` are left alone, and missing leverage /
+        mark price keep their stored values.
+        """
+        existing: Dict[tuple, Position] = {}
+        # newest row wins if an account somehow has duplicates for a (symbol, side)
+        for pos in db.query(Position).filter(Position.account_id == account_id).order_by(Position.id.desc()):
+            existing.setdefault((pos.symbol, (pos.position_side or "NET").upper()), pos)
+
+        risk_cfg = risk_config_cache.get(account_id, db)
+        svc = RiskControlService(db)
+        now = datetime.utcnow()
+
+        updates, inserts, broadcasts = [], [], []
+        for (symbol, pside), info in by_symbol.items():
+            net_amt = info['net_amt']
+            size = abs(net_amt)
+            is_active = abs(net_amt) > 1e-12
+            entry_price = info['entry_price'] or 0.0
+            mark_price = info['mark_price']
+            db_pos = existing.get((symbol, pside))
+
+            if db_pos is None:
+                if not is_active:
+                    # no active net position -> nothing to create
+                    continue
+                inserts.append(Position(
+                    account_id=account_id,
+                    symbol=symbol,
+                    size=size,
+                    entry_price=entry_price,
+                    current_price=mark_price,
+                    unrealized_pnl=info['unrealized'],
+                    leverage=info.get('leverage') or 1.0,
+                    risk_level=RiskLevelEnum.LOW,
+                    is_active=is_active,
+                    position_side=pside,
+                    created_at=now,
+                    updated_at=now,
+                ))
+                continue
+
+            row = {
+                "id": db_pos.id,
+                "size": size,
+                "entry_price": entry_price if entry_price > 0 else db_pos.entry_price,
+                "current_price": mark_price if mark_price is not None else db_pos.current_price,
+                "unrealized_pnl": info['unrealized'],
+                "leverage": info.get('leverage') or db_pos.leverage,
+                "is_active": is_active,
+                "risk_level": db_pos.risk_level,
+                "updated_at": now,
+            }
+            if risk_cfg:
+                row["risk_level"] = svc.calculate_risk_level_at(row["current_price"], row["entry_price"], size, risk_cfg)
+            updates.append(row)
+            broadcasts.append({
+                "id": db_pos.id,
+                "account_id": account_id,
+                "symbol": symbol,
+                "position_side": db_pos.position_side,
+                "size": size,
+                "entry_price": row["entry_price"],
+                "current_price": row["current_price"],
+                "unrealized_pnl": row["unrealized_pnl"],
+                "risk_level": getattr(row["risk_level"], 'value', str(row["risk_level"])),
+                "is_active": is_active,
+                "updated_at": now.isoformat(),
+            })
+
+        # deactivate positions that are no longer in the Binance response
+        for key, pos in existing.items():
+            if not partial and pos.is_active and key not in by_symbol:
+                updates.append({"id": pos.id, "is_active": False, "size": 0.0, "unrealized_pnl": 0.0, "updated_at": now})
+                broadcasts.append({
+                    "id": pos.id,
+                    "account_id": account_id,
+                    "symbol": pos.symbol,
+                    "position_side": pos.position_side,
+                    "size": 0.0,
+                    "is_active": False,
+                    "updated_at": now.isoformat(),
+                })
+                logging.info("position-sync: deactivating position %s/%s[%s] (not in Binance response)", account_id, pos.symbol, pos.position_side)
+
+        if updates:
+            db.bulk_update_mappings(Position, updates)
+        if inserts:
+            db.add_all(inserts)
+            # new positions are rare; flushing them assigns the ids needed for the broadcast
+            db.flush()
+            for pos in inserts:
+                broadcasts.append({
+                    "id": pos.id,
+                    "account_id": account_id,
+                    "symbol": pos.symbol,
+                    "position_side": pos.position_side,
+                    "size": pos.size,
+                    "entry_price": pos.entry_price,
+                    "current_price": pos.current_price,
+                    "unrealized_pnl": pos.unrealized_pnl,
+                    "risk_level": pos.risk_level.value,
+                    "is_active": pos.is_active,
+                    "updated_at": now.isoformat(),
+                })
+        logging.log(logging.DEBUG if partial else logging.INFO, "position-sync: account %s reconciled (%s updated, %s created)",
+                    account_id, len(updates), len(inserts))
+        return broadcasts
+
     async def _sync_all(self):
         db = SessionLocal()
         try:
@@ -271,110 +318,26 @@ class PositionSyncService:
         
         self._history_sync_counter += 1
 
-    async def _sync_history(self, account, adapter, db):
-        """Internal method to sync history for an account during the regular sync loop."""
-        from app.models.risk_control import TransactionHistory
-        from datetime import datetime
-        
+    async def sync_history(self, account: Account, adapter=None) -> int:
+        """Fetch and store the account's history since its cursors; returns new records.
+
+        Syncs of one account are serialized (see history_sync.account_lock).
+        """
+        adapter = adapter or create_adapter_for_account(account)
+        if adapter is None:
+            raise ValueError(f"account {account.id} has no usable exchange credentials")
+        count = await sync_account_history(adapter, account.id, lambda calls: self._run_calls(account.id, calls))
+        if count > 0:
+            logging.info("position-sync: synced %s new history items for account %s", count, account.id)
+        return count
+
+    async def _sync_history(self, account, adapter):
+        """Background variant of sync_history that logs failures instead of raising."""
         logging.info("position-sync: syncing history for account %s", account.id)
         try:
-            # Clean up old trade-level records (T_ prefix) if any exist
-            db.query(TransactionHistory).filter(
-                TransactionHistory.account_id == account.id,
-                TransactionHistory.transaction_id.like('T_%')
-            ).delete(synchronize_session=False)
-            db.commit()
-
-            income_history = await adapter.fetch_income_history(limit=50)
-            user_trades = await adapter.fetch_user_trades(limit=50)
-            
-            count = 0
-            if income_history:
-                for item in income_history:
-                    tran_id = item.get('tranId')
-                    if not tran_id: continue
-                    exists = db.query(TransactionHistory).filter(TransactionHistory.transaction_id == str(tran_id)).first()
-                    if not exists:
-                        db_item = TransactionHistory(
-                            account_id=account.id,
-                            symbol=item.get('symbol'),
-                            type=item.get('incomeType'),
-                            realized_pnl=float(item.get('income')),
-                            commission_asset=item.get('asset'),
-                            time=datetime.utcfromtimestamp(item.get('time') / 1000),
-                            transaction_id=str(tran_id)
-                        )
-                        db.add(db_item)
-                        count += 1
-
-            if user_trades:
-                # Aggregate trades by orderId
-                aggregated_trades = {}
-                for trade in user_trades:
-                    oid = str(trade.get('orderId'))
-                    if not oid: continue
-                    
-                    if oid not in aggregated_trades:
-                        aggregated_trades[oid] = {
-                            'symbol': trade.get('symbol'),
-                            'side': trade.get('side'),
-                            'price_sum': float(trade.get('price', 0)) * float(trade.get('qty', 0)),
-                            'qty': float(trade.get('qty', 0)),
-                            'quote_qty': float(trade.get('quoteQty', 0)),
-                            'commission': float(trade.get('commission', 0)),
-                            'commission_asset': trade.get('commissionAsset'),
-                            'realized_pnl': float(trade.get('realizedPnl', 0)),
-                            'time': trade.get('time')
-                        }
-                    else:
-                        item = aggregated_trades[oid]
-                        item['price_sum'] += float(trade.get('price', 0)) * float(trade.get('qty', 0))
-                        item['qty'] += float(trade.get('qty', 0))
-                        item['quote_qty'] += float(trade.get('quoteQty', 0))
-                        item['commission'] += float(trade.get('commission', 0))
-                        item['realized_pnl'] += float(trade.get('realizedPnl', 0))
-                        item['time'] = max(item['time'], trade.get('time'))
-
-                for oid, data in aggregated_trades.items():
-                    global_id = f"ORDER_{oid}"
-                    exists = db.query(TransactionHistory).filter(TransactionHistory.transaction_id == global_id).first()
-                    
-                    avg_price = data['price_sum'] / data['qty'] if data['qty'] > 0 else 0
-                    
-                    if not exists:
-                        db_item = TransactionHistory(
-                            account_id=account.id,
-                            symbol=data['symbol'],
-                            type="TRADE",
-                            side=data['side'],
-                            price=avg_price,
-                            qty=data['qty'],
-                            quote_qty=data['quote_qty'],
-                            commission=data['commission'],
-                            commission_asset=data['commission_asset'],
-                            realized_pnl=data['realized_pnl'],
-                            time=datetime.utcfromtimestamp(data['time'] / 1000),
-                            order_id=oid,
-                            transaction_id=global_id
-                        )
-                        db.add(db_item)
-                        count += 1
-                    else:
-                        # Update existing aggregated record if data changed
-                        exists.price = avg_price
-                        exists.qty = data['qty']
-                        exists.quote_qty = data['quote_qty']
-                        exists.commission = data['commission']
-                        exists.realized_pnl = data['realized_pnl']
-                        exists.time = datetime.utcfromtimestamp(data['time'] / 1000)
-                        db.add(exists)
-            
-            if count > 0:
-                db.commit()
-                logging.info("position-sync: synced %s new history items for account %s", count, account.id)
+            await self.sync_history(account, adapter)
         except Exception:
             logging.exception("position-sync: error syncing history for account %s", account.id)
-            db.rollback()
 
     async def poller(self):
         self._running = True
@@ -408,4 +371,17 @@ class PositionSyncService:
 
 def get_position_sync_from_env() -> PositionSyncService:
     interval = int(os.getenv("POSITION_SYNC_INTERVAL", "30"))
-    return PositionSyncService(interval=interval)
+    account_concurrency = int(os.getenv("POSITION_SYNC_ACCOUNT_CONCURRENCY", "4"))
+    # "stream" applies user-data WebSocket events and keeps REST polling for reconciliation
+    if os.getenv("POSITION_SYNC_MODE", "poll").lower() == "stream":
+        from app.services.user_data_stream import UserDataStreamService
+
+        return UserDataStreamService(
+            stream_url=os.getenv("USER_DATA_STREAM_URL") or None,
+            listen_key_url=os.getenv("USER_DATA_LISTEN_KEY_URL") or None,
+            keepalive_interval=float(os.getenv("USER_DATA_KEEPALIVE_INTERVAL", "1800")),
+            reconcile_interval=float(os.getenv("USER_DATA_RECONCILE_INTERVAL", "300")),
+            interval=interval,
+            account_concurrency=account_concurrency,
+        )
+    return PositionSyncService(interval=interval, account_concurrency=account_concurrency)
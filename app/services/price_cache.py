@@ -0,0 +1,66 @@
+"""Process-wide latest-price store populated by MarketDataService.
+
+Holds the most recent price per symbol together with where it came from,
+the exchange timestamp (when the payload carries one) and when we received
+it. Readers get None for entries older than the TTL instead of a stale price.
+"""
+import os
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+
+class PriceEntry(NamedTuple):
+    symbol: str
+    price: float
+    source: str
+    exchange_ts: Optional[int]  # exchange event time, ms since epoch
+    received_ts: float  # local receive time, seconds since epoch
+
+    def age(self, now: Optional[float] = None) -> float:
+        return (now or time.time()) - self.received_ts
+
+
+class PriceCache:
+    def __init__(self, ttl: float = 30.0):
+        self.ttl = ttl
+        self._entries: Dict[str, PriceEntry] = {}
+
+    @staticmethod
+    def _key(symbol: str) -> str:
+        return symbol.replace("/", "").upper()
+
+    def update(self, symbol: str, price: float, source: str, exchange_ts: Optional[int] = None):
+        key = self._key(symbol)
+        self._entries[key] = PriceEntry(key, float(price), source, exchange_ts, time.time())
+
+    def get(self, symbol: str, max_age: Optional[float] = None) -> Optional[PriceEntry]:
+        """Return the entry for `symbol`, or None if missing or older than max_age (default TTL)."""
+        entry = self._entries.get(self._key(symbol))
+        if entry is None:
+            return None
+        if entry.age() > (self.ttl if max_age is None else max_age):
+            return None
+        return entry
+
+    def get_price(self, symbol: str, max_age: Optional[float] = None) -> Optional[float]:
+        entry = self.get(symbol, max_age)
+        return entry.price if entry else None
+
+    def snapshot(self, symbols: Optional[Iterable[str]] = None, include_stale: bool = False) -> List[PriceEntry]:
+        if symbols is None:
+            entries = list(self._entries.values())
+        else:
+            entries = [e for e in (self._entries.get(self._key(s)) for s in symbols) if e]
+        if not include_stale:
+            now = time.time()
+            entries = [e for e in entries if e.age(now) <= self.ttl]
+        return sorted(entries, key=lambda e: e.symbol)
+
+
+# module-level default cache (singleton)
+price_cache = PriceCache(ttl=float(os.getenv("PRICE_CACHE_TTL", "30")))
+
+
+def get_latest_price(symbol: str, max_age: Optional[float] = None) -> Optional[float]:
+    """Fresh price for `symbol` from the shared cache, or None if unknown/stale."""
+    return price_cache.get_price(symbol, max_age)
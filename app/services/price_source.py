@@ -0,0 +1,200 @@
+"""Offline price sources for MarketDataService.
+
+By default the service fetches live prices from Binance REST itself (with
+symbol routing and bulk/per-symbol selection). A PriceSource replaces that
+fetch so the rest of the pipeline (price -> DB -> risk -> WebSocket) can be
+driven without touching the exchange:
+
+- SyntheticPriceSource: seeded geometric random walk for any number of symbols
+- ReplayPriceSource: streams recorded ticker_history rows on a virtual clock
+  running `speedup` times faster than wall time
+
+Selected with MARKET_PRICE_SOURCE=binance|synthetic|replay.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import random
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, or_
+
+from app.core.database import SessionLocal
+from app.models.risk_control import TickerHistory
+
+
+class PriceSource(ABC):
+    name = "base"
+
+    @abstractmethod
+    async def fetch(self, symbols: List[str]) -> Dict[str, float]:
+        """Return normalized symbol -> price for the symbols this source knows."""
+
+    def exchange_ts(self, symbol: str) -> Optional[int]:
+        """Event time (ms since epoch) of the last price returned for `symbol`."""
+        return None
+
+
+class SyntheticPriceSource(PriceSource):
+    name = "synthetic"
+
+    def __init__(self, seed: int = 42, volatility: float = 0.0005, drift: float = 0.0,
+                 min_price: float = 0.01, max_price: float = 50000.0):
+        # volatility/drift are per sqrt(second) / per second, like the scheduler's volatility
+        self.seed = seed
+        self.volatility = volatility
+        self.drift = drift
+        self.min_price = min_price
+        self.max_price = max_price
+        self._rng = random.Random(seed)
+        # symbol -> (price, monotonic time of last step, exchange ts ms)
+        self._state: Dict[str, Tuple[float, float, int]] = {}
+
+    def _initial_price(self, symbol: str) -> float:
+        # derived from (seed, symbol) only, so a symbol starts at the same price in every run
+        digest = hashlib.sha256(f"{self.seed}:{symbol}".encode()).digest()
+        u = int.from_bytes(digest[:8], "big") / 2 ** 64
+        lo, hi = math.log(self.min_price), math.log(self.max_price)
+        return math.exp(lo + u * (hi - lo))
+
+    async def fetch(self, symbols: List[str]) -> Dict[str, float]:
+        now = time.monotonic()
+        ts = int(time.time() * 1000)
+        prices = {}
+        # sorted so the draw sequence only depends on the seed and the symbol set
+        for symbol in sorted(symbols):
+            state = self._state.get(symbol)
+            if state is None:
+                price = self._initial_price(symbol)
+            else:
+                price, last, _ = state
+                dt = max(0.0, now - last)
+                if dt > 0:
+                    price *= math.exp(self.drift * dt + self.volatility * math.sqrt(dt) * self._rng.gauss(0, 1))
+            self._state[symbol] = (price, now, ts)
+            prices[symbol] = price
+        return prices
+
+    def exchange_ts(self, symbol: str) -> Optional[int]:
+        state = self._state.get(symbol)
+        return state[2] if state else None
+
+
+class ReplayPriceSource(PriceSource):
+    name = "replay"
+
+    def __init__(self, speedup: float = 10.0, start: Optional[datetime] = None,
+                 end: Optional[datetime] = None, loop: bool = True, chunk_size: int = 5000):
+        self.speedup = speedup
+        self.start = start
+        # bound the replay at creation time so rows written while replaying are not replayed
+        self.end = end or datetime.utcnow()
+        self.loop = loop
+        self.chunk_size = chunk_size
+        self._latest: Dict[str, Tuple[float, datetime]] = {}
+        self._cursor: Optional[Tuple[datetime, int]] = None
+        self._virtual_start: Optional[datetime] = None
+        self._wall_start = 0.0
+        self._exhausted = False
+        self._lock = asyncio.Lock()
+        self.stats: Dict[str, int] = {"rows_replayed": 0, "loops": 0}
+
+    def _first_ts_sync(self) -> Optional[datetime]:
+        db = SessionLocal()
+        try:
+            q = db.query(TickerHistory.timestamp).filter(TickerHistory.timestamp <= self.end)
+            if self.start:
+                q = q.filter(TickerHistory.timestamp >= self.start)
+            row = q.order_by(TickerHistory.timestamp, TickerHistory.id).first()
+            return row[0] if row else None
+        finally:
+            db.close()
+
+    def _load_chunk_sync(self, upto: datetime) -> List[Tuple[int, str, float, datetime]]:
+        db = SessionLocal()
+        try:
+            q = db.query(TickerHistory.id, TickerHistory.symbol, TickerHistory.price, TickerHistory.timestamp).filter(
+                TickerHistory.timestamp <= min(upto, self.end)
+            )
+            if self._cursor is not None:
+                ts, row_id = self._cursor
+                q = q.filter(or_(TickerHistory.timestamp > ts,
+                                 and_(TickerHistory.timestamp == ts, TickerHistory.id > row_id)))
+            elif self.start:
+                q = q.filter(TickerHistory.timestamp >= self.start)
+            return q.order_by(TickerHistory.timestamp, TickerHistory.id).limit(self.chunk_size).all()
+        finally:
+            db.close()
+
+    def _restart(self, first: datetime):
+        self._virtual_start = first
+        self._wall_start = time.monotonic()
+        self._cursor = None
+        self._exhausted = False
+
+    async def _advance(self):
+        if self._virtual_start is None:
+            first = await asyncio.to_thread(self._first_ts_sync)
+            if first is None:
+                logging.warning("price-source: no ticker_history rows to replay")
+                return
+            self._restart(first)
+
+        virtual_now = self._virtual_start + timedelta(seconds=(time.monotonic() - self._wall_start) * self.speedup)
+        while not self._exhausted:
+            rows = await asyncio.to_thread(self._load_chunk_sync, virtual_now)
+            for row_id, symbol, price, ts in rows:
+                # rows are per position; the latest row per symbol wins
+                self._latest[symbol.replace("/", "").upper()] = (price, ts)
+                self._cursor = (ts, row_id)
+            self.stats["rows_replayed"] += len(rows)
+            if len(rows) < self.chunk_size:
+                if virtual_now >= self.end:
+                    self._exhausted = True
+                break
+
+        if self._exhausted and self.loop:
+            self.stats["loops"] += 1
+            logging.info("price-source: replay reached %s, restarting", self.end)
+            self._restart(self._virtual_start)
+
+    async def fetch(self, symbols: List[str]) -> Dict[str, float]:
+        async with self._lock:
+            await self._advance()
+        return {s: self._latest[s][0] for s in symbols if s in self._latest}
+
+    def exchange_ts(self, symbol: str) -> Optional[int]:
+        latest = self._latest.get(symbol)
+        if latest is None:
+            return None
+        return int((latest[1] - datetime(1970, 1, 1)).total_seconds() * 1000)
+
+
+def _parse_dt(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def get_price_source_from_env() -> Optional[PriceSource]:
+    """Return the configured offline source, or None for live Binance REST."""
+    kind = os.getenv("MARKET_PRICE_SOURCE", "binance").lower()
+    if kind == "synthetic":
+        return SyntheticPriceSource(
+            seed=int(os.getenv("MARKET_SYNTHETIC_SEED", "42")),
+            volatility=float(os.getenv("MARKET_SYNTHETIC_VOLATILITY", "0.0005")),
+            drift=float(os.getenv("MARKET_SYNTHETIC_DRIFT", "0")),
+        )
+    if kind == "replay":
+        return ReplayPriceSource(
+            speedup=float(os.getenv("MARKET_REPLAY_SPEEDUP", "10")),
+            start=_parse_dt(os.getenv("MARKET_REPLAY_START")),
+            end=_parse_dt(os.getenv("MARKET_REPLAY_END")),
+            loop=os.getenv("MARKET_REPLAY_LOOP", "true").lower() in ("1", "true", "yes"),
+        )
+    if kind != "binance":
+        logging.warning("price-source: unknown MARKET_PRICE_SOURCE=%s, using binance", kind)
+    return None
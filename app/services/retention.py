@@ -0,0 +1,199 @@
+"""Retention for time-series tables (ticker_history, account_snapshots).
+
+Runs in the background every `interval` seconds. For each table with a
+retention window it either
+
+- drops whole daily partitions older than the window when the table is
+  range-partitioned by day (see scripts/partition_ticker_history.py), and
+  keeps `partitions_ahead` future partitions in place, or
+- deletes expired rows in small primary-key ordered chunks, each in its own
+  short transaction with a pause in between, so no long locks are held.
+
+Every run produces a report of rows deleted / partitions dropped and the
+approximate bytes reclaimed, kept in `last_report` and logged.
+
+Retention is opt-in: tables without a window are kept forever. ticker_bars
+only holds rollups of ticks seen since the rollup service was enabled, so
+rebuild the older bars with scripts/rebuild_ticker_bars.py before enabling
+the ticker_history purge, or older charts lose their data.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+from app.core.database import engine
+
+
+# table -> timestamp column used for expiry
+RETENTION_TABLES: Dict[str, str] = {
+    "ticker_history": "timestamp",
+    "account_snapshots": "timestamp",
+}
+
+
+class RetentionService:
+    def __init__(self, retention_days: Dict[str, int], interval: int = 3600, chunk_size: int = 5000,
+                 chunk_pause: float = 0.2, partitions_ahead: int = 3):
+        # tables with a window <= 0 are kept forever
+        self.retention_days = {t: d for t, d in retention_days.items() if t in RETENTION_TABLES and d > 0}
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.chunk_pause = chunk_pause
+        self.partitions_ahead = partitions_ahead
+        self.last_report: Optional[Dict] = None
+        self._task = None
+        self._running = False
+        self._stopped = False
+
+    # -- introspection -------------------------------------------------------
+
+    def _table_stats_sync(self, table: str) -> Dict[str, int]:
+        with engine.connect() as conn:
+            row = conn.execute(text(
+                "SELECT AVG_ROW_LENGTH, DATA_LENGTH, INDEX_LENGTH FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t"
+            ), {"t": table}).first()
+        if not row:
+            return {}
+        return {"avg_row_length": int(row[0] or 0), "bytes": int((row[1] or 0) + (row[2] or 0))}
+
+    def _partitions_sync(self, table: str) -> List[Dict]:
+        """Return the table's RANGE partitions, or [] if it is not partitioned."""
+        with engine.connect() as conn:
+            rows = conn.execute(text(
+                "SELECT PARTITION_NAME, PARTITION_DESCRIPTION, DATA_LENGTH + INDEX_LENGTH "
+                "FROM information_schema.PARTITIONS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t AND PARTITION_NAME IS NOT NULL "
+                "ORDER BY PARTITION_ORDINAL_POSITION"
+            ), {"t": table}).all()
+        return [{"name": r[0], "less_than": r[1], "bytes": int(r[2] or 0)} for r in rows]
+
+    # -- partition rotation --------------------------------------------------
+
+    def _rotate_partitions_sync(self, table: str, cutoff: datetime, partitions: List[Dict]) -> Dict:
+        """Drop day partitions entirely before `cutoff` and pre-create future ones.
+
+        Partitions are named pYYYYMMDD with VALUES LESS THAN (TO_DAYS(next day)),
+        plus a trailing pmax catch-all.
+        """
+        dropped, reclaimed = [], 0
+        existing = {p["name"] for p in partitions}
+        with engine.connect() as conn:
+            for p in partitions:
+                name = p["name"]
+                if not (name.startswith("p") and name[1:].isdigit()):
+                    continue
+                day = datetime.strptime(name[1:], "%Y%m%d")
+                # partition holds [day, day + 1); droppable once its upper bound <= cutoff
+                if day + timedelta(days=1) <= cutoff:
+                    dropped.append(name)
+                    reclaimed += p["bytes"]
+            if dropped:
+                conn.execute(text(f"ALTER TABLE {table} DROP PARTITION {', '.join(dropped)}"))
+
+            today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+            missing = []
+            for i in range(self.partitions_ahead + 1):
+                day = today + timedelta(days=i)
+                name = f"p{day:%Y%m%d}"
+                if name not in existing:
+                    missing.append(
+                        f"PARTITION {name} VALUES LESS THAN (TO_DAYS('{day + timedelta(days=1):%Y-%m-%d}'))"
+                    )
+            if missing and "pmax" in existing:
+                conn.execute(text(
+                    f"ALTER TABLE {table} REORGANIZE PARTITION pmax INTO "
+                    f"({', '.join(missing)}, PARTITION pmax VALUES LESS THAN MAXVALUE)"
+                ))
+            conn.commit()
+        return {"partitions_dropped": dropped, "partitions_created": len(missing), "bytes_reclaimed": reclaimed}
+
+    # -- chunked deletion ----------------------------------------------------
+
+    def _delete_chunk_sync(self, table: str, column: str, cutoff: datetime) -> int:
+        params = {"cutoff": cutoff, "n": self.chunk_size}
+        with engine.begin() as conn:
+            res = conn.execute(text(
+                f"DELETE FROM {table} WHERE {column} < :cutoff ORDER BY id LIMIT :n"
+            ), params)
+            return res.rowcount or 0
+
+    async def _purge_table(self, table: str, days: int) -> Dict:
+        column = RETENTION_TABLES[table]
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        started = time.monotonic()
+        stats = await asyncio.to_thread(self._table_stats_sync, table)
+        report = {"table": table, "cutoff": cutoff.isoformat(), "rows_deleted": 0,
+                  "partitions_dropped": [], "bytes_reclaimed": 0}
+
+        partitions = await asyncio.to_thread(self._partitions_sync, table)
+        if partitions:
+            report.update(await asyncio.to_thread(self._rotate_partitions_sync, table, cutoff, partitions))
+        else:
+            while not self._stopped:
+                deleted = await asyncio.to_thread(self._delete_chunk_sync, table, column, cutoff)
+                report["rows_deleted"] += deleted
+                if deleted < self.chunk_size:
+                    break
+                await asyncio.sleep(self.chunk_pause)
+            # InnoDB does not shrink the file, but the pages become reusable
+            report["bytes_reclaimed"] = report["rows_deleted"] * stats.get("avg_row_length", 0)
+
+        report["table_bytes_before"] = stats.get("bytes")
+        report["seconds"] = round(time.monotonic() - started, 3)
+        return report
+
+    async def run_once(self) -> Dict:
+        tables = []
+        for table, days in self.retention_days.items():
+            try:
+                tables.append(await self._purge_table(table, days))
+            except Exception:
+                logging.exception("retention: failed to purge %s", table)
+                tables.append({"table": table, "error": True})
+        self.last_report = {"ran_at": datetime.utcnow().isoformat(), "tables": tables}
+        for t in tables:
+            logging.info("retention: %s", t)
+        return self.last_report
+
+    async def poller(self):
+        self._running = True
+        logging.info("retention: started (tables=%s interval=%s)", self.retention_days, self.interval)
+        while self._running:
+            try:
+                await self.run_once()
+            except Exception:
+                logging.exception("retention: unexpected error")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None and self.retention_days:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = asyncio.get_event_loop()
+            self._task = loop.create_task(self.poller())
+
+    def stop(self):
+        self._running = False
+        self._stopped = True
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+
+def get_retention_from_env() -> RetentionService:
+    return RetentionService(
+        retention_days={
+            "ticker_history": int(os.getenv("RETENTION_TICKER_HISTORY_DAYS", "0")),
+            "account_snapshots": int(os.getenv("RETENTION_ACCOUNT_SNAPSHOTS_DAYS", "0")),
+        },
+        interval=int(os.getenv("RETENTION_INTERVAL", "3600")),
+        chunk_size=int(os.getenv("RETENTION_CHUNK_SIZE", "5000")),
+        chunk_pause=float(os.getenv("RETENTION_CHUNK_PAUSE", "0.2")),
+        partitions_ahead=int(os.getenv("RETENTION_PARTITIONS_AHEAD", "3")),
+    )
@@ -0,0 +1,166 @@
+"""Process-wide cache of each account's active RiskConfig.
+
+Hot paths (price fan-out, position sync, risk checks) look configs up here
+instead of querying MySQL. Entries are immutable snapshots loaded lazily
+(including "no config" results), dropped by the risk-config routes when a
+config changes, and optionally reloaded every `refresh_interval` seconds to
+pick up changes made outside the API. Every change bumps `version`.
+"""
+import asyncio
+import logging
+import os
+import threading
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.database import SessionLocal
+from app.models.risk_control import RiskConfig
+
+
+class RiskConfigSnapshot(NamedTuple):
+    id: int
+    account_id: int
+    max_leverage: float
+    max_position_value: float
+    risk_ratio_threshold: float
+    max_single_order: float
+    price_deviation_limit: float
+    order_frequency_limit: int
+    max_daily_loss: float
+    risk_level_threshold: float
+    version: int
+
+    @classmethod
+    def from_row(cls, cfg: RiskConfig, version: int) -> "RiskConfigSnapshot":
+        return cls(
+            cfg.id, cfg.account_id, cfg.max_leverage, cfg.max_position_value, cfg.risk_ratio_threshold,
+            cfg.max_single_order, cfg.price_deviation_limit, cfg.order_frequency_limit, cfg.max_daily_loss,
+            cfg.risk_level_threshold, version,
+        )
+
+
+def _values(snap: Optional[RiskConfigSnapshot]):
+    return snap[:-1] if snap is not None else None
+
+
+class RiskConfigCache:
+    def __init__(self, refresh_interval: float = 60.0):
+        self.refresh_interval = refresh_interval
+        self.version = 0
+        # account id -> snapshot, or None when the account has no active config
+        self._entries: Dict[int, Optional[RiskConfigSnapshot]] = {}
+        # lookups also run in worker threads (market poller)
+        self._lock = threading.Lock()
+        self._task = None
+        self._running = False
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "invalidations": 0, "refreshes": 0}
+
+    def _load(self, db: Session, account_ids: Iterable[int]) -> Dict[int, Optional[RiskConfigSnapshot]]:
+        account_ids = list(account_ids)
+        loaded: Dict[int, Optional[RiskConfigSnapshot]] = {aid: None for aid in account_ids}
+        for cfg in db.query(RiskConfig).filter(
+            RiskConfig.account_id.in_(account_ids),
+            RiskConfig.is_active == True
+        ).order_by(RiskConfig.id).all():
+            # keep the first active config per account (matches .first() semantics)
+            if loaded[cfg.account_id] is None:
+                loaded[cfg.account_id] = RiskConfigSnapshot.from_row(cfg, self.version)
+        return loaded
+
+    def get_many(self, account_ids: Iterable[int], db: Optional[Session] = None) -> Dict[int, RiskConfigSnapshot]:
+        """Active configs for the given accounts; accounts without one are omitted.
+
+        Misses are loaded with one query, on `db` if given.
+        """
+        account_ids = set(account_ids)
+        with self._lock:
+            found = {aid: self._entries[aid] for aid in account_ids if aid in self._entries}
+            version = self.version
+            self.stats["hits"] += len(found)
+            self.stats["misses"] += len(account_ids) - len(found)
+        missing = account_ids - found.keys()
+        if missing:
+            own = db is None
+            db = SessionLocal() if own else db
+            try:
+                loaded = self._load(db, missing)
+            finally:
+                if own:
+                    db.close()
+            found.update(loaded)
+            with self._lock:
+                # an invalidation during the load may mean we read the old row; don't cache it
+                if self.version == version:
+                    self._entries.update(loaded)
+        return {aid: snap for aid, snap in found.items() if snap is not None}
+
+    def get(self, account_id: int, db: Optional[Session] = None) -> Optional[RiskConfigSnapshot]:
+        return self.get_many([account_id], db).get(account_id)
+
+    def invalidate(self, account_id: Optional[int] = None):
+        """Drop one account's entry (or everything) so the next lookup reloads it."""
+        with self._lock:
+            self.version += 1
+            self.stats["invalidations"] += 1
+            if account_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(account_id, None)
+
+    def refresh(self):
+        """Reload every cached account in one query (picks up out-of-band edits)."""
+        with self._lock:
+            account_ids = list(self._entries)
+            version = self.version
+        if not account_ids:
+            return
+        db = SessionLocal()
+        try:
+            loaded = self._load(db, account_ids)
+        finally:
+            db.close()
+        with self._lock:
+            if self.version != version:
+                return  # invalidated meanwhile; the next lookups reload
+            # compare config values only, not the version they were loaded at
+            changed = [aid for aid, snap in loaded.items()
+                       if aid in self._entries and _values(self._entries[aid]) != _values(snap)]
+            if changed:
+                self.version += 1
+                for aid in changed:
+                    snap = loaded[aid]
+                    self._entries[aid] = snap._replace(version=self.version) if snap else None
+            self.stats["refreshes"] += 1
+        if changed:
+            logging.info("risk-config-cache: refreshed, configs changed for accounts %s", changed)
+
+    async def _run(self):
+        self._running = True
+        while self._running:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception:
+                logging.exception("risk-config-cache: refresh failed")
+
+    def start(self):
+        if self._task is None and self.refresh_interval > 0:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = asyncio.get_event_loop()
+            self._task = loop.create_task(self._run())
+
+    def stop(self):
+        self._running = False
+        if self._task and not self._task.done():
+            self._task.cancel()
+        self._task = None
+
+    def snapshot(self) -> Dict:
+        return {"version": self.version, "cached_accounts": len(self._entries), **self.stats}
+
+
+# shared by the risk service, the pollers and the config routes, which invalidate it on writes
+risk_config_cache = RiskConfigCache(refresh_interval=float(os.getenv("RISK_CONFIG_REFRESH_INTERVAL", "60")))
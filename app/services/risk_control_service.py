@@ -1,7 +1,10 @@
 from typing import Optional, Dict, List
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
+from types import SimpleNamespace
 from app.models.risk_control import Account, RiskConfig, Position, RiskAlert, RiskLevelEnum, OrderLog
+from app.services.price_cache import get_latest_price
+from app.services.risk_config_cache import risk_config_cache
 
 class RiskControlService:
     def __init__(self, db: Session):
@@ -13,10 +16,7 @@ class RiskControlService:
         if not account:
             return {"passed": False, "reason": "Account not found"}
 
-        risk_config = self.db.query(RiskConfig).filter(
-            RiskConfig.account_id == account_id,
-            RiskConfig.is_active == True
-        ).first()
+        risk_config = risk_config_cache.get(account_id, self.db)
 
         if not risk_config:
             return {"passed": False, "reason": "Risk configuration not found"}
@@ -40,10 +40,7 @@ class RiskControlService:
 
     def check_order_risk(self, account_id: int, symbol: str, size: float, price: float) -> Dict:
         """检查订单风险"""
-        risk_config = self.db.query(RiskConfig).filter(
-            RiskConfig.account_id == account_id,
-            RiskConfig.is_active == True
-        ).first()
+        risk_config = risk_config_cache.get(account_id, self.db)
 
         if not risk_config:
             return {"passed": False, "reason": "Risk configuration not found"}
@@ -69,6 +66,10 @@ class RiskControlService:
 
         return {"passed": True}
 
+    def get_latest_price(self, symbol: str, max_age: Optional[float] = None) -> Optional[float]:
+        """获取最新价格（内存行情缓存，过期返回 None）"""
+        return get_latest_price(symbol, max_age)
+
     def calculate_risk_level(self, position: Position, risk_config: RiskConfig) -> RiskLevelEnum:
         """计算风险等级"""
         if not position.current_price or not position.entry_price:
@@ -87,6 +88,12 @@ class RiskControlService:
         else:
             return RiskLevelEnum.LOW
 
+    def calculate_risk_level_at(self, current_price: float, entry_price: float, size: float,
+                                risk_config: RiskConfig) -> RiskLevelEnum:
+        """按给定价格计算风险等级（不修改持仓 ORM 对象）"""
+        view = SimpleNamespace(current_price=current_price, entry_price=entry_price, size=size)
+        return self.calculate_risk_level(view, risk_config)
+
     def create_risk_alert(self, account_id: int, alert_type: str, risk_level: RiskLevelEnum, 
                          message: str, details: Optional[Dict] = None) -> RiskAlert:
         """创建风险预警"""
@@ -133,10 +140,7 @@ class RiskControlService:
         position.unrealized_pnl = (current_price - position.entry_price) * position.size
 
         # 更新风险等级
-        risk_config = self.db.query(RiskConfig).filter(
-            RiskConfig.account_id == position.account_id,
-            RiskConfig.is_active == True
-        ).first()
+        risk_config = risk_config_cache.get(position.account_id, self.db)
         
         if risk_config:
             position.risk_level = self.calculate_risk_level(position, risk_config)
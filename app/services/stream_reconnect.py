@@ -0,0 +1,39 @@
+"""Reconnect loop with jittered exponential backoff for WebSocket streams.
+
+Used by the mark-price and user-data stream services: `connect` runs one
+connection until it drops, and the loop reconnects after
+backoff_base * 2^attempt seconds (capped at backoff_max, scaled by a random
+0.5-1.0 so many clients don't reconnect in lockstep). A connection that
+stayed up longer than backoff_max resets the backoff.
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Optional
+
+
+async def reconnect_loop(connect: Callable[[], Awaitable], running: Callable[[], bool], label: str,
+                         backoff_base: float, backoff_max: float,
+                         on_disconnect: Optional[Callable[[], Awaitable]] = None):
+    """Run `connect` until `running()` turns false; `on_disconnect` runs before each backoff wait."""
+    attempt = 0
+    while running():
+        connected_at = time.monotonic()
+        try:
+            await connect()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.warning("%s: connection error: %s", label, e)
+        if not running():
+            break
+        if on_disconnect is not None:
+            await on_disconnect()
+        if time.monotonic() - connected_at > backoff_max:
+            attempt = 0
+        delay = min(backoff_max, backoff_base * (2 ** attempt))
+        delay *= random.uniform(0.5, 1.0)
+        attempt += 1
+        logging.info("%s: reconnecting in %.1fs", label, delay)
+        await asyncio.sleep(delay)
@@ -0,0 +1,111 @@
+"""Learned futures-vs-spot routing for ticker symbols.
+
+The market poller asks the router which Binance market a symbol trades on so
+that the steady state is a single request per symbol. Symbols that neither
+market knows are negatively cached for a while, and every entry is
+re-validated periodically in case a symbol gets listed/delisted.
+"""
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from app.core.database import SessionLocal
+from app.models.risk_control import SymbolRoute
+
+
+FUTURES = "futures"
+SPOT = "spot"
+INVALID = "invalid"
+
+
+class SymbolRouter:
+    def __init__(self, revalidate_after: int = 3600, invalid_ttl: int = 600, persist: bool = False):
+        self.revalidate_after = revalidate_after
+        self.invalid_ttl = invalid_ttl
+        self.persist = persist
+        # symbol -> (market, monotonic time the route was learned)
+        self._routes: Dict[str, Tuple[str, float]] = {}
+        # routes changed or re-confirmed since the last flush() (persist mode only)
+        self._dirty: Dict[str, str] = {}
+        # symbol -> monotonic time its stored checked_at was last written (or loaded)
+        self._persisted_at: Dict[str, float] = {}
+
+    def lookup(self, symbol: str) -> Optional[str]:
+        """Return the known market for `symbol`, or None if it must be (re)probed."""
+        entry = self._routes.get(symbol)
+        if entry is None:
+            return None
+        market, learned_at = entry
+        ttl = self.invalid_ttl if market == INVALID else self.revalidate_after
+        if time.monotonic() - learned_at > ttl:
+            return None
+        return market
+
+    def learn(self, symbol: str, market: str):
+        previous = self._routes.get(symbol)
+        now = time.monotonic()
+        self._routes[symbol] = (market, now)
+        changed = previous is None or previous[0] != market
+        if changed:
+            logging.info("symbol-routing: %s -> %s", symbol, market)
+        # re-confirmed routes are written too (at most every half revalidation period),
+        # so checked_at stays current and a restart doesn't re-probe them
+        stale = now - self._persisted_at.get(symbol, float("-inf")) >= self.revalidate_after / 2
+        if self.persist and (changed or stale):
+            self._dirty[symbol] = market
+            self._persisted_at[symbol] = now
+
+    def forget(self, symbol: str):
+        self._routes.pop(symbol, None)
+
+    def snapshot(self) -> Dict[str, str]:
+        return {symbol: market for symbol, (market, _) in self._routes.items()}
+
+    def load(self):
+        """Seed the in-memory table from the symbol_routes table (persist mode only)."""
+        if not self.persist:
+            return
+        db = SessionLocal()
+        try:
+            now = time.monotonic()
+            wall_now = datetime.utcnow()
+            for row in db.query(SymbolRoute).all():
+                # carry over the row's age so stale rows are still re-validated on time
+                age = (wall_now - row.checked_at).total_seconds() if row.checked_at else self.revalidate_after
+                self._routes[row.symbol] = (row.market, now - max(0.0, age))
+                self._persisted_at[row.symbol] = now - max(0.0, age)
+            logging.info("symbol-routing: loaded %s routes", len(self._routes))
+        except Exception:
+            logging.exception("symbol-routing: failed to load persisted routes")
+        finally:
+            db.close()
+
+    def flush(self):
+        """Write changed routes to the symbol_routes table.
+
+        Blocking; callers on the event loop should run it via asyncio.to_thread.
+        """
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        db = SessionLocal()
+        try:
+            existing = {
+                row.symbol: row
+                for row in db.query(SymbolRoute).filter(SymbolRoute.symbol.in_(list(dirty))).all()
+            }
+            now = datetime.utcnow()
+            for symbol, market in dirty.items():
+                row = existing.get(symbol)
+                if row:
+                    row.market = market
+                    row.checked_at = now
+                else:
+                    db.add(SymbolRoute(symbol=symbol, market=market, checked_at=now))
+            db.commit()
+        except Exception:
+            logging.exception("symbol-routing: failed to persist %s routes", len(dirty))
+            db.rollback()
+        finally:
+            db.close()
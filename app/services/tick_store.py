@@ -0,0 +1,249 @@
+"""Local columnar tick store backed by memory-mapped NumPy arrays.
+
+Each symbol gets a directory under `root` holding two append-only column
+files, `ts.i8` (int64 ms since epoch) and `px.f8` (float64 price), plus a
+`meta.json` with the row count and a day index (first row offset of every
+UTC day). Files are grown by doubling; unused capacity is zero-filled, so on
+open the row count is recovered by scanning past the last persisted count.
+
+`read()` returns zero-copy slices of the mapped columns, so volatility, VaR
+and chart computations run on arrays instead of materializing TickerHistory
+ORM objects.
+"""
+import asyncio
+import bisect
+import json
+import logging
+import os
+import re
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+DAY_MS = 86_400_000
+_EPOCH = datetime(1970, 1, 1)
+
+
+def to_ms(ts: datetime) -> int:
+    return int((ts - _EPOCH).total_seconds() * 1000)
+
+
+class _SymbolColumns:
+    def __init__(self, path: str, initial_capacity: int):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._meta_path = os.path.join(path, "meta.json")
+        meta = {}
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path) as f:
+                meta = json.load(f)
+        self.count = int(meta.get("count", 0))
+        # [(day number, first row offset)], ascending
+        self.days: List[Tuple[int, int]] = [tuple(d) for d in meta.get("days", [])]
+        capacity = max(initial_capacity, self.count)
+        ts_path = os.path.join(path, "ts.i8")
+        if os.path.exists(ts_path):
+            capacity = max(capacity, os.path.getsize(ts_path) // 8)
+        self._map(capacity)
+        self._recover()
+
+    def _map(self, capacity: int):
+        for name, dtype in (("ts.i8", np.int64), ("px.f8", np.float64)):
+            file_path = os.path.join(self.path, name)
+            size = capacity * np.dtype(dtype).itemsize
+            with open(file_path, "ab") as f:
+                if f.tell() < size:
+                    f.truncate(size)
+        self.capacity = capacity
+        self.ts = np.memmap(os.path.join(self.path, "ts.i8"), dtype=np.int64, mode="r+", shape=(capacity,))
+        self.px = np.memmap(os.path.join(self.path, "px.f8"), dtype=np.float64, mode="r+", shape=(capacity,))
+
+    def _recover(self):
+        # rows appended after the last meta flush are non-zero timestamps past `count`
+        tail = np.flatnonzero(self.ts[self.count:] == 0)
+        end = self.count + (int(tail[0]) if tail.size else self.capacity - self.count)
+        for i in range(self.count, end):
+            day = int(self.ts[i]) // DAY_MS
+            if not self.days or self.days[-1][0] != day:
+                self.days.append((day, i))
+        self.count = end
+
+    def append(self, ts_ms: int, price: float) -> bool:
+        if self.count and ts_ms < self.ts[self.count - 1]:
+            return False  # append-only: out-of-order ticks are dropped
+        if self.count == self.capacity:
+            self.flush()
+            self._map(self.capacity * 2)
+        day = ts_ms // DAY_MS
+        if not self.days or self.days[-1][0] != day:
+            self.days.append((day, self.count))
+        self.ts[self.count] = ts_ms
+        self.px[self.count] = price
+        self.count += 1
+        return True
+
+    def bounds(self, start_ms: Optional[int], end_ms: Optional[int]) -> Tuple[int, int]:
+        """Row range [lo, hi) with start_ms <= ts < end_ms, narrowed by the day index."""
+        lo, hi = 0, self.count
+        day_numbers = [d for d, _ in self.days]
+        if start_ms is not None:
+            i = bisect.bisect_right(day_numbers, start_ms // DAY_MS) - 1
+            base = self.days[i][1] if i >= 0 else 0
+            lo = base + int(np.searchsorted(self.ts[base:hi], start_ms, side="left"))
+        if end_ms is not None:
+            j = bisect.bisect_right(day_numbers, end_ms // DAY_MS)
+            top = self.days[j][1] if j < len(self.days) else self.count
+            hi = lo + int(np.searchsorted(self.ts[lo:top], end_ms, side="left"))
+        return lo, max(lo, hi)
+
+    def flush(self):
+        self.ts.flush()
+        self.px.flush()
+        tmp = self._meta_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"count": self.count, "days": self.days}, f)
+        os.replace(tmp, self._meta_path)
+
+
+class TickStore:
+    def __init__(self, root: str, initial_capacity: int = 65536, flush_interval: float = 30.0):
+        self.root = root
+        self.initial_capacity = initial_capacity
+        self.flush_interval = flush_interval
+        self._symbols: Dict[str, _SymbolColumns] = {}
+        self._task = None
+        self._running = False
+        self.stats: Dict[str, int] = {"ticks_appended": 0, "ticks_out_of_order": 0}
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def _key(symbol: str) -> str:
+        return re.sub(r"[^A-Z0-9]", "", symbol.upper())
+
+    def _columns(self, symbol: str, create: bool = False) -> Optional[_SymbolColumns]:
+        key = self._key(symbol)
+        cols = self._symbols.get(key)
+        if cols is None:
+            path = os.path.join(self.root, key)
+            if not create and not os.path.isdir(path):
+                return None
+            cols = self._symbols[key] = _SymbolColumns(path, self.initial_capacity)
+        return cols
+
+    def symbols(self) -> List[str]:
+        return sorted(d for d in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, d)))
+
+    def append(self, symbol: str, price: float, ts: Optional[datetime] = None):
+        ts_ms = to_ms(ts or datetime.utcnow())
+        if self._columns(symbol, create=True).append(ts_ms, price):
+            self.stats["ticks_appended"] += 1
+        else:
+            self.stats["ticks_out_of_order"] += 1
+
+    def append_prices(self, prices: Dict[str, float], ts: Optional[datetime] = None):
+        ts = ts or datetime.utcnow()
+        for symbol, price in prices.items():
+            self.append(symbol, price, ts)
+
+    def read(self, symbol: str, start: Optional[datetime] = None,
+             end: Optional[datetime] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Zero-copy (timestamps ms, prices) views for start <= ts < end.
+
+        The views stay valid after later appends; they just don't see them.
+        """
+        cols = self._columns(symbol)
+        if cols is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        lo, hi = cols.bounds(to_ms(start) if start else None, to_ms(end) if end else None)
+        return cols.ts[lo:hi], cols.px[lo:hi]
+
+    def flush(self):
+        for cols in self._symbols.values():
+            try:
+                cols.flush()
+            except Exception:
+                logging.exception("tick-store: failed to flush %s", cols.path)
+
+    async def _run(self):
+        self._running = True
+        while self._running:
+            await asyncio.sleep(self.flush_interval)
+            await asyncio.to_thread(self.flush)
+
+    def start(self):
+        if self._task is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = asyncio.get_event_loop()
+            self._task = loop.create_task(self._run())
+
+    async def stop(self):
+        self._running = False
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        self.flush()
+
+
+# -- array analytics ----------------------------------------------------------
+
+def log_returns(px: np.ndarray) -> np.ndarray:
+    px = px[px > 0]
+    return np.diff(np.log(px)) if px.size > 1 else np.empty(0)
+
+
+def realized_volatility(ts: np.ndarray, px: np.ndarray, annualize: bool = True) -> Optional[float]:
+    """Std-dev of log returns, scaled to one year by the mean tick spacing."""
+    rets = log_returns(px)
+    if rets.size < 2:
+        return None
+    vol = float(np.std(rets, ddof=1))
+    if annualize:
+        spacing = float(ts[-1] - ts[0]) / (ts.size - 1) / 1000.0
+        if spacing > 0:
+            vol *= np.sqrt(365 * 86400 / spacing)
+    return vol
+
+
+def historical_var(px: np.ndarray, confidence: float = 0.99) -> Optional[float]:
+    """Historical one-tick VaR as a positive fraction of price."""
+    rets = log_returns(px)
+    if rets.size == 0:
+        return None
+    return float(-np.expm1(np.quantile(rets, 1 - confidence)))
+
+
+def ohlc(ts: np.ndarray, px: np.ndarray, step_ms: int) -> Dict[str, np.ndarray]:
+    """Bucket ticks into OHLC bars of `step_ms` for charting."""
+    if ts.size == 0:
+        return {k: np.empty(0) for k in ("bucket", "open", "high", "low", "close", "count")}
+    buckets = ts - ts % step_ms
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], ts.size]
+    return {
+        "bucket": buckets[starts],
+        "open": px[starts],
+        "high": np.maximum.reduceat(px, starts),
+        "low": np.minimum.reduceat(px, starts),
+        "close": px[ends - 1],
+        "count": ends - starts,
+    }
+
+
+def get_tick_store_from_env() -> Optional[TickStore]:
+    """TICK_STORE_DIR enables the store; unset means disabled."""
+    root = os.getenv("TICK_STORE_DIR")
+    if not root:
+        return None
+    return TickStore(
+        root,
+        initial_capacity=int(os.getenv("TICK_STORE_INITIAL_CAPACITY", "65536")),
+        flush_interval=float(os.getenv("TICK_STORE_FLUSH_INTERVAL", "30")),
+    )
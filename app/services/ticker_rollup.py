@@ -0,0 +1,140 @@
+"""Incremental OHLC rollups of ticker prices into the ticker_bars table.
+
+The market service feeds one tick per symbol per price update. Ticks are
+folded into in-memory *delta* bars for every resolution and periodically
+merged into ticker_bars with an upsert (high = GREATEST, low = LEAST,
+close = latest, tick_count += delta). Because only deltas are written, a
+restart mid-bucket simply continues the stored bar.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.dialects.mysql import insert
+
+from app.core.database import engine
+from app.models.risk_control import TickerBar
+
+
+RESOLUTIONS: Dict[str, timedelta] = {
+    "1m": timedelta(minutes=1),
+    "5m": timedelta(minutes=5),
+    "1h": timedelta(hours=1),
+    "1d": timedelta(days=1),
+}
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def bucket_start(ts: datetime, resolution: str) -> datetime:
+    step = RESOLUTIONS[resolution]
+    return ts - ((ts - _EPOCH) % step)
+
+
+class TickerRollup:
+    def __init__(self, flush_interval: float = 10.0):
+        self.flush_interval = flush_interval
+        # (symbol, resolution, bucket_start) -> [open, high, low, close, count]
+        self._deltas: Dict[Tuple[str, str, datetime], list] = {}
+        self._task = None
+        self._running = False
+        self._wakeup = asyncio.Event()
+        self.stats: Dict[str, int] = {"ticks": 0, "bars_flushed": 0}
+
+    def add_tick(self, symbol: str, price: float, ts: Optional[datetime] = None,
+                 resolutions: Optional[Iterable[str]] = None):
+        ts = ts or datetime.utcnow()
+        self.stats["ticks"] += 1
+        for resolution in RESOLUTIONS if resolutions is None else resolutions:
+            key = (symbol, resolution, bucket_start(ts, resolution))
+            bar = self._deltas.get(key)
+            if bar is None:
+                self._deltas[key] = [price, price, price, price, 1]
+            else:
+                bar[1] = max(bar[1], price)
+                bar[2] = min(bar[2], price)
+                bar[3] = price
+                bar[4] += 1
+
+    def add_prices(self, prices: Dict[str, float], ts: Optional[datetime] = None):
+        ts = ts or datetime.utcnow()
+        for symbol, price in prices.items():
+            self.add_tick(symbol, price, ts)
+
+    def _rows(self, deltas) -> List[dict]:
+        now = datetime.utcnow()
+        return [
+            {
+                "symbol": symbol,
+                "resolution": resolution,
+                "bucket_start": start,
+                "open": o, "high": h, "low": l, "close": c, "tick_count": n,
+                "created_at": now, "updated_at": now,
+            }
+            for (symbol, resolution, start), (o, h, l, c, n) in deltas.items()
+        ]
+
+    def _upsert_sync(self, rows: List[dict]):
+        stmt = insert(TickerBar.__table__)
+        stmt = stmt.on_duplicate_key_update(
+            high=func.greatest(TickerBar.__table__.c.high, stmt.inserted.high),
+            low=func.least(TickerBar.__table__.c.low, stmt.inserted.low),
+            close=stmt.inserted.close,
+            tick_count=TickerBar.__table__.c.tick_count + stmt.inserted.tick_count,
+            updated_at=stmt.inserted.updated_at,
+        )
+        with engine.begin() as conn:
+            conn.execute(stmt, rows)
+
+    async def flush(self):
+        if not self._deltas:
+            return
+        deltas, self._deltas = self._deltas, {}
+        rows = self._rows(deltas)
+        try:
+            await asyncio.to_thread(self._upsert_sync, rows)
+            self.stats["bars_flushed"] += len(rows)
+        except Exception:
+            logging.exception("ticker-rollup: failed to upsert %s bars", len(rows))
+            # merge the unwritten deltas back so the ticks are not lost
+            for key, (o, h, l, c, n) in deltas.items():
+                bar = self._deltas.get(key)
+                if bar is None:
+                    self._deltas[key] = [o, h, l, c, n]
+                else:
+                    self._deltas[key] = [o, max(h, bar[1]), min(l, bar[2]), bar[3], n + bar[4]]
+
+    async def _run(self):
+        while self._running:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = asyncio.get_event_loop()
+            # set before the task runs so a stop() right after start() is not undone
+            self._running = True
+            self._task = loop.create_task(self._run())
+
+    async def stop(self):
+        self._running = False
+        if self._task and not self._task.done():
+            # let an in-flight upsert finish before the final flush, or it could commit a stale close after it
+            self._wakeup.set()
+            await self._task
+        self._task = None
+        await self.flush()
+
+
+def get_rollup_from_env() -> TickerRollup:
+    return TickerRollup(flush_interval=float(os.getenv("TICKER_ROLLUP_FLUSH_INTERVAL", "10")))
@@ -0,0 +1,145 @@
+"""Write-behind buffer for TickerHistory rows.
+
+The market poller hands ticker rows to the writer instead of inserting them
+inside its position-update transaction. Rows are accumulated in a bounded
+in-memory buffer and flushed as multi-row INSERTs when either `batch_size`
+rows are pending or `flush_interval` seconds have passed, so history write
+volume no longer sits on the poll latency path.
+
+When the buffer is full the drop policy decides what happens:
+- drop_oldest: evict the oldest buffered rows (default, keeps history fresh)
+- drop_newest: reject the incoming rows
+- block: make the producer wait until a flush frees space (backpressure)
+"""
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import Deque, Dict, List
+
+from app.core.database import engine
+from app.models.risk_control import TickerHistory
+
+
+class TickerHistoryWriter:
+    DROP_POLICIES = ("drop_oldest", "drop_newest", "block")
+
+    def __init__(self, max_buffer: int = 50000, batch_size: int = 1000,
+                 flush_interval: float = 5.0, drop_policy: str = "drop_oldest"):
+        self.max_buffer = max_buffer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.drop_policy = drop_policy if drop_policy in self.DROP_POLICIES else "drop_oldest"
+        self._buffer: Deque[dict] = deque()
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Event()
+        self._space.set()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self._running = False
+        self.stats: Dict[str, int] = {
+            "rows_submitted": 0,
+            "rows_written": 0,
+            "rows_dropped": 0,
+            "rows_failed": 0,
+            "flushes": 0,
+        }
+
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    async def submit(self, rows: List[dict]):
+        """Queue ticker rows for a later bulk insert."""
+        if not rows:
+            return
+        self.stats["rows_submitted"] += len(rows)
+        for row in rows:
+            if len(self._buffer) >= self.max_buffer:
+                if self.drop_policy == "drop_newest":
+                    self.stats["rows_dropped"] += 1
+                    continue
+                if self.drop_policy == "drop_oldest":
+                    self._buffer.popleft()
+                    self.stats["rows_dropped"] += 1
+                else:
+                    # backpressure: wake the flusher and wait for room
+                    self._space.clear()
+                    self._wakeup.set()
+                    while len(self._buffer) >= self.max_buffer and self._running:
+                        await self._space.wait()
+                        self._space.clear()
+            self._buffer.append(row)
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def _insert_sync(self, rows: List[dict]):
+        # executemany on a core INSERT is rewritten into multi-row INSERT ... VALUES by the driver
+        with engine.begin() as conn:
+            conn.execute(TickerHistory.__table__.insert(), rows)
+
+    async def flush(self, drain: bool = False):
+        """Write pending rows in batches; with drain=False only one batch is written."""
+        async with self._flush_lock:
+            while self._buffer:
+                batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+                self._space.set()
+                try:
+                    await asyncio.to_thread(self._insert_sync, batch)
+                    self.stats["rows_written"] += len(batch)
+                    self.stats["flushes"] += 1
+                except Exception:
+                    logging.exception("ticker-writer: failed to write %s rows", len(batch))
+                    self.stats["rows_failed"] += len(batch)
+                    # keep failed rows for the next attempt if there is room for them
+                    room = self.max_buffer - len(self._buffer)
+                    if room > 0:
+                        self._buffer.extendleft(reversed(batch[:room]))
+                    self.stats["rows_dropped"] += max(0, len(batch) - room)
+                    break
+                if not drain and len(self._buffer) < self.batch_size:
+                    break
+
+    async def _run(self):
+        logging.info("ticker-writer: started (batch=%s interval=%s policy=%s)",
+                     self.batch_size, self.flush_interval, self.drop_policy)
+        while self._running:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logging.exception("ticker-writer: flush loop error")
+
+    def start(self):
+        if self._task is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = asyncio.get_event_loop()
+            # set before the task runs so a stop() right after start() is not undone
+            self._running = True
+            self._task = loop.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush loop and write everything still buffered."""
+        self._running = False
+        self._space.set()
+        if self._task and not self._task.done():
+            # let an in-flight flush finish (and count its rows) instead of cancelling it mid-insert
+            self._wakeup.set()
+            await self._task
+        self._task = None
+        await self.flush(drain=True)
+        logging.info("ticker-writer: stopped (stats=%s)", self.stats)
+
+
+def get_ticker_writer_from_env() -> TickerHistoryWriter:
+    return TickerHistoryWriter(
+        max_buffer=int(os.getenv("TICKER_BUFFER_MAX", "50000")),
+        batch_size=int(os.getenv("TICKER_FLUSH_ROWS", "1000")),
+        flush_interval=float(os.getenv("TICKER_FLUSH_INTERVAL", "5")),
+        drop_policy=os.getenv("TICKER_DROP_POLICY", "drop_oldest").lower(),
+    )
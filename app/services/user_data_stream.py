@@ -0,0 +1,312 @@
+"""Event-driven account sync over Binance futures user-data streams.
+
+Alternative to polling /fapi/v2/positionRisk and /fapi/v2/account every
+`interval` seconds: each active account with credentials gets a listenKey
+(kept alive every `keepalive_interval` seconds) and a WebSocket, and events
+are applied as they arrive:
+
+- ACCOUNT_UPDATE: changed positions go through `_reconcile_positions` in
+  partial mode; changed stablecoin wallet balances adjust the account's
+  balance and equity,
+- ORDER_TRADE_UPDATE (execution type TRADE): the fill is folded into its
+  ORDER_ record with `store_history` and the symbol's trades cursor advanced,
+  so the REST history sync does not fetch it again,
+- ACCOUNT_CONFIG_UPDATE: leverage changes.
+
+Every (re)connect first runs a full REST sync while events wait in the socket
+buffer, then connected accounts are only reconciled over REST every
+`reconcile_interval` seconds; both always include the history sync. Accounts
+whose stream is down fall back to the regular poll interval and history
+cadence.
+
+Point USER_DATA_STREAM_URL / USER_DATA_LISTEN_KEY_URL at
+scripts/fake_user_data_server.py to run it against a local stand-in server.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, List, Optional, Set
+
+import websockets
+
+from app.core.database import SessionLocal
+from app.models.risk_control import Account, Position, SyncCursor
+from app.services.exchange.binance_adapter import create_adapter_for_account, is_binance_account
+from app.services.history_sync import TRADES_STREAM_PREFIX, account_lock, save_cursors, store_history
+from app.services.position_sync import PositionSyncService
+from app.services.stream_reconnect import reconnect_loop
+from app.services.ws_broadcast import manager as ws_manager
+
+
+# wallet balances counted in total_balance (USD-M single-asset margin)
+USD_ASSETS = ("USDT", "USDC", "BUSD", "FDUSD")
+
+
+class UserDataStreamService(PositionSyncService):
+    STREAM_URL = "wss://fstream.binance.com/ws"
+
+    def __init__(self, stream_url: Optional[str] = None, listen_key_url: Optional[str] = None,
+                 keepalive_interval: float = 1800.0, reconcile_interval: float = 300.0,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0, **kwargs):
+        super().__init__(**kwargs)
+        self.stream_url = (stream_url or self.STREAM_URL).rstrip('/')
+        self.listen_key_url = listen_key_url
+        self.keepalive_interval = keepalive_interval
+        self.reconcile_interval = reconcile_interval
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        # account id -> stream task
+        self._streams: Dict[int, asyncio.Task] = {}
+        self._connected: Set[int] = set()
+        self._last_reconcile: Dict[int, float] = {}
+        # exchange time (ms) the last REST sync started; older position events are stale
+        self._reconciled_at: Dict[int, int] = {}
+        # stream events and REST reconciliation of one account must not interleave
+        self._account_locks: Dict[int, asyncio.Lock] = {}
+        # account id -> asset -> last known wallet balance
+        self._balances: Dict[int, Dict[str, float]] = {}
+        self.stream_stats: Dict[str, int] = {
+            "stream_connects": 0,
+            "stream_events": 0,
+            "account_updates": 0,
+            "stale_account_updates": 0,
+            "fills": 0,
+            "duplicate_fills": 0,
+            "keepalives": 0,
+        }
+
+    def _lock_for(self, account_id: int) -> asyncio.Lock:
+        lock = self._account_locks.get(account_id)
+        if lock is None:
+            lock = self._account_locks[account_id] = asyncio.Lock()
+        return lock
+
+    # -- REST reconciliation -------------------------------------------------------
+
+    def _apply_account_info(self, db, account_id: int, account_info: Dict):
+        super()._apply_account_info(db, account_id, account_info)
+        # seed the wallet balances that stream deltas are applied against
+        self._balances[account_id] = {
+            a.get('asset'): float(a.get('walletBalance', 0) or 0) for a in account_info.get('assets') or []
+        }
+
+    async def _sync_account(self, account: Account, sync_history: Optional[bool] = None):
+        adapter = create_adapter_for_account(account)
+        async with self._lock_for(account.id):
+            offset = adapter.clock.offset_ms if adapter else 0.0
+            self._reconciled_at[account.id] = int(time.time() * 1000 + offset)
+            await super()._sync_account(account, sync_history=sync_history)
+            self._last_reconcile[account.id] = time.monotonic()
+
+    async def _sync_all(self):
+        db = SessionLocal()
+        try:
+            accounts = db.query(Account).filter(Account.is_active == True).all()
+        finally:
+            db.close()
+
+        self._ensure_streams(accounts)
+        now = time.monotonic()
+        due = [
+            a for a in accounts
+            if a.id not in self._connected or now - self._last_reconcile.get(a.id, 0.0) >= self.reconcile_interval
+        ]
+
+        async def _for_account(a):
+            try:
+                # a connected account's periodic reconcile is infrequent: always catch up history
+                # (income has no stream events); disconnected accounts follow the poll cadence
+                await self._sync_account(a, sync_history=True if a.id in self._connected else None)
+            except Exception:
+                logging.exception("user-data-stream: failed sync for account %s", a.id)
+
+        if due:
+            await asyncio.gather(*(_for_account(a) for a in due))
+        self._history_sync_counter += 1
+
+    # -- streams -------------------------------------------------------------------
+
+    def _ensure_streams(self, accounts: List[Account]):
+        """Start a stream per active Binance account with credentials; stop streams of removed accounts."""
+        wanted = {a.id for a in accounts if is_binance_account(a)}
+        for account_id in list(self._streams):
+            if account_id not in wanted:
+                self._streams.pop(account_id).cancel()
+                self._connected.discard(account_id)
+        for account_id in wanted:
+            task = self._streams.get(account_id)
+            if task is None or task.done():
+                self._streams[account_id] = asyncio.create_task(self._account_stream(account_id))
+
+    async def _keepalive_loop(self, adapter, ws):
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            if await adapter.keepalive_listen_key(self.listen_key_url):
+                self.stream_stats["keepalives"] += 1
+            else:
+                # the key may be gone; reconnecting opens a fresh one
+                await ws.close()
+                return
+
+    async def _run_account_stream(self, account_id: int):
+        db = SessionLocal()
+        try:
+            account = db.query(Account).filter(Account.id == account_id).first()
+        finally:
+            db.close()
+        adapter = create_adapter_for_account(account) if account is not None else None
+        if adapter is None:
+            raise RuntimeError("account has no usable exchange credentials")
+        listen_key = await adapter.create_listen_key(self.listen_key_url)
+        if not listen_key:
+            raise RuntimeError("could not open a listenKey")
+
+        async with websockets.connect(f"{self.stream_url}/{listen_key}", ping_interval=20, ping_timeout=20) as ws:
+            self.stream_stats["stream_connects"] += 1
+            logging.info("user-data-stream: account %s connected", account_id)
+            # catch up over REST first, history included; events received meanwhile wait in the socket
+            await self._sync_account(account, sync_history=True)
+            self._connected.add(account_id)
+            keepalive = asyncio.create_task(self._keepalive_loop(adapter, ws))
+            try:
+                async for raw in ws:
+                    await self._handle_event(account_id, raw)
+            finally:
+                keepalive.cancel()
+                self._connected.discard(account_id)
+
+    async def _account_stream(self, account_id: int):
+        await reconnect_loop(lambda: self._run_account_stream(account_id), lambda: self._running,
+                             f"user-data-stream: account {account_id}", self.backoff_base, self.backoff_max)
+
+    # -- events --------------------------------------------------------------------
+
+    async def _handle_event(self, account_id: int, raw):
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            return
+        if not isinstance(data, dict):
+            return
+        event = data.get("e")
+        self.stream_stats["stream_events"] += 1
+        try:
+            if event == "ACCOUNT_UPDATE":
+                if int(data.get("E") or 0) < self._reconciled_at.get(account_id, 0):
+                    self.stream_stats["stale_account_updates"] += 1
+                    return
+                async with self._lock_for(account_id):
+                    broadcasts = await asyncio.to_thread(self._apply_account_update, account_id, data.get("a") or {})
+                self.stream_stats["account_updates"] += 1
+                for payload in broadcasts:
+                    await ws_manager.broadcast({"type": "position_update", "data": payload})
+            elif event == "ORDER_TRADE_UPDATE":
+                order = data.get("o") or {}
+                if order.get("x") == "TRADE":
+                    # the fill touches the same cursors and ORDER_ rows as the REST history sync
+                    async with self._lock_for(account_id), account_lock(account_id):
+                        await asyncio.to_thread(self._apply_fill, account_id, order)
+            elif event == "ACCOUNT_CONFIG_UPDATE" and data.get("ac"):
+                async with self._lock_for(account_id):
+                    await asyncio.to_thread(self._apply_leverage, account_id, data["ac"])
+            elif event == "listenKeyExpired":
+                raise ConnectionError("listenKey expired")
+        except ConnectionError:
+            raise
+        except Exception:
+            logging.exception("user-data-stream: failed to apply %s for account %s", event, account_id)
+
+    def _apply_account_update(self, account_id: int, update: Dict) -> List[Dict]:
+        by_symbol = {}
+        for p in update.get("P") or []:
+            entry_price = float(p.get("ep") or 0)
+            by_symbol[(p.get("s"), (p.get("ps") or "NET").upper())] = {
+                'net_amt': float(p.get("pa") or 0),
+                'entry_price': entry_price if entry_price > 0 else None,
+                'mark_price': None,
+                'unrealized': float(p.get("up") or 0),
+                'leverage': None,
+            }
+        db = SessionLocal()
+        try:
+            broadcasts = self._reconcile_positions(db, account_id, by_symbol, partial=True) if by_symbol else []
+            balances = self._balances.get(account_id)
+            changes = {b.get("a"): float(b.get("wb") or 0) for b in update.get("B") or []}
+            if balances is not None and changes:
+                delta = sum(wb - balances[a] for a, wb in changes.items() if a in USD_ASSETS and a in balances)
+                balances.update(changes)
+                db_account = db.query(Account).get(account_id)
+                if db_account is not None:
+                    db_account.total_balance = (db_account.total_balance or 0) + delta
+                    unrealized = sum(row[0] or 0 for row in db.query(Position.unrealized_pnl).filter(
+                        Position.account_id == account_id, Position.is_active == True))
+                    db_account.total_equity = db_account.total_balance + unrealized
+            db.commit()
+            return broadcasts
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _apply_fill(self, account_id: int, order: Dict):
+        symbol, trade_id, trade_time = order.get("s"), int(order.get("t") or 0), int(order.get("T") or 0)
+        price, qty = float(order.get("L") or 0), float(order.get("l") or 0)
+        stream = TRADES_STREAM_PREFIX + symbol
+        db = SessionLocal()
+        try:
+            cursor = db.query(SyncCursor).filter(
+                SyncCursor.account_id == account_id, SyncCursor.stream == stream).first()
+            if cursor is not None and cursor.last_id is not None and trade_id <= cursor.last_id:
+                self.stream_stats["duplicate_fills"] += 1
+                return  # already stored by the REST catch-up
+            if cursor is not None and cursor.last_id is None:
+                # placed by a backfill: the REST sync fetches everything from its start and adds
+                # it to the aggregates, so storing the fill here would count it twice
+                return
+            store_history(db, account_id, None, [{
+                'symbol': symbol,
+                'id': trade_id,
+                'orderId': order.get("i"),
+                'side': order.get("S"),
+                'price': price,
+                'qty': qty,
+                'quoteQty': price * qty,
+                'commission': float(order.get("n") or 0),
+                'commissionAsset': order.get("N"),
+                'realizedPnl': float(order.get("rp") or 0),
+                'time': trade_time,
+            }])
+            # symbols without a cursor are still fetched from the lookback by the REST sync,
+            # which replaces their aggregates; only advance existing cursors
+            if cursor is not None:
+                save_cursors(db, account_id, {stream: (trade_time, trade_id)})
+            db.commit()
+            self.stream_stats["fills"] += 1
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _apply_leverage(self, account_id: int, config: Dict):
+        if not config.get("s") or not config.get("l"):
+            return
+        db = SessionLocal()
+        try:
+            db.query(Position).filter(
+                Position.account_id == account_id, Position.symbol == config["s"]
+            ).update({"leverage": float(config["l"])}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def stop(self):
+        super().stop()
+        for task in self._streams.values():
+            if not task.done():
+                task.cancel()
+        self._streams.clear()
+        self._connected.clear()
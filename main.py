@@ -8,6 +8,13 @@ import os
 from app.core.database import init_db
 from app.services.market_data import get_poller_from_env
 from app.services.position_sync import get_position_sync_from_env
+from app.services.history_backfill import get_backfill_from_env
+from app.services.exchange.binance_adapter import close_all_adapters
+from app.services.ticker_writer import get_ticker_writer_from_env
+from app.services.ticker_rollup import get_rollup_from_env
+from app.services.retention import get_retention_from_env
+from app.services.tick_store import get_tick_store_from_env
+from app.services.risk_config_cache import risk_config_cache
 from fastapi import WebSocket, WebSocketDisconnect
 import asyncio
 import json
@@ -59,12 +66,34 @@ async def startup_event():
     # Initialize database
     init_db()
     logging.info("startup: initializing market poller")
+    # write-behind buffer for ticker history (disable with TICKER_WRITE_BEHIND=false)
+    ticker_writer = None
+    if os.getenv("TICKER_WRITE_BEHIND", "true").lower() in ("1", "true", "yes"):
+        ticker_writer = get_ticker_writer_from_env()
+        ticker_writer.start()
+    app.state.ticker_writer = ticker_writer
+    # OHLC rollups (1m/5m/1h/1d) served by /market/ohlc
+    app.state.ticker_rollup = get_rollup_from_env()
+    app.state.ticker_rollup.start()
+    # optional memory-mapped tick store (enable with TICK_STORE_DIR)
+    app.state.tick_store = get_tick_store_from_env()
+    if app.state.tick_store is not None:
+        app.state.tick_store.start()
     # start market-data poller (background task)
-    app.state.market_poller = get_poller_from_env()
+    app.state.market_poller = get_poller_from_env(ticker_writer=ticker_writer, rollup=app.state.ticker_rollup,
+                                                  tick_store=app.state.tick_store)
     app.state.market_poller.start()
     # start position-sync service for real account positions
     app.state.position_sync = get_position_sync_from_env()
     app.state.position_sync.start()
+    # historical backfill jobs; unfinished jobs from a previous run are resumed
+    app.state.history_backfill = get_backfill_from_env()
+    app.state.history_backfill.resume()
+    # periodic reload of cached risk configs (picks up edits made outside the API)
+    risk_config_cache.start()
+    # background retention for ticker_history / account_snapshots
+    app.state.retention = get_retention_from_env()
+    app.state.retention.start()
     # confirm task scheduled
     poller = app.state.market_poller
     logging.info("startup: poller task=%s running=%s", getattr(poller, '_task', None), getattr(poller, '_running', None))
@@ -83,6 +112,25 @@ async def shutdown_event():
     syncer = getattr(app.state, "position_sync", None)
     if syncer:
         syncer.stop()
+    backfill = getattr(app.state, "history_backfill", None)
+    if backfill:
+        backfill.stop()
+    # close the per-account exchange connection pools
+    await close_all_adapters()
+    retention = getattr(app.state, "retention", None)
+    if retention:
+        retention.stop()
+    risk_config_cache.stop()
+    # flush buffered ticker history once producers have stopped
+    writer = getattr(app.state, "ticker_writer", None)
+    if writer:
+        await writer.stop()
+    rollup = getattr(app.state, "ticker_rollup", None)
+    if rollup:
+        await rollup.stop()
+    tick_store = getattr(app.state, "tick_store", None)
+    if tick_store:
+        await tick_store.stop()
     # attempt to close any remaining websocket connections
     mgr = getattr(app.state, "ws_manager", None)
     if mgr:
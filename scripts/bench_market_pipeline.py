@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""Drive the market pipeline (price -> DB -> risk -> WebSocket) offline.
+
+Seeds `--symbols` synthetic symbols (SYN00000USDT, ...) with `--positions`
+positions each under a throwaway account, runs MarketDataService against a
+synthetic or replay price source for `--duration` seconds and prints the
+service stats and throughput. The seeded rows are removed afterwards unless
+--keep is given. The poller updates every active position in the database,
+so point DB_NAME at a scratch database, not production.
+
+Usage: python scripts/bench_market_pipeline.py --symbols 2000 --interval 1 --duration 60
+       python scripts/bench_market_pipeline.py --source replay --speedup 50
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+# Add the project root to the python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+from app.core.database import SessionLocal, init_db
+from app.models.risk_control import Account, Position, RiskLevelEnum, TickerHistory
+from app.services.market_data import MarketDataService
+from app.services.price_source import ReplayPriceSource, SyntheticPriceSource
+from app.services.ticker_writer import TickerHistoryWriter
+
+LEVELS = [RiskLevelEnum.LOW, RiskLevelEnum.MEDIUM, RiskLevelEnum.HIGH, RiskLevelEnum.CRITICAL]
+
+
+def seed(symbols: int, per_symbol: int) -> int:
+    db = SessionLocal()
+    try:
+        account = Account(exchange="bench", api_key="bench", api_secret="bench", name="bench", is_active=False)
+        db.add(account)
+        db.flush()
+        source = SyntheticPriceSource()
+        rows = []
+        for i in range(symbols):
+            symbol = f"SYN{i:05d}USDT"
+            price = source._initial_price(symbol)
+            for j in range(per_symbol):
+                rows.append({
+                    "account_id": account.id, "symbol": symbol, "size": 1.0 if j % 2 == 0 else -1.0,
+                    "entry_price": price, "current_price": price, "leverage": 10,
+                    "risk_level": LEVELS[(i + j) % len(LEVELS)], "is_active": True,
+                })
+        db.bulk_insert_mappings(Position, rows)
+        db.commit()
+        return account.id
+    finally:
+        db.close()
+
+
+def cleanup(account_id: int):
+    db = SessionLocal()
+    try:
+        db.query(TickerHistory).filter(TickerHistory.account_id == account_id).delete(synchronize_session=False)
+        db.query(Position).filter(Position.account_id == account_id).delete(synchronize_session=False)
+        db.query(Account).filter(Account.id == account_id).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+async def run(args, account_id):
+    if args.source == "replay":
+        source = ReplayPriceSource(speedup=args.speedup)
+    else:
+        source = SyntheticPriceSource(seed=args.seed, volatility=args.volatility)
+    writer = TickerHistoryWriter()
+    writer.start()
+    service = MarketDataService(poll_interval=args.interval, ticker_writer=writer, price_source=source)
+    service.start()
+    started = time.monotonic()
+    await asyncio.sleep(args.duration)
+    service.stop()
+    await writer.stop()
+    elapsed = time.monotonic() - started
+
+    stats = service.get_stats()
+    print(f"source={source.name} elapsed={elapsed:.1f}s")
+    for key, value in stats.items():
+        print(f"  {key}: {value}")
+    print(f"  position updates/s: {stats['updates_emitted'] * args.positions / elapsed:.1f}")
+    print(f"  ticker rows written: {writer.stats['rows_written']} dropped: {writer.stats['rows_dropped']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the market-data pipeline")
+    parser.add_argument("--source", choices=["synthetic", "replay"], default="synthetic")
+    parser.add_argument("--symbols", type=int, default=1000)
+    parser.add_argument("--positions", type=int, default=1, help="positions per symbol")
+    parser.add_argument("--interval", type=float, default=1.0, help="poll interval in seconds")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--volatility", type=float, default=0.0005)
+    parser.add_argument("--speedup", type=float, default=10.0, help="replay speed-up")
+    parser.add_argument("--keep", action="store_true", help="keep the seeded account and positions")
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=logging.WARNING)
+    init_db()
+    account_id = seed(args.symbols, args.positions)
+    print(f"seeded account {account_id}: {args.symbols} symbols x {args.positions} positions")
+    try:
+        asyncio.run(run(args, account_id))
+    finally:
+        if not args.keep:
+            cleanup(account_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""Local stand-in for the Binance futures combined-stream endpoint.
+
+Accepts SUBSCRIBE / UNSUBSCRIBE requests and pushes random-walk
+markPriceUpdate events for the subscribed streams. Run it and start the
+backend with:
+
+    MARKET_PRICE_FEED=stream MARKET_STREAM_URL=ws://localhost:8765/stream
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import websockets
+
+
+async def handler(ws, interval: float):
+    subscribed = set()
+    prices = {}
+
+    async def pump():
+        while True:
+            await asyncio.sleep(interval)
+            for stream in list(subscribed):
+                symbol = stream.split('@')[0].upper()
+                price = prices.get(symbol, random.uniform(1, 50000))
+                price *= 1 + random.gauss(0, 0.0005)
+                prices[symbol] = price
+                now = int(time.time() * 1000)
+                await ws.send(json.dumps({
+                    "stream": stream,
+                    "data": {"e": "markPriceUpdate", "E": now, "s": symbol, "p": f"{price:.8f}"},
+                }))
+
+    task = asyncio.create_task(pump())
+    try:
+        async for raw in ws:
+            msg = json.loads(raw)
+            params = set(msg.get("params") or [])
+            if msg.get("method") == "SUBSCRIBE":
+                subscribed |= params
+            elif msg.get("method") == "UNSUBSCRIBE":
+                subscribed -= params
+            print('subscriptions:', sorted(subscribed))
+            await ws.send(json.dumps({"result": None, "id": msg.get("id")}))
+    except websockets.ConnectionClosed:
+        pass
+    finally:
+        task.cancel()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--interval', type=float, default=1.0)
+    args = parser.parse_args()
+    async with websockets.serve(lambda ws: handler(ws, args.interval), args.host, args.port):
+        print(f'fake mark-price stream on ws://{args.host}:{args.port}/stream')
+        await asyncio.Future()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
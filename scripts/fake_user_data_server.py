@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Local stand-in for the Binance futures user-data stream.
+
+Serves the listenKey endpoint (POST/PUT/DELETE /fapi/v1/listenKey) over
+plain HTTP and, on ws://<host>:<port>/ws/<listenKey>, pushes random fills as
+ORDER_TRADE_UPDATE events followed by the matching ACCOUNT_UPDATE. Run it
+and start the backend with:
+
+    POSITION_SYNC_MODE=stream USER_DATA_STREAM_URL=ws://localhost:8766/ws \\
+    USER_DATA_LISTEN_KEY_URL=http://localhost:8767/fapi/v1/listenKey
+"""
+import argparse
+import asyncio
+import json
+import random
+import secrets
+import time
+
+import websockets
+
+
+async def listen_key_handler(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    request_line = (await reader.readline()).decode(errors="replace").strip()
+    # drain headers
+    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+        pass
+    method = request_line.split(" ")[0] if request_line else ""
+    body = json.dumps({"listenKey": secrets.token_hex(16)} if method == "POST" else {}).encode()
+    print('listenKey:', request_line)
+    writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                 b"Content-Length: " + str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body)
+    await writer.drain()
+    writer.close()
+
+
+async def stream_handler(ws, symbols, interval: float):
+    positions = {s: 0.0 for s in symbols}
+    entries = {s: 0.0 for s in symbols}
+    prices = {s: random.uniform(1, 50000) for s in symbols}
+    wallet = 10000.0
+    order_id = random.randint(1, 10 ** 6)
+    trade_id = random.randint(1, 10 ** 6)
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            symbol = random.choice(symbols)
+            prices[symbol] *= 1 + random.gauss(0, 0.001)
+            price = prices[symbol]
+            side = random.choice(("BUY", "SELL"))
+            qty = round(random.uniform(0.001, 1), 3)
+            signed = qty if side == "BUY" else -qty
+            # realize pnl on the part that reduces the position
+            closing = min(abs(positions[symbol]), qty) if positions[symbol] * signed < 0 else 0.0
+            pnl = closing * (price - entries[symbol]) * (1 if positions[symbol] > 0 else -1)
+            new_amt = positions[symbol] + signed
+            if abs(new_amt) > abs(positions[symbol]) and positions[symbol] * new_amt >= 0:
+                entries[symbol] = (entries[symbol] * abs(positions[symbol]) + price * qty) / abs(new_amt)
+            elif positions[symbol] * new_amt < 0:
+                entries[symbol] = price
+            positions[symbol] = new_amt
+            commission = price * qty * 0.0004
+            wallet += pnl - commission
+            order_id += 1
+            trade_id += 1
+            now = int(time.time() * 1000)
+            await ws.send(json.dumps({
+                "e": "ORDER_TRADE_UPDATE", "E": now, "T": now,
+                "o": {
+                    "s": symbol, "S": side, "o": "MARKET", "x": "TRADE", "X": "FILLED",
+                    "i": order_id, "l": f"{qty}", "z": f"{qty}", "L": f"{price:.8f}",
+                    "N": "USDT", "n": f"{commission:.8f}", "T": now, "t": trade_id, "rp": f"{pnl:.8f}",
+                },
+            }))
+            await ws.send(json.dumps({
+                "e": "ACCOUNT_UPDATE", "E": now, "T": now,
+                "a": {
+                    "m": "ORDER",
+                    "B": [{"a": "USDT", "wb": f"{wallet:.8f}", "cw": f"{wallet:.8f}", "bc": "0"}],
+                    "P": [{
+                        "s": symbol, "pa": f"{new_amt:.3f}", "ep": f"{entries[symbol]:.8f}",
+                        "cr": "0", "up": f"{(price - entries[symbol]) * new_amt:.8f}",
+                        "mt": "cross", "iw": "0", "ps": "BOTH",
+                    }],
+                },
+            }))
+    except websockets.ConnectionClosed:
+        pass
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--http-port', type=int, default=8767)
+    parser.add_argument('--interval', type=float, default=2.0)
+    parser.add_argument('--symbols', default='BTCUSDT,ETHUSDT')
+    args = parser.parse_args()
+    symbols = [s.strip().upper() for s in args.symbols.split(',') if s.strip()]
+    http = await asyncio.start_server(listen_key_handler, args.host, args.http_port)
+    async with http, websockets.serve(lambda ws: stream_handler(ws, symbols, args.interval), args.host, args.port):
+        print(f'fake listenKey endpoint on http://{args.host}:{args.http_port}/fapi/v1/listenKey')
+        print(f'fake user-data stream on ws://{args.host}:{args.port}/ws/<listenKey>')
+        await asyncio.Future()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""One-time conversion of ticker_history to daily RANGE partitions.
+
+After conversion RetentionService rotates partitions automatically: it drops
+day partitions older than RETENTION_TICKER_HISTORY_DAYS and pre-creates the
+next RETENTION_PARTITIONS_AHEAD days.
+
+MySQL requires the partition key in every unique key and does not support
+foreign keys on partitioned InnoDB tables, so this script drops the
+ticker_history foreign keys and changes the primary key to (id, timestamp).
+The ALTER rebuilds the table; run it during a maintenance window.
+
+Usage: python scripts/partition_ticker_history.py [--days-ahead 3] [--dry-run]
+"""
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+
+# Add the project root to the python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from app.core.database import engine
+
+TABLE = "ticker_history"
+
+
+def build_statements(conn, days_ahead: int):
+    statements = []
+    fks = conn.execute(text(
+        "SELECT CONSTRAINT_NAME FROM information_schema.TABLE_CONSTRAINTS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t AND CONSTRAINT_TYPE = 'FOREIGN KEY'"
+    ), {"t": TABLE}).scalars().all()
+    for fk in fks:
+        statements.append(f"ALTER TABLE {TABLE} DROP FOREIGN KEY {fk}")
+
+    statements.append(f"ALTER TABLE {TABLE} DROP PRIMARY KEY, ADD PRIMARY KEY (id, timestamp)")
+
+    first = conn.execute(text(f"SELECT MIN(timestamp) FROM {TABLE}")).scalar()
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    day = (first or today).replace(hour=0, minute=0, second=0, microsecond=0)
+    parts = []
+    while day <= today + timedelta(days=days_ahead):
+        parts.append(f"PARTITION p{day:%Y%m%d} VALUES LESS THAN (TO_DAYS('{day + timedelta(days=1):%Y-%m-%d}'))")
+        day += timedelta(days=1)
+    parts.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+    statements.append(
+        f"ALTER TABLE {TABLE} PARTITION BY RANGE (TO_DAYS(timestamp)) (\n    " + ",\n    ".join(parts) + "\n)"
+    )
+    return statements
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days-ahead', type=int, default=3)
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    with engine.connect() as conn:
+        partitioned = conn.execute(text(
+            "SELECT COUNT(*) FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t AND PARTITION_NAME IS NOT NULL"
+        ), {"t": TABLE}).scalar()
+        if partitioned:
+            print(f"{TABLE} is already partitioned ({partitioned} partitions).")
+            return
+
+        for stmt in build_statements(conn, args.days_ahead):
+            print(stmt + ";")
+            if not args.dry_run:
+                conn.execute(text(stmt))
+        if not args.dry_run:
+            conn.commit()
+            print("Partitioning complete.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""One-time rebuild of ticker_bars from ticker_history.
+
+The rollup service only aggregates ticks seen since it was enabled. This
+script folds the older ticker_history rows into bars with the rollup's own
+upsert, so the history can be purged without charts losing their data.
+
+Only buckets that end before the cutoff are rebuilt (per resolution), so the
+bars the rollup service already maintains are never touched. The cutoff
+defaults to the start of the oldest 1m bar; ticker_history holds one row per
+position, and rows repeating a symbol's timestamp count as one tick.
+
+Rows are read in id order (the order they were written). Bars below the
+cutoff are deleted first, so an interrupted run can be repeated: pass the
+cutoff it printed with --before.
+
+Usage: python scripts/rebuild_ticker_bars.py [--before 2024-01-01T00:00:00] [--chunk-size 50000]
+"""
+import argparse
+import os
+import sys
+from datetime import datetime
+
+# Add the project root to the python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete, func, select
+from app.core.database import engine
+from app.models.risk_control import TickerBar, TickerHistory
+from app.services.ticker_rollup import RESOLUTIONS, TickerRollup, bucket_start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--before', type=datetime.fromisoformat, default=None,
+                        help="rebuild buckets ending before this UTC time (default: oldest 1m bar)")
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    args = parser.parse_args()
+
+    cutoff = args.before
+    if cutoff is None:
+        with engine.connect() as conn:
+            cutoff = conn.execute(
+                select(func.min(TickerBar.bucket_start)).where(TickerBar.resolution == "1m")
+            ).scalar() or datetime.utcnow()
+    # per resolution: first bucket left to the rollup service
+    limits = {r: bucket_start(cutoff, r) for r in RESOLUTIONS}
+    print(f"Rebuilding ticker_bars before {cutoff.isoformat()} (rerun with --before {cutoff.isoformat()})")
+
+    with engine.begin() as conn:
+        for resolution, limit in limits.items():
+            deleted = conn.execute(delete(TickerBar.__table__).where(
+                TickerBar.resolution == resolution, TickerBar.bucket_start < limit
+            )).rowcount
+            if deleted:
+                print(f"Removed {deleted} {resolution} bars left by a previous run.")
+
+    rollup = TickerRollup()
+    last_id = 0
+    last_ts = {}
+    rows = 0
+    while True:
+        with engine.connect() as conn:
+            chunk = conn.execute(
+                select(TickerHistory.id, TickerHistory.symbol, TickerHistory.price, TickerHistory.timestamp)
+                .where(TickerHistory.id > last_id, TickerHistory.timestamp < limits["1m"])
+                .order_by(TickerHistory.id).limit(args.chunk_size)
+            ).all()
+        if not chunk:
+            break
+        for row_id, symbol, price, ts in chunk:
+            last_id = row_id
+            if last_ts.get(symbol) == ts:
+                continue
+            last_ts[symbol] = ts
+            rollup.add_tick(symbol, price, ts, [r for r, limit in limits.items() if bucket_start(ts, r) < limit])
+        rows += len(chunk)
+        # written per chunk with the rollup's upsert; later chunks merge into the same bars
+        deltas, rollup._deltas = rollup._deltas, {}
+        if deltas:
+            rollup._upsert_sync(rollup._rows(deltas))
+        print(f"{rows} rows read, {rollup.stats['ticks']} ticks folded (up to id {last_id})")
+
+    print("Rebuild complete.")
+
+
+if __name__ == "__main__":
+    main()